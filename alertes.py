@@ -0,0 +1,107 @@
+# Alertes de stock faible : seuil par produit, alertes ouvertes tenues à jour par les écritures de stock
+from datetime import datetime
+
+from cache import cached, invalidate
+from utils.colonnes import requete
+
+SEUIL_DEFAUT = 10       # valeur par défaut de produit.seuil_alerte (migration 7)
+TABLES = ("alerte_stock",)
+_PAQUET = 1_000
+
+
+def _paquets(seq):
+    for i in range(0, len(seq), _PAQUET):
+        yield seq[i:i + _PAQUET]
+
+
+def mettre_a_jour(conn, quantites):
+    """À appeler dans la transaction qui modifie le stock.
+
+    `quantites` : {id_produit: nouvelle quantité}. Ouvre l'alerte d'un produit
+    qui passe à son seuil ou en dessous, ferme celle d'un produit qui repasse
+    au-dessus, et met à jour la quantité des alertes restées ouvertes. Seuls
+    les produits touchés sont lus : le coût ne dépend pas de la taille du
+    catalogue.
+    """
+    if not quantites:
+        return
+    cur = conn.cursor()
+    maintenant = datetime.now()
+    ouvrir, fermer = [], []
+    for part in _paquets(list(quantites)):
+        cur.execute(f"""
+            SELECT p.id_produit, p.seuil_alerte, a.id_produit IS NOT NULL
+            FROM produit p LEFT JOIN alerte_stock a ON a.id_produit = p.id_produit
+            WHERE p.id_produit IN ({", ".join(["%s"] * len(part))})
+        """, part)
+        for pid, seuil, ouverte in cur.fetchall():
+            if quantites[pid] <= seuil:
+                ouvrir.append((pid, quantites[pid], seuil, maintenant))
+            elif ouverte:
+                fermer.append(pid)
+    for part in _paquets(ouvrir):
+        # une alerte déjà ouverte garde sa date d'ouverture
+        cur.executemany("""
+            INSERT INTO alerte_stock (id_produit, quantite, seuil, depuis) VALUES (%s,%s,%s,%s)
+            ON DUPLICATE KEY UPDATE quantite = VALUES(quantite), seuil = VALUES(seuil)
+        """, part)
+    for part in _paquets(fermer):
+        cur.execute(f"DELETE FROM alerte_stock WHERE id_produit IN ({', '.join(['%s'] * len(part))})", part)
+    if ouvrir or fermer:
+        invalidate(conn, *TABLES)
+
+
+def recalculer(conn, ids):
+    """Réévalue les alertes de produits dont le seuil vient de changer (ou créés)."""
+    cur = conn.cursor()
+    quantites = {}
+    for part in _paquets(list(ids)):
+        cur.execute(f"""
+            SELECT p.id_produit, COALESCE(s.quantite, 0)
+            FROM produit p LEFT JOIN stock s ON s.id_produit = p.id_produit
+            WHERE p.id_produit IN ({", ".join(["%s"] * len(part))})
+        """, part)
+        quantites.update(cur.fetchall())
+    mettre_a_jour(conn, quantites)
+
+
+def definir_seuils(conn, seuils):
+    """`seuils` : {id_produit: seuil >= 0} ; alertes réévaluées dans la même transaction."""
+    if not seuils:
+        return
+    cur = conn.cursor()
+    for part in _paquets(list(seuils.items())):
+        cas = " ".join(["WHEN %s THEN %s"] * len(part))
+        cur.execute(f"""
+            UPDATE produit SET seuil_alerte = CASE id_produit {cas} END
+            WHERE id_produit IN ({", ".join(["%s"] * len(part))})
+        """, [v for item in part for v in item] + [pid for pid, _ in part])
+    invalidate(conn, "produit")
+    recalculer(conn, seuils)
+
+
+def reconstruire(conn):
+    """Recalcule toute la table depuis le stock (reprise, chargement en masse)."""
+    cur = conn.cursor()
+    cur.execute("DELETE FROM alerte_stock")
+    cur.execute("""
+        INSERT INTO alerte_stock (id_produit, quantite, seuil, depuis)
+        SELECT p.id_produit, COALESCE(s.quantite, 0), p.seuil_alerte, NOW()
+        FROM produit p LEFT JOIN stock s ON s.id_produit = p.id_produit
+        WHERE COALESCE(s.quantite, 0) <= p.seuil_alerte
+    """)
+    invalidate(conn, *TABLES)
+
+
+# -----------------------------------------------------
+# 🔔 Lecture : proportionnelle au nombre d'alertes ouvertes
+# -----------------------------------------------------
+@cached("alerte_stock", "produit")
+def ouvertes(limit=None):
+    """Alertes ouvertes, les plus en dessous de leur seuil d'abord."""
+    return requete(f"""
+        SELECT a.id_produit, p.code_produit, p.nom_produit, p.forme, p.dosage, a.quantite, a.seuil, a.depuis
+        FROM alerte_stock a JOIN produit p ON p.id_produit = a.id_produit
+        ORDER BY a.quantite - a.seuil, p.nom_produit
+        {"LIMIT %s" if limit else ""}
+    """, (limit,) if limit else ())
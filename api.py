@@ -0,0 +1,463 @@
+# API HTTP JSON (facturation, scanners des dépôts) : même couche de données que l'interface, sans Streamlit
+#
+#   API_CLES="facturation:lecture:<jeton>,scanners:ecriture:<jeton>" python api.py
+#   curl -H "Authorization: Bearer <jeton>" "http://localhost:8502/api/stock?limite=500"
+#
+# GET  /api/produits     ?apres=<id>&limite=&codes=A,B&q=<recherche>
+# GET  /api/stock        ?apres=<id>&limite=&codes=A,B
+# GET  /api/mouvements   ?apres=<id_mvt>&limite=&depuis=AAAA-MM-JJ&produit=<code>
+# GET  /api/commandes    ?apres=<id_commande>&limite=&depuis=&jusqua=&statut=
+# POST /api/mouvements   {"mouvements": [{"code_produit", "type_mvt", "quantite", ...}]}
+# POST /api/commandes    {"commandes": [{"id_client", "statut", "lignes": [{"code_produit", "quantite"}]}]}
+#
+# Pagination par clé : chaque réponse donne « suivant », l'URL de la page
+# suivante (null à la fin). Chaque GET porte un ETag formé de la requête et des
+# versions des tables lues (cache.versions) : un client qui renvoie If-None-Match
+# reçoit 304 sans requête SQL tant que ces tables n'ont pas changé.
+import gzip
+import hashlib
+import hmac
+import json
+import logging
+import os
+import sys
+from datetime import date, datetime
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlencode, urlsplit
+
+import mysql.connector
+import pandas as pd
+
+import lots
+import migrations
+import profiling
+import recherche
+from cache import versions
+from database import PoolTimeout, connection, transaction, versions_requises
+from inventory import MouvementError, appliquer_mouvements, preparer_import
+from orders import STATUTS, StockInsuffisant, enregistrer_commande
+from sequences import codes_commande
+
+HOTE = os.getenv("API_HOTE", "127.0.0.1")
+PORT = int(os.getenv("API_PORT", "8502"))
+LIMITE = 100                                            # lignes par page par défaut
+LIMITE_MAX = int(os.getenv("API_LIMITE_MAX", "1000"))   # lignes par page, codes par requête
+LOT_MAX = int(os.getenv("API_LOT_MAX", "5000"))         # éléments par POST
+CORPS_MAX = 10 * 1024 * 1024
+GZIP_MIN = 1024                                         # octets : en dessous, pas de compression
+
+_log = logging.getLogger("cadmeko.api")
+
+
+class ErreurApi(Exception):
+    def __init__(self, statut, message, details=None):
+        self.statut, self.message, self.details = statut, message, details
+        super().__init__(message)
+
+
+def _cles():
+    """API_CLES : « nom:droit:jeton » séparés par des virgules ; droit = lecture | ecriture."""
+    cles = []
+    for entree in filter(None, (e.strip() for e in os.getenv("API_CLES", "").split(","))):
+        nom, droit, jeton = entree.split(":", 2)
+        if droit not in ("lecture", "ecriture"):
+            raise ValueError(f"API_CLES : droit inconnu « {droit} » pour {nom}")
+        cles.append((jeton.encode(), nom, droit))
+    return cles
+
+
+CLES = _cles()
+
+
+# -----------------------------------------------------
+# 🔧 Paramètres de requête
+# -----------------------------------------------------
+def _entier(params, nom, defaut=None, mini=0, maxi=None):
+    if nom not in params:
+        return defaut
+    try:
+        valeur = int(params[nom])
+    except ValueError:
+        raise ErreurApi(400, f"« {nom} » : entier attendu")
+    if valeur < mini or (maxi is not None and valeur > maxi):
+        raise ErreurApi(400, f"« {nom} » : valeur entre {mini} et {maxi} attendue")
+    return valeur
+
+
+def _date(params, nom):
+    if nom not in params:
+        return None
+    try:
+        return date.fromisoformat(params[nom])
+    except ValueError:
+        raise ErreurApi(400, f"« {nom} » : date AAAA-MM-JJ attendue")
+
+
+def _horodatage(valeur):
+    """Date ISO 8601 d'un corps JSON, en heure locale naïve comme les dates en base.
+
+    Un fuseau (« Z », « +01:00 ») est converti vers l'heure locale du serveur.
+    None si la valeur n'est pas une date ISO.
+    """
+    if not isinstance(valeur, str):
+        return None
+    try:
+        lue = pd.to_datetime(valeur, format="ISO8601")
+    except ValueError:
+        return None
+    if pd.isna(lue):
+        return None
+    if lue.tzinfo is not None:
+        lue = pd.Timestamp(lue.to_pydatetime().astimezone().replace(tzinfo=None))
+    return lue
+
+
+def _codes(params):
+    if "codes" not in params:
+        return None
+    codes = [c.strip() for c in params["codes"].split(",") if c.strip()]
+    if not codes or len(codes) > LIMITE_MAX:
+        raise ErreurApi(400, f"« codes » : de 1 à {LIMITE_MAX} codes attendus")
+    return codes
+
+
+def _page(cur, sql, conditions, args, params, cle):
+    """Page suivant `apres` (clé `cle`) : LIMIT n+1 pour savoir s'il en reste."""
+    limite = _entier(params, "limite", LIMITE, 1, LIMITE_MAX)
+    conditions = [f"{cle} > %s", *conditions]
+    cur.execute(f"{sql} WHERE {' AND '.join(conditions)} ORDER BY {cle} LIMIT %s",
+                [_entier(params, "apres", 0), *args, limite + 1])
+    lignes = cur.fetchall()
+    return lignes[:limite], len(lignes) > limite
+
+
+def _marques(valeurs):
+    return ", ".join(["%s"] * len(valeurs))
+
+
+# -----------------------------------------------------
+# 📖 Lecture
+# -----------------------------------------------------
+def get_produits(cur, params):
+    if "q" in params:
+        # recherche à la frappe (index en mémoire) : les plus pertinents, sans pagination
+        return recherche.rechercher(params["q"], _entier(params, "limite", LIMITE, 1, LIMITE_MAX)), False
+    conditions, args = [], []
+    codes = _codes(params)
+    if codes:
+        conditions.append(f"code_produit IN ({_marques(codes)})")
+        args += codes
+    return _page(cur, """
+        SELECT id_produit, code_produit, nom_produit, forme, dosage, date_peremption, prix_unitaire,
+               seuil_alerte, maj
+        FROM produit""", conditions, args, params, "id_produit")
+
+
+def get_stock(cur, params):
+    conditions, args = [], []
+    codes = _codes(params)
+    if codes:
+        conditions.append(f"p.code_produit IN ({_marques(codes)})")
+        args += codes
+    return _page(cur, """
+        SELECT p.id_produit, p.code_produit, p.nom_produit, COALESCE(s.quantite, 0) AS quantite,
+               p.seuil_alerte, s.maj
+        FROM produit p LEFT JOIN stock s ON s.id_produit = p.id_produit""",
+                 conditions, args, params, "p.id_produit")
+
+
+def get_mouvements(cur, params):
+    conditions, args = [], []
+    depuis = _date(params, "depuis")
+    if depuis:
+        conditions.append("m.date_mvt >= %s")
+        args.append(depuis)
+    if "produit" in params:
+        conditions.append("p.code_produit = %s")
+        args.append(params["produit"])
+    return _page(cur, """
+        SELECT m.id_mvt, p.code_produit, m.date_mvt, m.type_mvt, m.quantite, m.description, l.numero_lot
+        FROM mouvement_stock m
+        JOIN produit p ON p.id_produit = m.id_produit
+        LEFT JOIN lot l ON l.id_lot = m.id_lot""", conditions, args, params, "m.id_mvt")
+
+
+def get_commandes(cur, params):
+    conditions, args = [], []
+    for nom, op in (("depuis", ">="), ("jusqua", "<=")):
+        jour = _date(params, nom)
+        if jour:
+            conditions.append(f"c.date_commande {op} %s")
+            args.append(jour)
+    if "statut" in params:
+        conditions.append("c.statut = %s")
+        args.append(params["statut"])
+    commandes, reste = _page(cur, """
+        SELECT c.id_commande, c.code_commande, c.date_commande, c.statut, c.id_client, cl.nom_client
+        FROM commande c JOIN client cl ON cl.id_client = c.id_client""", conditions, args, params, "c.id_commande")
+    if commandes:
+        # lignes de toute la page en une requête
+        par_id = {c["id_commande"]: {**c, "lignes": []} for c in commandes}
+        cur.execute(f"""
+            SELECT d.id_commande, p.code_produit, d.quantite_dmd, d.quantite_livr
+            FROM commande_detail d JOIN produit p ON p.id_produit = d.id_produit
+            WHERE d.id_commande IN ({_marques(par_id)})
+            ORDER BY d.id_detail
+        """, list(par_id))
+        for ligne in cur.fetchall():
+            par_id[ligne.pop("id_commande")]["lignes"].append(ligne)
+        commandes = list(par_id.values())
+    return commandes, reste
+
+
+# -----------------------------------------------------
+# ✍️ Écriture par lots (une transaction par requête)
+# -----------------------------------------------------
+def _liste(corps, nom):
+    elements = corps.get(nom) if isinstance(corps, dict) else None
+    if not isinstance(elements, list) or not elements or not all(isinstance(e, dict) for e in elements):
+        raise ErreurApi(400, f"« {nom} » : liste d'objets non vide attendue")
+    if len(elements) > LOT_MAX:
+        raise ErreurApi(413, f"{LOT_MAX} {nom} au plus par requête")
+    return elements
+
+
+def post_mouvements(corps):
+    df = pd.DataFrame(_liste(corps, "mouvements"))
+    erreurs = []
+    # dates ISO lues ici : preparer_import lit les fichiers au format jour/mois
+    for col in ("date_mvt", "date_peremption"):
+        if col in df:
+            lues = df[col].map(_horodatage)
+            erreurs += [{"index": int(i), "message": f"{col} : date ISO attendue"}
+                        for i in df.index[df[col].notna() & lues.isna()]]
+            df[col] = pd.to_datetime(lues)
+    if erreurs:
+        raise ErreurApi(422, "Mouvements refusés", erreurs)
+    try:
+        with transaction() as conn:
+            mouvements, refus = preparer_import(conn, df)
+            if refus:
+                raise MouvementError(refus)
+            n = appliquer_mouvements(conn, mouvements)
+    except MouvementError as e:
+        # n° de ligne de fichier (en-tête = 1) → rang dans la liste envoyée
+        raise ErreurApi(422, "Mouvements refusés", [{"index": ligne - 2 if ligne else None, "message": msg}
+                                                         for ligne, msg in e.erreurs])
+    return {"enregistres": n}
+
+
+def post_commandes(corps):
+    commandes = _liste(corps, "commandes")
+    erreurs = []
+    for i, c in enumerate(commandes):
+        lignes = c.get("lignes")
+        if not isinstance(c.get("id_client"), int) or isinstance(c["id_client"], bool):
+            erreurs.append({"index": i, "message": "id_client : entier attendu"})
+        if c.get("statut", "En attente") not in STATUTS:
+            erreurs.append({"index": i, "message": f"statut : {', '.join(STATUTS)}"})
+        if (not isinstance(lignes, list) or not lignes
+                or not all(isinstance(l, dict) and isinstance(l.get("quantite"), int)
+                           and not isinstance(l["quantite"], bool) and l["quantite"] > 0
+                           and isinstance(l.get("code_produit"), str) for l in lignes)):
+            erreurs.append({"index": i, "message": "lignes : [{code_produit, quantite > 0}] attendu"})
+    if erreurs:
+        raise ErreurApi(422, "Commandes refusées", erreurs)
+
+    codes = sorted({l["code_produit"] for c in commandes for l in c["lignes"]})
+    clients = sorted({c["id_client"] for c in commandes})
+    # codes réservés d'un bloc avant la transaction : une seule connexion du pool à la fois
+    reserves = codes_commande(len(commandes))
+    try:
+        with transaction() as conn:
+            cur = conn.cursor()
+            cur.execute(f"SELECT code_produit, id_produit FROM produit WHERE code_produit IN ({_marques(codes)})",
+                        codes)
+            ids = dict(cur.fetchall())
+            cur.execute(f"SELECT id_client FROM client WHERE id_client IN ({_marques(clients)})", clients)
+            connus = {i for (i,) in cur.fetchall()}
+            for i, c in enumerate(commandes):
+                if c["id_client"] not in connus:
+                    erreurs.append({"index": i, "message": f"Client {c['id_client']} inconnu"})
+                erreurs += [{"index": i, "message": f"Produit {l['code_produit']} inconnu"}
+                            for l in c["lignes"] if l["code_produit"] not in ids]
+            if erreurs:
+                raise ErreurApi(422, "Commandes refusées", erreurs)
+            creees = []
+            for i, c in enumerate(commandes):
+                try:
+                    id_commande, code = enregistrer_commande(
+                        conn, c["id_client"], [(ids[l["code_produit"]], l["quantite"]) for l in c["lignes"]],
+                        c.get("statut", "En attente"), reserves[i])
+                except StockInsuffisant as e:
+                    codes_par_id = {v: k for k, v in ids.items()}
+                    raise ErreurApi(409, "Stock insuffisant : aucune commande enregistrée", [
+                        {"index": i, "code_produit": codes_par_id[pid], "demande": dmd, "disponible": dispo}
+                        for pid, (dmd, dispo) in e.manquants.items()])
+                creees.append({"id_commande": id_commande, "code_commande": code})
+    except mysql.connector.IntegrityError as e:
+        raise ErreurApi(409, f"Conflit d'écriture : {e.msg}")
+    return {"commandes": creees}
+
+
+# nom -> (fonction, tables lues) pour GET, fonction pour POST
+LECTURES = {
+    "/api/produits": (get_produits, ("produit",)),
+    "/api/stock": (get_stock, ("produit", "stock")),
+    "/api/mouvements": (get_mouvements, ("produit", "mouvement_stock", *lots.TABLES)),
+    "/api/commandes": (get_commandes, ("commande", "commande_detail", "client", "produit")),
+}
+ECRITURES = {
+    "/api/mouvements": post_mouvements,
+    "/api/commandes": post_commandes,
+}
+
+
+# -----------------------------------------------------
+# 🌐 Serveur
+# -----------------------------------------------------
+def _json(valeur):
+    if isinstance(valeur, (date, datetime)):
+        return valeur.isoformat()
+    if isinstance(valeur, Decimal):
+        return float(valeur)
+    raise TypeError(f"{type(valeur).__name__} non sérialisable")
+
+
+def etag(chemin, params, tables):
+    """Requête + versions des tables lues : change dès qu'une écriture touche ces tables."""
+    brut = json.dumps([chemin, sorted(params.items()), list(zip(tables, versions(tables)))])
+    return f'"{hashlib.sha1(brut.encode()).hexdigest()}"'
+
+
+class Gestionnaire(BaseHTTPRequestHandler):
+    server_version = "cadmeko-api/1"
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self._traiter("GET")
+
+    def do_POST(self):
+        self._traiter("POST")
+
+    def log_message(self, format, *args):
+        _log.info("%s %s", self.address_string(), format % args)
+
+    def _authentifier(self, droit):
+        entete = self.headers.get("Authorization", "")
+        jeton = entete[7:].strip().encode() if entete.startswith("Bearer ") else b""
+        trouve = None
+        for cle, nom, droit_cle in CLES:            # toutes comparées : durée indépendante du jeton
+            if hmac.compare_digest(cle, jeton):
+                trouve = (nom, droit_cle)
+        if trouve is None:
+            raise ErreurApi(401, "Jeton absent ou invalide")
+        if droit == "ecriture" and trouve[1] != "ecriture":
+            raise ErreurApi(403, f"Clé « {trouve[0]} » en lecture seule")
+        return trouve[0]
+
+    def _corps(self):
+        if "Transfer-Encoding" in self.headers:
+            raise ErreurApi(411, "Content-Length requis")
+        try:
+            taille = int(self.headers.get("Content-Length") or 0)
+        except ValueError:
+            taille = -1
+        if taille < 0:
+            raise ErreurApi(400, "Content-Length invalide")
+        if taille > CORPS_MAX:
+            raise ErreurApi(413, f"Corps limité à {CORPS_MAX // (1024 * 1024)} Mo")
+        brut = self.rfile.read(taille)
+        self._corps_lu = True
+        try:
+            return json.loads(brut or b"null")
+        except ValueError:
+            raise ErreurApi(400, "Corps JSON invalide")
+
+    def _envoyer(self, statut, donnees=None, entetes=None):
+        corps = b"" if donnees is None else json.dumps(donnees, ensure_ascii=False, default=_json).encode()
+        entetes = dict(entetes or {})
+        if donnees is not None:
+            entetes["Content-Type"] = "application/json; charset=utf-8"
+            if len(corps) >= GZIP_MIN and "gzip" in self.headers.get("Accept-Encoding", ""):
+                corps = gzip.compress(corps, compresslevel=5)
+                entetes["Content-Encoding"] = "gzip"
+        entetes["Content-Length"] = str(len(corps))
+        if not self._corps_lu and ("Transfer-Encoding" in self.headers
+                                   or self.headers.get("Content-Length", "0").strip() not in ("", "0")):
+            # corps non lu (refus avant lecture) : il serait pris pour la requête suivante
+            self.close_connection = True
+            entetes["Connection"] = "close"
+        self.send_response(statut)
+        for nom, valeur in entetes.items():
+            self.send_header(nom, valeur)
+        self.end_headers()
+        if corps:
+            self.wfile.write(corps)
+
+    def _traiter(self, methode):
+        url = urlsplit(self.path)
+        chemin = url.path.rstrip("/")
+        self._corps_lu = False
+        profiling.debut_page(f"api {methode} {chemin}")
+        try:
+            if methode == "POST" and chemin in ECRITURES:
+                self._authentifier("ecriture")
+                corps = self._corps()
+                profiling.etape("écriture")
+                self._envoyer(201, ECRITURES[chemin](corps))
+            elif methode == "GET" and chemin in LECTURES:
+                self._authentifier("lecture")
+                fonction, tables = LECTURES[chemin]
+                params = {k: v[-1] for k, v in parse_qs(url.query).items()}
+                tag = etag(chemin, params, tables)
+                entetes = {"ETag": tag, "Cache-Control": "private, no-cache"}
+                demandes = {t.strip().removeprefix("W/") for t in self.headers.get("If-None-Match", "").split(",")}
+                if tag in demandes or "*" in demandes:
+                    self._envoyer(304, entetes=entetes)
+                    return
+                profiling.etape("lecture")
+                # réplique éventuelle au moins à jour des versions de l'ETag
+                with versions_requises(dict(zip(tables, versions(tables)))), connection(replica=True) as conn:
+                    donnees, reste = fonction(conn.cursor(dictionary=True), params)
+                profiling.rendu(donnees)
+                suivant = None
+                if reste:
+                    cle = next(iter(donnees[-1].values()))          # 1re colonne : clé de pagination
+                    suivant = f"{chemin}?{urlencode({**params, 'apres': cle})}"
+                self._envoyer(200, {"donnees": donnees, "suivant": suivant}, entetes)
+            elif chemin in LECTURES or chemin in ECRITURES:
+                raise ErreurApi(405, f"Méthode {methode} non prise en charge")
+            else:
+                raise ErreurApi(404, "Ressource inconnue")
+        except ErreurApi as e:
+            self._envoyer(e.statut, {"erreur": e.message, "details": e.details})
+        except PoolTimeout:
+            self._envoyer(503, {"erreur": "Base de données saturée, réessayer plus tard"}, {"Retry-After": "5"})
+        except Exception:
+            _log.exception("Erreur sur %s %s", methode, self.path)
+            self._envoyer(500, {"erreur": "Erreur interne"})
+        finally:
+            profiling.fin_page()
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(message)s")
+    if not CLES:
+        print("API_CLES est vide : aucune clé, l'API refuserait toutes les requêtes.", file=sys.stderr)
+        return 1
+    migrations.ensure_schema()
+    serveur = ThreadingHTTPServer((HOTE, PORT), Gestionnaire)
+    _log.info("API sur http://%s:%s (%d clé(s))", HOTE, PORT, len(CLES))
+    try:
+        serveur.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        serveur.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
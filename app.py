@@ -1,13 +1,18 @@
 import streamlit as st
-import pathlib
+import profiling
+from utils import inject_styles
 from security import login_user
-from database import get_connection
+from counters import get_counters, dernieres_commandes
+import alertes
+from lots import ALERTE_JOURS
 
 # Config Streamlit
 st.set_page_config(page_title="CADMEKO - Gestion", layout="wide")
-st.markdown(f"<style>{pathlib.Path('assets/styles.css').read_text()}</style>", unsafe_allow_html=True)
+profiling.debut_page("Accueil")
+inject_styles()
 
 # Authentification
+profiling.etape("authentification")
 login_user()
 
 # Vérifie la session après connexion
@@ -24,15 +29,10 @@ if "user" in st.session_state:
     st.markdown("---")
     st.subheader("🔎 Aperçu rapide du système")
 
-    # Récupérer des compteurs
-    conn = get_connection()
-    cur = conn.cursor()
-    cur.execute("SELECT COUNT(*) FROM produit");      produits = cur.fetchone()[0]
-    cur.execute("SELECT COUNT(*) FROM stock");        stock   = cur.fetchone()[0]
-    cur.execute("SELECT COUNT(*) FROM client");       clients = cur.fetchone()[0]
-    cur.execute("SELECT COUNT(*) FROM fournisseur");  fournisseurs = cur.fetchone()[0]
-    cur.execute("SELECT COUNT(*) FROM commande");     commandes = cur.fetchone()[0]
-    conn.close()
+    profiling.etape("compteurs")
+    # Récupérer des compteurs (chacun en cache jusqu'à la prochaine écriture sur ses tables)
+    kpi = get_counters()
+    produits, stock, clients, commandes = kpi["produits"], kpi["stock"], kpi["clients"], kpi["commandes"]
 
     # Section 1 : Résumés (grilles horizontales)
     col1, col2, col3, col4 = st.columns(4)
@@ -45,24 +45,39 @@ if "user" in st.session_state:
     with col4:
         st.markdown("<div class='card orange'><h3>🚚 Commandes</h3><p>{}</p></div>".format(commandes), unsafe_allow_html=True)
 
+    col5, col6, col7, col8 = st.columns(4)
+    with col5:
+        valeur = f"{kpi['valeur_stock']:,.0f} CDF".replace(",", " ")
+        st.markdown("<div class='card green'><h3>💰 Valeur du stock</h3><p>{}</p></div>".format(valeur), unsafe_allow_html=True)
+    with col6:
+        st.markdown("<div class='card orange'><h3>📅 Commandes du jour</h3><p>{}</p></div>".format(kpi["commandes_jour"]), unsafe_allow_html=True)
+    with col7:
+        st.markdown("<div class='card green'><h3>⏳ Lots à périmer ({} j)</h3><p>{}</p></div>".format(ALERTE_JOURS, kpi["lots_a_perimer"]), unsafe_allow_html=True)
+    with col8:
+        st.markdown("<div class='card orange'><h3>🔔 Alertes de stock</h3><p>{}</p></div>".format(kpi["alertes_stock"]), unsafe_allow_html=True)
+
     st.markdown("---")
 
     # Section 2 : Lien rapide ou tableau miniature
     st.subheader("📋 Dernières commandes")
-    conn = get_connection()
-    cur = conn.cursor(dictionary=True)
-    cur.execute("""
-        SELECT code_commande, DATE_FORMAT(date_commande, '%%d/%%m/%%Y') AS date, statut
-        FROM commande
-        ORDER BY date_commande DESC
-        LIMIT 5
-    """)
-    rows = cur.fetchall()
-    conn.close()
+    profiling.etape("dernières commandes")
+    rows = [{"code_commande": r["code_commande"], "date": f"{r['date_commande']:%d/%m/%Y}", "statut": r["statut"]}
+            for r in dernieres_commandes(5)]
 
     if rows:
+        profiling.rendu(rows)
         st.table(rows)
     else:
         st.info("Aucune commande enregistrée.")
+
+    if kpi["alertes_stock"]:
+        st.subheader("🔔 À réapprovisionner en priorité")
+        profiling.etape("alertes")
+        critiques = [{"code": r.code_produit, "produit": r.nom_produit, "quantité": r.quantite, "seuil": r.seuil}
+                     for r in alertes.ouvertes(5).itertuples()]
+        profiling.rendu(critiques)
+        st.table(critiques)
 else:
     st.info("🔐 Veuillez vous connecter pour accéder à l’application.")
+
+profiling.fin_page()
@@ -0,0 +1,275 @@
+# Archivage des périodes closes : mouvements et commandes anciens → Parquet compressé, un fichier par mois
+#
+#   python archive.py                 → archive les mois antérieurs aux ARCHIVE_MOIS derniers
+#   python archive.py --mois 24       → garde 24 mois en base
+#   python archive.py --simulation    → liste les mois concernés sans rien modifier
+#
+# Un mois archivé quitte la base : son fichier est enregistré dans archive_periode
+# dans la transaction qui supprime ses lignes, et les lectures (stock à une date,
+# évolution d'un produit, export des commandes) ajoutent les fichiers des mois
+# qui recoupent la période demandée. Les agrégats journaliers (rollups.py) restent
+# en base : totaux et graphiques des rapports n'ont pas besoin des archives.
+import argparse
+import json
+import os
+import sys
+import time
+from dataclasses import dataclass
+from datetime import date, datetime
+
+import pandas as pd
+
+import migrations
+from cache import cached, invalidate
+from database import connection, transaction
+
+DOSSIER = os.getenv("ARCHIVE_DIR", "archives")
+MOIS_CONSERVES = int(os.getenv("ARCHIVE_MOIS", "18"))       # mois gardés en base (période ouverte)
+COMPRESSION = "zstd"
+
+
+@dataclass
+class Source:
+    nom: str
+    colonne_date: str
+    identifiant: str        # clé croissante : borne des suppressions, dédoublonnage
+    select: str             # paramètres : début, fin (exclue), identifiant max
+    suppressions: list      # DELETE exécutés dans l'ordre, mêmes paramètres
+    schema: list            # [(colonne, type pyarrow)] dans l'ordre du SELECT
+    tables: tuple           # tables invalidées
+
+
+SOURCES = {
+    "mouvement_stock": Source(
+        "mouvement_stock", "date_mvt", "id_mvt",
+        """SELECT id_mvt, id_produit, date_mvt, type_mvt, quantite, description, id_lot
+           FROM mouvement_stock
+           WHERE date_mvt >= %s AND date_mvt < %s AND id_mvt <= %s
+           ORDER BY id_mvt FOR UPDATE""",
+        ["DELETE FROM mouvement_stock WHERE date_mvt >= %s AND date_mvt < %s AND id_mvt <= %s"],
+        [("id_mvt", "int64"), ("id_produit", "int64"), ("date_mvt", "timestamp[s]"), ("type_mvt", "string"),
+         ("quantite", "int64"), ("description", "string"), ("id_lot", "int64")],
+        ("mouvement_stock",),
+    ),
+    # une ligne par ligne de commande, en-tête répété (commande sans ligne : détail vide)
+    "commande": Source(
+        "commande", "date_commande", "id_commande",
+        """SELECT c.id_commande, c.code_commande, c.date_commande, c.statut, c.id_client, c.origine,
+                  c.id_origine, d.id_detail, d.id_produit, d.quantite_dmd, d.quantite_livr
+           FROM commande c LEFT JOIN commande_detail d ON d.id_commande = c.id_commande
+           WHERE c.date_commande >= %s AND c.date_commande < %s AND c.id_commande <= %s
+           ORDER BY c.id_commande, d.id_detail FOR UPDATE""",
+        ["""DELETE d FROM commande_detail d JOIN commande c ON c.id_commande = d.id_commande
+            WHERE c.date_commande >= %s AND c.date_commande < %s AND c.id_commande <= %s""",
+         "DELETE FROM commande WHERE date_commande >= %s AND date_commande < %s AND id_commande <= %s"],
+        [("id_commande", "int64"), ("code_commande", "string"), ("date_commande", "date32"),
+         ("statut", "string"), ("id_client", "int64"), ("origine", "string"), ("id_origine", "int64"),
+         ("id_detail", "int64"), ("id_produit", "int64"), ("quantite_dmd", "int64"), ("quantite_livr", "int64")],
+        ("commande", "commande_detail"),
+    ),
+}
+
+
+def _mois(jour, decalage=0):
+    """Premier jour du mois de `jour`, décalé de `decalage` mois."""
+    n = jour.year * 12 + jour.month - 1 + decalage
+    return date(n // 12, n % 12 + 1, 1)
+
+
+def _chemin(fichier):
+    return os.path.join(DOSSIER, fichier)
+
+
+# -----------------------------------------------------
+# 📖 Lecture : seuls les mois qui recoupent la période sont ouverts
+# -----------------------------------------------------
+@cached("archive_periode")
+def partitions(nom, debut=None, fin=None):
+    """Fichiers des mois archivés de `nom` recoupant [debut, fin], du plus ancien au plus récent."""
+    conditions, params = ["nom_table = %s"], [nom]
+    if debut is not None:
+        conditions.append("mois >= %s")
+        params.append(_mois(debut))
+    if fin is not None:
+        conditions.append("mois <= %s")
+        params.append(fin)
+    with connection(replica=True) as conn:
+        cur = conn.cursor()
+        cur.execute(f"SELECT fichier FROM archive_periode WHERE {' AND '.join(conditions)} ORDER BY mois",
+                    params)
+        return [f for (f,) in cur.fetchall()]
+
+
+@cached("archive_periode")
+def horizon(nom):
+    """Premier jour non archivé de `nom` (None si rien n'est archivé)."""
+    with connection(replica=True) as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT MAX(mois) FROM archive_periode WHERE nom_table = %s", (nom,))
+        dernier = cur.fetchone()[0]
+    return _mois(dernier, 1) if dernier else None
+
+
+def morceaux(nom, debut=None, fin=None, colonnes=None, filtres=None, recents_dabord=False):
+    """DataFrames des mois archivés recoupant [debut, fin], un par mois.
+
+    `filtres` : conditions pyarrow [(colonne, op, valeur)] appliquées à la
+    lecture (bornes exactes, produit…) ; `debut`/`fin` ne servent qu'à
+    écarter les fichiers hors période.
+    """
+    fichiers = partitions(nom, debut, fin)
+    if not fichiers:
+        return
+    import pyarrow.parquet as pq
+    for fichier in reversed(fichiers) if recents_dabord else fichiers:
+        yield pq.read_table(_chemin(fichier), columns=colonnes, filters=filtres or None).to_pandas()
+
+
+def lire(nom, debut=None, fin=None, colonnes=None, filtres=None):
+    """Comme morceaux(), en un seul DataFrame (vide, avec les colonnes demandées, hors archives)."""
+    parts = list(morceaux(nom, debut, fin, colonnes, filtres))
+    if not parts:
+        return pd.DataFrame(columns=colonnes or [c for c, _ in SOURCES[nom].schema])
+    return pd.concat(parts, ignore_index=True)
+
+
+def commandes_detaillees(debut, fin):
+    """Lignes de commande archivées de [debut, fin], au format de l'export des
+    rapports (code, date, client, produit, quantité), les plus récentes d'abord."""
+    for df in morceaux("commande", debut, fin,
+                       ["id_commande", "code_commande", "date_commande", "id_client", "id_produit", "quantite_dmd"],
+                       [("date_commande", ">=", debut), ("date_commande", "<=", fin)], recents_dabord=True):
+        df = df.dropna(subset=["id_produit"])
+        if df.empty:
+            continue
+        clients = _noms("client", "id_client", "nom_client", df["id_client"].unique())
+        produits = _noms("produit", "id_produit", "nom_produit", df["id_produit"].unique())
+        df = df.sort_values(["date_commande", "id_commande"], ascending=False)
+        yield pd.DataFrame({
+            "code_commande": df["code_commande"], "date_commande": df["date_commande"],
+            "nom_client": df["id_client"].map(clients), "nom_produit": df["id_produit"].map(produits),
+            "quantite_dmd": df["quantite_dmd"].astype("int64"),
+        })
+
+
+def _noms(table, cle, colonne, ids):
+    ids = [int(i) for i in ids]
+    with connection(replica=True) as conn:
+        cur = conn.cursor()
+        cur.execute(f"SELECT {cle}, {colonne} FROM {table} WHERE {cle} IN ({', '.join(['%s'] * len(ids))})", ids)
+        return dict(cur.fetchall())
+
+
+# -----------------------------------------------------
+# 🗄️ Archivage d'un mois
+# -----------------------------------------------------
+def _borne_synchro(cur, nom):
+    """Dernier identifiant envoyé à tous les nœuds (synchro.py) : le reste attend son envoi."""
+    cur.execute("SELECT position FROM sync_envoye WHERE flux = %s", (nom,))
+    positions = [json.loads(p) for (p,) in cur.fetchall()]
+    return min(positions) if positions else 2**31 - 1
+
+
+def _table_arrow(source, lignes, precedent):
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+    schema = pa.schema([(c, pa.type_for_alias(t)) for c, t in source.schema])
+    table = pa.Table.from_arrays([pa.array(col, type=t) for col, t in zip(zip(*lignes), schema.types)],
+                                 schema=schema)
+    if precedent:
+        # lignes tardives d'un mois déjà archivé : fusionnées avec le fichier existant
+        ancien = pq.read_table(_chemin(precedent))
+        garde = pc.invert(pc.is_in(ancien[source.identifiant], value_set=table[source.identifiant]))
+        table = pa.concat_tables([ancien.filter(garde), table]).sort_by(source.identifiant)
+    return table
+
+
+def archiver_mois(source, mois):
+    """Déplace les lignes du mois `mois` dans son fichier Parquet ; retourne le nombre de lignes déplacées.
+
+    Lecture verrouillante, écriture du fichier, suppression et enregistrement
+    dans archive_periode se font dans une même transaction : un lecteur voit
+    chaque ligne soit en base, soit dans un fichier enregistré, jamais les deux.
+    """
+    import pyarrow.parquet as pq
+    debut, fin = mois, _mois(mois, 1)
+    nouveau = None
+    with transaction() as conn:
+        cur = conn.cursor()
+        cur.execute(source.select, (debut, fin, _borne_synchro(cur, source.nom)))
+        lignes = cur.fetchall()
+        if not lignes:
+            return 0
+        cur.execute("SELECT fichier FROM archive_periode WHERE nom_table = %s AND mois = %s FOR UPDATE",
+                    (source.nom, mois))
+        precedent = (cur.fetchone() or (None,))[0]
+        table = _table_arrow(source, lignes, precedent)
+        # nouveau nom à chaque passage : l'ancien fichier reste lisible jusqu'au COMMIT
+        nouveau = f"{source.nom}/{mois:%Y}/{mois:%Y-%m}.{int(time.time())}.parquet"
+        try:
+            os.makedirs(os.path.dirname(_chemin(nouveau)), exist_ok=True)
+            pq.write_table(table, f"{_chemin(nouveau)}.tmp", compression=COMPRESSION)
+            os.replace(f"{_chemin(nouveau)}.tmp", _chemin(nouveau))
+            id_max = max(ligne[0] for ligne in lignes)
+            for sql in source.suppressions:
+                cur.execute(sql, (debut, fin, id_max))
+            cur.execute("""
+                INSERT INTO archive_periode (nom_table, mois, fichier, lignes, elements, archive_le)
+                VALUES (%s,%s,%s,%s,%s,%s)
+                ON DUPLICATE KEY UPDATE fichier = VALUES(fichier), lignes = VALUES(lignes),
+                    elements = VALUES(elements), archive_le = VALUES(archive_le)
+            """, (source.nom, mois, nouveau, table.num_rows,
+                  len(set(table[source.identifiant].to_pylist())), datetime.now()))
+            invalidate(conn, *source.tables, "archive_periode")
+        except BaseException:
+            for f in (f"{_chemin(nouveau)}.tmp", _chemin(nouveau)):
+                if os.path.exists(f):
+                    os.remove(f)
+            raise
+    if precedent and os.path.exists(_chemin(precedent)):
+        os.remove(_chemin(precedent))
+    return len(lignes)
+
+
+def mois_a_archiver(source, mois_conserves=MOIS_CONSERVES):
+    """Mois antérieurs aux `mois_conserves` derniers qui ont encore des lignes en base."""
+    limite = _mois(date.today(), -mois_conserves)
+    with connection() as conn:
+        cur = conn.cursor()
+        cur.execute(f"SELECT MIN({source.colonne_date}) FROM {source.nom}")
+        premier = cur.fetchone()[0]
+        mois = []
+        courant = _mois(premier) if premier else limite
+        while courant < limite:
+            cur.execute(f"SELECT 1 FROM {source.nom} WHERE {source.colonne_date} >= %s "
+                        f"AND {source.colonne_date} < %s LIMIT 1", (courant, _mois(courant, 1)))
+            if cur.fetchone():
+                mois.append(courant)
+            courant = _mois(courant, 1)
+    return mois
+
+
+def archiver(mois_conserves=MOIS_CONSERVES, simulation=False, log=print):
+    migrations.ensure_schema()
+    total = 0
+    for source in SOURCES.values():
+        for mois in mois_a_archiver(source, mois_conserves):
+            if simulation:
+                log(f"  {source.nom} {mois:%Y-%m} : à archiver")
+                continue
+            n = archiver_mois(source, mois)
+            log(f"  {source.nom} {mois:%Y-%m} : {n} ligne(s) archivée(s)")
+            total += n
+    return total
+
+
+if __name__ == "__main__":
+    # Tâche planifiée (cron, mensuelle) : python archive.py
+    parser = argparse.ArgumentParser(description="Archivage Parquet des mouvements et commandes anciens.")
+    parser.add_argument("--mois", type=int, default=MOIS_CONSERVES, help="mois conservés en base")
+    parser.add_argument("--simulation", action="store_true", help="liste les mois sans rien archiver")
+    args = parser.parse_args()
+    n = archiver(args.mois, args.simulation, log=lambda m: print(m, file=sys.stderr))
+    if not args.simulation:
+        print(f"{n} ligne(s) archivée(s) dans {DOSSIER}", file=sys.stderr)
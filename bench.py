@@ -0,0 +1,134 @@
+# Banc d'essai sans navigateur : chaque page exécutée par AppTest, à plusieurs volumes
+#
+#   python bench.py --base cadmeko_bench --echelles 0.01,0.1,1   → seed.py à chaque volume, puis mesures
+#   python bench.py --base cadmeko_bench                          → mesure la base telle quelle
+#
+# Pour chaque page : latence du rerun (à froid, cache vidé, puis à chaud),
+# pic mémoire Python, temps SQL et détail par étape (profiling).
+import argparse
+import glob
+import json
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+
+RACINE = os.path.dirname(os.path.abspath(__file__))
+PAGES = [
+    ("Accueil", "app.py"),
+    ("Produits", "pages/1_*.py"),
+    ("Stock", "pages/2_*.py"),
+    ("Commandes", "pages/3_*.py"),
+    ("Rapports", "pages/4_*.py"),
+    ("Utilisateurs", "pages/5_*.py"),
+]
+UTILISATEUR = {"id": 0, "login": "bench", "role": "Administrateur"}
+
+
+def _rerun(chemin, timeout):
+    from streamlit.testing.v1 import AppTest
+    at = AppTest.from_file(chemin, default_timeout=timeout)
+    at.session_state["user"] = UTILISATEUR
+    t0 = time.perf_counter()
+    at.run()
+    ms = (time.perf_counter() - t0) * 1000
+    erreurs = [e.message for e in at.exception]
+    return ms, erreurs
+
+
+def mesurer_page(page, chemin, repetitions, timeout):
+    import streamlit as st
+    import profiling
+    import query_stats
+
+    st.cache_data.clear()
+    query_stats.vider()
+    froid, erreurs = _rerun(chemin, timeout)
+    sql_froid = sum(s["duree_ms"] for s in query_stats.statistiques() if s["page"] == page)
+    etapes = dict(profiling.historique()[-1].etapes) if profiling.historique() else {}
+
+    query_stats.vider()
+    chauds = []
+    for _ in range(repetitions):
+        ms, err = _rerun(chemin, timeout)
+        chauds.append(ms)
+        erreurs += err
+    sql_chaud = sum(s["duree_ms"] for s in query_stats.statistiques() if s["page"] == page) / max(repetitions, 1)
+
+    # passe séparée : tracemalloc ralentit l'exécution et fausserait les temps
+    st.cache_data.clear()
+    tracemalloc.start()
+    _rerun(chemin, timeout)
+    _, pic = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "page": page,
+        "froid_ms": round(froid, 1),
+        "chaud_p50_ms": round(statistics.median(chauds), 1) if chauds else None,
+        "chaud_max_ms": round(max(chauds), 1) if chauds else None,
+        "sql_froid_ms": round(sql_froid, 1),
+        "sql_chaud_ms": round(sql_chaud, 1),
+        "memoire_pic_mo": round(pic / 1024 / 1024, 1),
+        "etapes_froid_ms": {k: round(v, 1) for k, v in etapes.items()},
+        "erreurs": sorted(set(erreurs)),
+    }
+
+
+def _volumes():
+    from database import connection
+    with connection() as conn:
+        cur = conn.cursor()
+        cur.execute("""SELECT (SELECT COUNT(*) FROM produit), (SELECT COUNT(*) FROM mouvement_stock),
+                              (SELECT COUNT(*) FROM commande), (SELECT COUNT(*) FROM commande_detail)""")
+        return dict(zip(("produits", "mouvements", "commandes", "lignes_commande"), cur.fetchone()))
+
+
+def _afficher(volumes, resultats):
+    print("\n" + ", ".join(f"{v:,} {k}" for k, v in volumes.items()))
+    print(f"{'page':<14}{'froid ms':>10}{'chaud p50':>11}{'chaud max':>11}{'SQL froid':>11}"
+          f"{'SQL chaud':>11}{'mém. Mo':>9}")
+    for r in resultats:
+        print(f"{r['page']:<14}{r['froid_ms']:>10}{r['chaud_p50_ms']:>11}{r['chaud_max_ms']:>11}"
+              f"{r['sql_froid_ms']:>11}{r['sql_chaud_ms']:>11}{r['memoire_pic_mo']:>9}"
+              + (f"   ⚠ {r['erreurs'][0][:60]}" if r["erreurs"] else ""))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Mesure chaque page à différents volumes de données.")
+    parser.add_argument("--base", default=os.getenv("DB_NAME", "cadmeko"), help="base MySQL de test")
+    parser.add_argument("--echelles", default="",
+                        help="volumes à générer avec seed.py, ex. 0.01,0.1,1 (vide : base actuelle)")
+    parser.add_argument("--repetitions", type=int, default=5, help="reruns à chaud par page")
+    parser.add_argument("--pages", default="", help="pages à mesurer, ex. Stock,Rapports")
+    parser.add_argument("--timeout", type=float, default=300, help="délai max d'un rerun (s)")
+    parser.add_argument("--json", help="écrit les résultats dans ce fichier")
+    args = parser.parse_args(argv)
+
+    os.environ["DB_NAME"] = args.base       # avant tout import de database
+    os.chdir(RACINE)                        # chemins relatifs des pages (assets/styles.css)
+    sys.path.insert(0, RACINE)
+    import seed
+
+    choisies = {p.strip() for p in args.pages.split(",") if p.strip()}
+    pages = [(nom, glob.glob(motif)[0]) for nom, motif in PAGES if not choisies or nom in choisies]
+    echelles = [float(e) for e in args.echelles.split(",") if e.strip()] or [None]
+
+    rapport = []
+    for echelle in echelles:
+        if echelle is not None:
+            seed.main(["--base", args.base, "--echelle", str(echelle), "--vider"])
+        volumes = _volumes()
+        resultats = [mesurer_page(nom, chemin, args.repetitions, args.timeout) for nom, chemin in pages]
+        _afficher(volumes, resultats)
+        rapport.append({"echelle": echelle, "volumes": volumes, "pages": resultats})
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(rapport, f, ensure_ascii=False, indent=1)
+    return 1 if any(r["erreurs"] for e in rapport for r in e["pages"]) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,87 @@
+# Cache partagé des données de référence, invalidé par les écritures
+import functools
+import os
+import threading
+import time
+
+import streamlit as st
+
+import migrations
+from database import connection, versions_requises
+
+# Délai max (s) avant de relire les versions écrites par un autre processus
+SYNC_INTERVAL = float(os.getenv("CACHE_SYNC_INTERVAL", "2"))
+
+_versions = {}
+_lock = threading.Lock()
+_last_sync = 0.0
+
+
+def _sync():
+    """Relit toutes les versions (une seule petite requête)."""
+    global _last_sync
+    migrations.ensure_schema()
+    with connection() as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT nom, version FROM table_version")
+        rows = cur.fetchall()
+    with _lock:
+        for nom, version in rows:
+            if version > _versions.get(nom, -1):
+                _versions[nom] = version
+        _last_sync = time.monotonic()
+
+
+def versions(tables):
+    """Versions courantes des tables lues, dans l'ordre donné."""
+    if time.monotonic() - _last_sync > SYNC_INTERVAL:
+        _sync()
+    with _lock:
+        return tuple(_versions.get(t, 0) for t in tables)
+
+
+def invalidate(conn, *tables):
+    """À appeler dans la transaction d'écriture : incrémente la version des tables.
+
+    La version persistée change avec les données (même COMMIT) ; la version
+    locale n'est incrémentée qu'après le COMMIT, pour qu'aucun lecteur ne
+    mette en cache l'ancien état sous la nouvelle version.
+    """
+    conn.cursor().executemany("""
+        INSERT INTO table_version (nom, version) VALUES (%s, 1)
+        ON DUPLICATE KEY UPDATE version = version + 1
+    """, [(t,) for t in tables])
+
+    def _bump():
+        with _lock:
+            for t in tables:
+                _versions[t] = _versions.get(t, 0) + 1
+
+    conn.on_commit(_bump)
+
+
+def cached(*tables, ttl=None, max_entries=32):
+    """Cache inter-sessions d'une fonction de lecture, étiqueté par les tables lues.
+
+    La clé inclut la version de chaque table : une écriture sur l'une d'elles
+    rend l'entrée obsolète immédiatement, sans interroger la base sinon.
+    """
+    def decorator(func):
+        def _load(tables_version, *args, **kwargs):
+            # lue sur une réplique, l'entrée doit refléter ces versions
+            with versions_requises(dict(zip(tables, tables_version))):
+                return func(*args, **kwargs)
+
+        # clé de cache Streamlit propre à chaque fonction décorée (les pages
+        # s'exécutent toutes sous __main__, d'où le nom de fichier)
+        _load.__module__ = f"{func.__module__}:{func.__code__.co_filename}"
+        _load.__qualname__ = f"{func.__qualname__}.cached"
+        _load = st.cache_data(ttl=ttl, max_entries=max_entries, show_spinner=False)(_load)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            return _load(versions(tables), *args, **kwargs)
+
+        wrapper.clear = _load.clear
+        return wrapper
+    return decorator
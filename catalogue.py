@@ -0,0 +1,248 @@
+# Import du catalogue produits (CSV / XLSX) : lecture en flux, contrôles vectorisés, upsert par paquets
+import os
+
+import pandas as pd
+
+import alertes
+from cache import invalidate
+from database import connection, transaction
+
+PAQUET = int(os.getenv("CATALOGUE_PAQUET", "2000"))     # lignes lues, contrôlées et écrites ensemble
+COLONNES_IMPORT = ("code_produit", "nom_produit")
+# + forme, dosage, date_peremption, prix_unitaire, seuil_alerte (optionnelles : cellule vide = valeur inchangée)
+CHAMPS = ("nom_produit", "forme", "dosage", "date_peremption", "prix_unitaire", "seuil_alerte")
+LONGUEURS = {"code_produit": 20, "nom_produit": 100, "forme": 50, "dosage": 50}
+PRIX_MAX = 9_999_999_999.99         # DECIMAL(12,2)
+CHANGEMENTS_MAX = 1_000             # détail conservé dans le résumé (les compteurs restent exacts)
+
+
+# -----------------------------------------------------
+# 📂 Lecture en flux
+# -----------------------------------------------------
+def _paquets_xlsx(fichier, taille):
+    from openpyxl import load_workbook
+    wb = load_workbook(fichier, read_only=True, data_only=True)     # lignes lues au fil de l'eau
+    try:
+        lignes = wb.active.iter_rows(values_only=True)
+        entete = [str(c) if c is not None else "" for c in next(lignes, ())]
+        paquet = []
+        for ligne in lignes:
+            if any(v is not None for v in ligne):
+                paquet.append(ligne[:len(entete)])
+            if len(paquet) == taille:
+                yield pd.DataFrame(paquet, columns=entete, dtype=object)
+                paquet = []
+        if paquet or not entete:
+            yield pd.DataFrame(paquet, columns=entete, dtype=object)
+    finally:
+        wb.close()
+
+
+def lire_par_paquets(fichier, taille=PAQUET):
+    """DataFrames de `taille` lignes au plus, colonnes en minuscules, valeurs brutes (texte)."""
+    fichier.seek(0)
+    if fichier.name.lower().endswith((".xlsx", ".xls")):
+        paquets = _paquets_xlsx(fichier, taille)
+    else:
+        paquets = pd.read_csv(fichier, sep=None, engine="python", dtype=str, chunksize=taille)
+    for df in paquets:
+        yield df.rename(columns=lambda c: str(c).strip().lower())
+
+
+# -----------------------------------------------------
+# 🔎 Contrôles (vectorisés, par paquet)
+# -----------------------------------------------------
+def _texte(s):
+    s = s.astype("string").str.strip()
+    return s.mask(s == "")
+
+
+def normaliser(df, premiere_ligne):
+    """Colonnes typées : textes nettoyés (vide → NA), dates et prix convertis
+    (NaT / NaN si illisibles), n° de ligne du fichier."""
+    df = df.reset_index(drop=True)
+    out = pd.DataFrame({"ligne": df.index + premiere_ligne})
+    for col in ("code_produit", "nom_produit", "forme", "dosage"):
+        if col in df:
+            out[col] = _texte(df[col])
+    # codes lus comme nombres dans un tableur : 1234.0 → 1234
+    out["code_produit"] = out["code_produit"].str.replace(r"\.0$", "", regex=True)
+    if "date_peremption" in df:
+        out["date_peremption_brute"] = _texte(df["date_peremption"])
+        out["date_peremption"] = pd.to_datetime(out["date_peremption_brute"], errors="coerce", dayfirst=True)
+    if "prix_unitaire" in df:
+        # « 1 250,50 », « 1250.5 » ou « 1 250 CDF » (export de la page Produits)
+        brut = _texte(df["prix_unitaire"])
+        nombre = (brut.str.replace(r"(?i)\s*cdf$", "", regex=True)
+                      .str.replace(r"\s", "", regex=True)
+                      .str.replace(",", ".", regex=False))
+        out["prix_unitaire_brut"] = brut
+        out["prix_unitaire"] = pd.to_numeric(nombre, errors="coerce").round(2)
+    if "seuil_alerte" in df:
+        out["seuil_alerte_brut"] = _texte(df["seuil_alerte"])
+        out["seuil_alerte"] = pd.to_numeric(out["seuil_alerte_brut"], errors="coerce")
+    return out
+
+
+def controler(df, vus):
+    """[(ligne, message), ...] pour un paquet normalisé ; `vus` : codes des paquets précédents (complété)."""
+    cle = df["code_produit"].str.lower()
+    controles = [
+        (df["code_produit"].isna(), "Code produit manquant"),
+        (df["nom_produit"].isna(), "Nom du produit manquant"),
+        (cle.duplicated() & cle.notna() | cle.isin(vus), "Code produit en double dans le fichier"),
+    ]
+    for col, n in LONGUEURS.items():
+        if col in df:
+            controles.append((df[col].str.len() > n, f"{col} trop long ({n} caractères max)"))
+    if "date_peremption" in df:
+        controles.append((df["date_peremption_brute"].notna() & df["date_peremption"].isna(),
+                          "Date de péremption invalide"))
+    if "prix_unitaire" in df:
+        prix = df["prix_unitaire"]
+        controles.append((df["prix_unitaire_brut"].notna() & (prix.isna() | (prix < 0) | (prix > PRIX_MAX)),
+                          "Prix unitaire invalide (nombre ≥ 0 attendu)"))
+    if "seuil_alerte" in df:
+        seuil = df["seuil_alerte"]
+        controles.append((df["seuil_alerte_brut"].notna() & (seuil.isna() | (seuil < 0) | (seuil % 1 != 0)),
+                          "Seuil d'alerte invalide (entier ≥ 0 attendu)"))
+    vus.update(cle.dropna())
+    erreurs = []
+    for masque, msg in controles:
+        erreurs += [(int(ligne), msg) for ligne in df.loc[masque.fillna(False).astype(bool), "ligne"]]
+    return erreurs
+
+
+def analyser(fichier):
+    """Première passe, sans écriture : retourne (nb de lignes, erreurs triées)."""
+    n, erreurs, vus = 0, [], set()
+    for brut in lire_par_paquets(fichier):
+        manquantes = [c for c in COLONNES_IMPORT if c not in brut.columns]
+        if manquantes:
+            return 0, [(0, f"Colonnes manquantes : {', '.join(manquantes)}")]
+        erreurs += controler(normaliser(brut, n + 2), vus)     # en-tête = ligne 1
+        n += len(brut)
+    return n, sorted(erreurs)
+
+
+# -----------------------------------------------------
+# 🔁 Différences et upsert
+# -----------------------------------------------------
+def _existants(cur, codes, verrou):
+    """Produits existants du paquet ; FOR UPDATE verrouille aussi les codes absents (idx_produit_code)."""
+    cur.execute(f"""
+        SELECT id_produit, code_produit, {", ".join(CHAMPS)} FROM produit
+        WHERE code_produit IN ({", ".join(["%s"] * len(codes))})
+        {"FOR UPDATE" if verrou else ""}
+    """, codes)
+    df = pd.DataFrame(cur.fetchall(), columns=["id_produit", "code_produit", *CHAMPS])
+    df["prix_unitaire"] = pd.to_numeric(df["prix_unitaire"]).astype(float)
+    df["date_peremption"] = pd.to_datetime(df["date_peremption"])
+    return df
+
+
+def _differe(nouveau, ancien):
+    """Valeur fournie (non vide) et différente de la valeur en base."""
+    egal = (nouveau == ancien).fillna(False).astype(bool)
+    return nouveau.notna() & ~egal
+
+
+def _comparer(df, existants):
+    """(nouveaux, modifiés, nb inchangés, changements) ; les modifiés gardent la
+    valeur en base là où le fichier n'en donne pas."""
+    champs = [c for c in CHAMPS if c in df]
+    base = existants.rename(columns={c: f"{c}_base" for c in ("code_produit", *CHAMPS)})
+    fusion = df.assign(cle=df["code_produit"].str.lower()).merge(
+        base.assign(cle=base["code_produit_base"].str.lower()), on="cle", how="left")
+    connu = fusion["id_produit"].notna()
+    nouveaux = fusion[~connu]
+
+    connus = fusion[connu]
+    masques = {c: _differe(connus[c], connus[f"{c}_base"]) for c in champs}
+    modifie = pd.concat(masques, axis=1).any(axis=1) if masques else pd.Series(False, index=connus.index)
+    modifies = connus[modifie].copy()
+    for c in CHAMPS:
+        en_base = modifies[f"{c}_base"]
+        modifies[c] = modifies[c].where(modifies[c].notna(), en_base) if c in champs else en_base
+
+    changements = [
+        {"Ligne": ligne, "Code": code, "Champ": c, "Avant": avant, "Après": apres}
+        for c, masque in masques.items()
+        for ligne, code, avant, apres in zip(connus.loc[masque, "ligne"], connus.loc[masque, "code_produit"],
+                                             connus.loc[masque, f"{c}_base"], connus.loc[masque, c])
+    ]
+    return nouveaux, modifies, int((~modifie).sum()), changements
+
+
+def _valeurs(df, avec_id):
+    """Tuples de types Python (le connecteur ne convertit pas les types numpy), NA → NULL."""
+    d = df.reindex(columns=["id_produit", "code_produit", *CHAMPS])
+    colonnes = [d["code_produit"], d["nom_produit"], d["forme"], d["dosage"],
+                pd.to_datetime(d["date_peremption"]).dt.date, d["prix_unitaire"].astype(float).fillna(0.0),
+                d["seuil_alerte"].astype(float).fillna(alertes.SEUIL_DEFAUT).astype("int64")]
+    if avec_id:
+        colonnes.insert(0, d["id_produit"].astype("int64"))
+    return [tuple(None if pd.isna(v) else v for v in ligne) for ligne in zip(*(c.tolist() for c in colonnes))]
+
+
+def _ecrire(conn, nouveaux, modifies):
+    cur = conn.cursor()
+    if len(nouveaux):
+        cur.executemany("""
+            INSERT INTO produit (code_produit, nom_produit, forme, dosage, date_peremption, prix_unitaire,
+                                 seuil_alerte)
+            VALUES (%s,%s,%s,%s,%s,%s,%s)
+        """, _valeurs(nouveaux, avec_id=False))
+    if len(modifies):
+        # INSERT multi-lignes sur la clé primaire : un seul aller-retour pour tout le paquet
+        cur.executemany("""
+            INSERT INTO produit (id_produit, code_produit, nom_produit, forme, dosage, date_peremption,
+                                 prix_unitaire, seuil_alerte)
+            VALUES (%s,%s,%s,%s,%s,%s,%s,%s)
+            ON DUPLICATE KEY UPDATE code_produit = VALUES(code_produit), nom_produit = VALUES(nom_produit),
+                forme = VALUES(forme), dosage = VALUES(dosage), date_peremption = VALUES(date_peremption),
+                prix_unitaire = VALUES(prix_unitaire), seuil_alerte = VALUES(seuil_alerte)
+        """, _valeurs(modifies, avec_id=True))
+    # produits créés (stock nul) ou dont le seuil a pu changer : alertes réévaluées
+    ids = modifies["id_produit"].astype("int64").tolist()
+    if len(nouveaux):
+        codes = nouveaux["code_produit"].tolist()
+        cur.execute(f"SELECT id_produit FROM produit WHERE code_produit IN ({', '.join(['%s'] * len(codes))})",
+                    codes)
+        ids += [pid for (pid,) in cur.fetchall()]
+    alertes.recalculer(conn, ids)
+
+
+def importer(fichier, simulation=False, progression=None):
+    """Upsert du catalogue par paquets de PAQUET lignes, clé code_produit.
+
+    Chaque paquet est une transaction : produits existants du paquet lus et
+    verrouillés en une requête, comparés au fichier, puis seuls les nouveaux
+    et les modifiés sont écrits. Le fichier doit avoir passé analyser().
+    `simulation` : mêmes lectures, aucune écriture. `progression(n)` est
+    appelé après chaque paquet. Retourne un résumé (compteurs + détail des
+    changements de champ).
+    """
+    resume = {"lignes": 0, "ajoutes": 0, "modifies": 0, "inchanges": 0, "changements": []}
+    for brut in lire_par_paquets(fichier):
+        df = normaliser(brut, resume["lignes"] + 2)
+        codes = df["code_produit"].tolist()
+        if simulation:
+            with connection() as conn:
+                existants = _existants(conn.cursor(), codes, verrou=False)
+            nouveaux, modifies, inchanges, changements = _comparer(df, existants)
+        else:
+            with transaction() as conn:
+                existants = _existants(conn.cursor(), codes, verrou=True)
+                nouveaux, modifies, inchanges, changements = _comparer(df, existants)
+                _ecrire(conn, nouveaux, modifies)
+                if len(nouveaux) or len(modifies):
+                    invalidate(conn, "produit")
+        resume["lignes"] += len(df)
+        resume["ajoutes"] += len(nouveaux)
+        resume["modifies"] += len(modifies)
+        resume["inchanges"] += inchanges
+        resume["changements"] += changements[:CHANGEMENTS_MAX - len(resume["changements"])]
+        if progression is not None:
+            progression(resume["lignes"])
+    return resume
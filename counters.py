@@ -0,0 +1,59 @@
+# Compteurs du tableau de bord (un cache par compteur, étiqueté par ses seules tables)
+from datetime import date
+
+from cache import cached
+from database import connection
+from lots import ALERTE_JOURS
+
+# nom -> (requête scalaire, tables lues) ; %(jour)s = date du jour
+KPIS = {
+    "produits":       ("SELECT COUNT(*) FROM produit", ("produit",)),
+    "stock":          ("SELECT COUNT(*) FROM stock", ("stock",)),
+    "clients":        ("SELECT COUNT(*) FROM client", ("client",)),
+    "fournisseurs":   ("SELECT COUNT(*) FROM fournisseur", ("fournisseur",)),
+    "commandes":      ("""SELECT (SELECT COUNT(*) FROM commande)
+                                + (SELECT COALESCE(SUM(elements), 0) FROM archive_periode
+                                   WHERE nom_table = 'commande')""",
+                       ("commande", "archive_periode")),       # archive.py : commandes archivées
+    "commandes_jour": ("SELECT COUNT(*) FROM commande WHERE date_commande = %(jour)s", ("commande",)),
+    "valeur_stock":   ("""SELECT COALESCE(SUM(s.quantite * p.prix_unitaire), 0)
+                          FROM stock s JOIN produit p ON p.id_produit = s.id_produit""",
+                       ("stock", "produit")),
+    "lots_a_perimer": (f"""SELECT COUNT(*) FROM lot
+                           WHERE actif = 1 AND date_peremption <= %(jour)s + INTERVAL {ALERTE_JOURS} DAY""",
+                       ("lot",)),
+    "alertes_stock":  ("SELECT COUNT(*) FROM alerte_stock", ("alerte_stock",)),
+}
+
+
+def _compteur(nom, sql, tables):
+    def lire(jour):
+        with connection(replica=True) as conn:
+            cur = conn.cursor()
+            cur.execute(sql, {"jour": jour})
+            return cur.fetchone()[0]
+    lire.__qualname__ = f"compteur_{nom}"     # clé de cache Streamlit distincte par compteur
+    # client / fournisseur sont alimentés hors de l'application : filet de sécurité ttl
+    return cached(*tables, ttl=300)(lire)
+
+
+_COMPTEURS = {nom: _compteur(nom, sql, tables) for nom, (sql, tables) in KPIS.items()}
+
+
+def get_counters():
+    """Tous les compteurs ; une écriture ne fait recompter que ceux qui lisent la table modifiée."""
+    jour = date.today()
+    return {nom: lire(jour) for nom, lire in _COMPTEURS.items()}
+
+
+@cached("commande")
+def dernieres_commandes(limit=5):
+    with connection(replica=True) as conn:
+        cur = conn.cursor(dictionary=True)
+        cur.execute("""
+            SELECT code_commande, date_commande, statut
+            FROM commande
+            ORDER BY date_commande DESC, id_commande DESC
+            LIMIT %s
+        """, (limit,))
+        return cur.fetchall()
@@ -1,11 +1,374 @@
-# Connexion et helpers SQLAlchemy 
+# Connexion et helpers SQLAlchemy
 import mysql.connector
 import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+
+from query_stats import InstrumentedCursor
+
+# -----------------------------------------------------
+# ⚙️ Configuration (variables d'environnement)
+# -----------------------------------------------------
+DB_CONFIG = {
+    "host": os.getenv("DB_HOST", "localhost"),
+    "port": int(os.getenv("DB_PORT", "3306")),
+    "user": os.getenv("DB_USER", "root"),
+    "password": os.getenv("DB_PWD", ""),
+    "database": os.getenv("DB_NAME", "cadmeko"),
+}
+POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))          # attente max d'une connexion libre (s)
+POOL_MAX_LIFETIME = float(os.getenv("DB_POOL_MAX_LIFETIME", "1800"))  # recyclage des connexions (s)
+POOL_PING_IDLE = float(os.getenv("DB_POOL_PING_IDLE", "30"))      # ping si inactive depuis (s)
+
+# Répliques en lecture : "hote[:port],hote[:port]" (mêmes identifiants et base)
+REPLICAS = [h.strip() for h in os.getenv("DB_REPLICAS", "").split(",") if h.strip()]
+REPLICA_MAX_LAG = float(os.getenv("DB_REPLICA_MAX_LAG", "5"))    # retard toléré (s)
+REPLICA_CHECK = float(os.getenv("DB_REPLICA_CHECK", "5"))        # s entre deux mesures du retard
+# instances de test sans réplication configurée : considérées à jour
+REPLICA_STATIC = os.getenv("DB_REPLICA_STATIC", "0") == "1"
+
+
+class PoolTimeout(Exception):
+    """Aucune connexion libre dans le délai imparti."""
+
+
+# -----------------------------------------------------
+# 🔁 Pool de connexions (partagé par toutes les sessions)
+# -----------------------------------------------------
+class ConnectionPool:
+    """Pool borné de connexions MySQL, réutilisées d'un rerun à l'autre.
+
+    Le module n'est importé qu'une fois par processus Streamlit : le pool est
+    donc commun à toutes les sessions utilisateurs.
+    """
+
+    def __init__(self, config, size=POOL_SIZE, timeout=POOL_TIMEOUT,
+                 max_lifetime=POOL_MAX_LIFETIME, ping_idle=POOL_PING_IDLE):
+        self.config = config
+        self.size = size
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self.ping_idle = ping_idle
+        self._idle = queue.LifoQueue()            # (raw_conn, créée_le, rendue_le)
+        self._slots = threading.BoundedSemaphore(size)
+
+    def _connect(self):
+        raw = mysql.connector.connect(autocommit=True, **self.config)
+        return raw, time.monotonic()
+
+    def _healthy(self, raw, created, released):
+        now = time.monotonic()
+        if now - created > self.max_lifetime:
+            return False
+        if now - released > self.ping_idle:
+            try:
+                raw.ping(reconnect=False)
+            except mysql.connector.Error:
+                return False
+        return True
+
+    def acquire(self):
+        if not self._slots.acquire(timeout=self.timeout):
+            raise PoolTimeout(f"Pool saturé ({self.size} connexions en cours d'utilisation)")
+        try:
+            while True:
+                try:
+                    raw, created, released = self._idle.get_nowait()
+                except queue.Empty:
+                    raw, created = self._connect()
+                    break
+                if self._healthy(raw, created, released):
+                    break
+                _close_quietly(raw)
+        except Exception:
+            self._slots.release()
+            raise
+        return PooledConnection(self, raw, created)
+
+    def release(self, raw, created, broken=False):
+        try:
+            if broken or time.monotonic() - created > self.max_lifetime:
+                _close_quietly(raw)
+                return
+            try:
+                if raw.unread_result:
+                    raw.consume_results()
+                if raw.in_transaction:
+                    raw.rollback()
+                if not raw.autocommit:
+                    raw.autocommit = True
+            except mysql.connector.Error:
+                _close_quietly(raw)
+                return
+            self._idle.put((raw, created, time.monotonic()))
+        finally:
+            self._slots.release()
+
+    def close_all(self):
+        while True:
+            try:
+                raw, _, _ = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            _close_quietly(raw)
+
+
+class PooledConnection:
+    """Connexion empruntée au pool ; close() la rend au pool au lieu de la fermer."""
+
+    def __init__(self, pool, raw, created):
+        self._pool = pool
+        self._raw = raw
+        self._created = created
+        self._broken = False
+        self._after_commit = []
+        self._cursors = []
+
+    def on_commit(self, callback):
+        """Exécute callback() après le COMMIT de la transaction en cours."""
+        self._after_commit.append(callback)
+
+    def cursor(self, *args, **kwargs):
+        """Curseur instrumenté : durée, lignes et page de chaque requête (query_stats)."""
+        cur = InstrumentedCursor(self.__getattr__("cursor")(*args, **kwargs))
+        self._cursors.append(cur)
+        return cur
+
+    def __getattr__(self, name):
+        if self._raw is None:
+            raise mysql.connector.InterfaceError("Connexion déjà rendue au pool")
+        return getattr(self._raw, name)
+
+    def close(self):
+        if self._raw is not None:
+            for cur in self._cursors:
+                cur._terminer()         # requêtes dont les lignes n'ont pas toutes été lues
+            self._cursors.clear()
+            raw, self._raw = self._raw, None
+            self._pool.release(raw, self._created, broken=self._broken)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def _close_quietly(raw):
+    try:
+        raw.close()
+    except Exception:
+        pass
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(DB_CONFIG)
+    return _pool
+
 
 def get_connection():
-    return mysql.connector.connect(
-        host="localhost",
-        user=os.getenv("DB_USER", "root"),
-        password=os.getenv("DB_PWD", ""),
-        database="cadmeko"
-    )
+    """Connexion empruntée au pool (autocommit) ; conn.close() la rend au pool."""
+    return get_pool().acquire()
+
+
+# -----------------------------------------------------
+# 📚 Répliques en lecture
+# -----------------------------------------------------
+class Replica:
+    """Une réplique, son pool et son dernier retard mesuré."""
+
+    def __init__(self, adresse):
+        host, _, port = adresse.partition(":")
+        self.adresse = adresse
+        self.pool = ConnectionPool({**DB_CONFIG, "host": host, "port": int(port or DB_CONFIG["port"])})
+        self.retard = None          # s ; None = hors service ou réplication arrêtée
+        self.mesure_le = float("-inf")
+        self.lectures = 0
+        self.replis = 0             # lectures renvoyées vers le primaire
+        self._lock = threading.Lock()
+
+    def _mesurer(self):
+        if REPLICA_STATIC:
+            return 0.0
+        conn = self.pool.acquire()
+        try:
+            cur = conn.cursor(dictionary=True)
+            try:
+                cur.execute("SHOW REPLICA STATUS")
+            except mysql.connector.errors.ProgrammingError:
+                cur.execute("SHOW SLAVE STATUS")          # MySQL < 8.0.22
+            statut = cur.fetchone()
+        finally:
+            conn.close()
+        if not statut:
+            return None                                   # pas configurée comme réplique
+        retard = statut.get("Seconds_Behind_Source", statut.get("Seconds_Behind_Master"))
+        return None if retard is None else float(retard)
+
+    def disponible(self):
+        with self._lock:
+            if time.monotonic() - self.mesure_le >= REPLICA_CHECK:
+                try:
+                    self.retard = self._mesurer()
+                except (mysql.connector.Error, PoolTimeout):
+                    self.retard = None
+                self.mesure_le = time.monotonic()
+            return self.retard is not None and self.retard <= REPLICA_MAX_LAG
+
+    def hors_service(self):
+        with self._lock:
+            self.retard = None
+            self.mesure_le = time.monotonic()
+
+
+_replicas = None
+_tour = 0                       # répartition circulaire entre répliques
+_ecritures = {}                 # session -> instant du dernier COMMIT
+_local = threading.local()
+
+
+def get_replicas():
+    global _replicas
+    if _replicas is None:
+        with _pool_lock:
+            if _replicas is None:
+                _replicas = [Replica(a) for a in REPLICAS]
+    return _replicas
+
+
+def _session():
+    """Session Streamlit courante (un rerun = un thread), sinon le thread."""
+    try:
+        from streamlit.runtime.scriptrunner import get_script_run_ctx
+        ctx = get_script_run_ctx()
+    except ImportError:
+        ctx = None
+    return ctx.session_id if ctx is not None else threading.get_ident()
+
+
+def _noter_ecriture():
+    maintenant = time.monotonic()
+    _ecritures[_session()] = maintenant
+    if len(_ecritures) > 10_000:
+        for cle, t in list(_ecritures.items()):
+            if maintenant - t > REPLICA_MAX_LAG:
+                _ecritures.pop(cle, None)
+
+
+@contextmanager
+def versions_requises(versions):
+    """Lectures du bloc : une réplique n'est utilisée que si elle a déjà
+    répliqué ces versions de tables ({table: version}, cf. cache.cached)."""
+    precedent = getattr(_local, "versions", None)
+    _local.versions = versions
+    try:
+        yield
+    finally:
+        _local.versions = precedent
+
+
+def _a_jour(conn, versions):
+    noms = list(versions)
+    cur = conn.cursor()
+    cur.execute(f"SELECT nom, version FROM table_version WHERE nom IN ({', '.join(['%s'] * len(noms))})",
+                noms)
+    lues = dict(cur.fetchall())
+    return all(lues.get(nom, 0) >= v for nom, v in versions.items())
+
+
+def get_read_connection():
+    """Connexion pour une lecture qui tolère un léger retard.
+
+    Réplique à jour si possible ; sinon le primaire : pas de réplique
+    configurée ou disponible, session ayant écrit il y a moins de
+    REPLICA_MAX_LAG s (elle relit ses propres écritures), ou réplique n'ayant
+    pas encore reçu les versions attendues par le cache.
+    """
+    global _tour
+    replicas = get_replicas()
+    if not replicas:
+        return get_connection()
+    ecrit = _ecritures.get(_session())
+    if ecrit is not None and time.monotonic() - ecrit < REPLICA_MAX_LAG:
+        return get_connection()
+    _tour += 1
+    versions = {t: v for t, v in (getattr(_local, "versions", None) or {}).items() if v}
+    for i in range(len(replicas)):
+        rep = replicas[(_tour + i) % len(replicas)]
+        if not rep.disponible():
+            continue
+        try:
+            conn = rep.pool.acquire()
+        except (mysql.connector.Error, PoolTimeout):
+            rep.hors_service()
+            continue
+        try:
+            if not versions or _a_jour(conn, versions):
+                rep.lectures += 1
+                return conn
+        except mysql.connector.Error:
+            conn._broken = True
+            rep.hors_service()
+        conn.close()
+        rep.replis += 1
+    return get_connection()
+
+
+def etat_replicas():
+    return [{"replique": r.adresse, "retard_s": r.retard, "lectures": r.lectures, "replis": r.replis}
+            for r in get_replicas()]
+
+
+@contextmanager
+def connection(replica=False):
+    """Connexion de lecture, rendue au pool en sortie de bloc.
+
+    replica=True pour les lectures qui supportent un léger retard (rapports,
+    historiques, tableaux de bord) : voir get_read_connection().
+    """
+    conn = get_read_connection() if replica else get_connection()
+    try:
+        yield conn
+    except mysql.connector.errors.OperationalError:
+        conn._broken = True
+        raise
+    finally:
+        conn.close()
+
+
+@contextmanager
+def transaction(pool=None):
+    """Transaction : COMMIT si le bloc réussit, ROLLBACK sinon.
+
+    `pool` : une autre base que le primaire (synchro.py : nœud central).
+    """
+    conn = get_connection() if pool is None else pool.acquire()
+    try:
+        conn.start_transaction()
+        yield conn
+        conn.commit()
+        if pool is None:
+            _noter_ecriture()
+        for callback in conn._after_commit:
+            callback()
+    except BaseException as e:
+        try:
+            conn.rollback()
+        except mysql.connector.Error:
+            conn._broken = True
+        if isinstance(e, mysql.connector.errors.OperationalError):
+            conn._broken = True
+        raise
+    finally:
+        conn.close()
@@ -0,0 +1,170 @@
+# Contrôle de régression des plans : EXPLAIN de chaque requête émise par les pages
+import argparse
+import sys
+from dataclasses import dataclass, field
+from datetime import date, datetime
+
+import migrations
+from database import connection
+
+AUJ = date.today()
+MAINTENANT = datetime.now()
+
+
+@dataclass
+class Requete:
+    nom: str
+    sql: str
+    params: tuple = ()
+    # dérogations justifiées : "scan" (parcours complet), "filesort"
+    autorise: set = field(default_factory=set)
+
+
+def _grille(select, source, order, where="1=1", limit=51):
+    return f"SELECT {select} FROM {source} WHERE {where} ORDER BY {order} LIMIT {limit}"
+
+
+def requetes():
+    import archive
+    import counters
+    import sequences
+    return [
+        # --- app.py ---
+        *(Requete(f"accueil.compteurs.{nom}", sql, {"jour": AUJ},
+                  autorise={"scan"})            # comptages et valeur du stock : tables entières
+          for nom, (sql, _) in counters.KPIS.items()),
+        Requete("accueil.dernieres_commandes", """
+            SELECT code_commande, date_commande, statut FROM commande
+            ORDER BY date_commande DESC, id_commande DESC LIMIT 5"""),
+        # --- security.py ---
+        Requete("connexion.utilisateur",
+                "SELECT id_user, login, role, pwd_hash FROM utilisateur WHERE login=%s", ("admin",)),
+        # --- Produits ---
+        Requete("produits.grille_id", _grille("*", "produit", "id_produit DESC")),
+        Requete("produits.grille_nom", _grille("*", "produit", "nom_produit ASC, id_produit ASC",
+                                               where="nom_produit LIKE %s"), ("PARA%",)),
+        Requete("produits.grille_code", _grille("*", "produit", "code_produit ASC, id_produit ASC")),
+        # --- Stock ---
+        Requete("stock.grille", _grille("p.code_produit, p.nom_produit, COALESCE(s.quantite,0), s.maj",
+                                        "produit p LEFT JOIN stock s ON s.id_produit = p.id_produit",
+                                        "p.nom_produit ASC, p.id_produit ASC")),
+        Requete("recherche.increment", """
+            SELECT id_produit, code_produit, nom_produit, forme, dosage, maj FROM produit WHERE maj >= %s""",
+                (MAINTENANT,)),
+        Requete("stock.verrou", "SELECT id_produit, quantite FROM stock WHERE id_produit IN (%s, %s)", (1, 2)),
+        Requete("stock.import_codes", "SELECT code_produit, id_produit FROM produit WHERE code_produit IN (%s, %s)",
+                ("A", "B")),
+        Requete("stock.serie_produit", """
+            SELECT DATE(date_mvt) AS jour, SUM(quantite) FROM mouvement_stock
+            WHERE id_produit = %s AND date_mvt >= %s AND date_mvt <= %s GROUP BY jour""",
+                (1, datetime(AUJ.year, 1, 1), MAINTENANT)),
+        Requete("stock.lots_produit", """
+            SELECT numero_lot, date_peremption, quantite FROM lot
+            WHERE id_produit = %s AND actif = 1 ORDER BY date_peremption, id_lot""", (1,)),
+        Requete("stock.a_perimer", """
+            SELECT l.date_peremption, p.code_produit, p.nom_produit, l.numero_lot, l.quantite
+            FROM lot l JOIN produit p ON p.id_produit = l.id_produit
+            WHERE l.actif = 1 AND l.date_peremption <= %s ORDER BY l.date_peremption, l.id_lot""", (AUJ,)),
+        Requete("stock.alertes_seuils", """
+            SELECT p.id_produit, p.seuil_alerte, a.id_produit IS NOT NULL
+            FROM produit p LEFT JOIN alerte_stock a ON a.id_produit = p.id_produit
+            WHERE p.id_produit IN (%s, %s)""", (1, 2)),
+        # --- Commandes ---
+        Requete("commandes.clients", "SELECT id_client, nom_client FROM client ORDER BY nom_client"),
+        Requete("commandes.stock_proposes", "SELECT id_produit, quantite FROM stock WHERE id_produit IN (%s, %s)",
+                (1, 2)),
+        Requete("commandes.historique", _grille(
+            "c.id_commande, c.code_commande, c.date_commande, cl.nom_client, c.statut",
+            "commande c JOIN client cl ON cl.id_client=c.id_client",
+            "c.date_commande DESC, c.id_commande DESC")),
+        Requete("commandes.fefo", """
+            SELECT id_produit, id_lot, quantite FROM lot WHERE id_produit IN (%s, %s) AND actif = 1
+            ORDER BY id_produit, date_peremption, id_lot""", (1, 2),
+                autorise={"filesort"}),           # tri des seuls lots actifs des produits commandés
+        Requete("commandes.sequence_amorce", sequences.SQL_AMORCE, (AUJ, sequences.motif(AUJ))),
+        Requete("commandes.sequence", sequences.SQL_RESERVER, (1, AUJ)),
+        # --- Rapports ---
+        Requete("rapports.stock", """
+            SELECT p.nom_produit, p.forme, p.dosage, COALESCE(s.quantite, 0) AS quantite
+            FROM produit p LEFT JOIN stock s ON s.id_produit = p.id_produit ORDER BY quantite ASC""",
+                autorise={"scan", "filesort"}),   # rapport complet, trié sur une valeur calculée
+        Requete("rapports.commandes_detail", _grille(
+            "c.code_commande, c.date_commande, cl.nom_client, p.nom_produit, d.quantite_dmd",
+            """commande c JOIN client cl ON cl.id_client = c.id_client
+               JOIN commande_detail d ON d.id_commande = c.id_commande
+               JOIN produit p ON p.id_produit = d.id_produit""",
+            "c.date_commande DESC, d.id_detail DESC", where="c.date_commande BETWEEN %s AND %s"),
+                (date(AUJ.year, 1, 1), AUJ),
+                autorise={"filesort"}),           # tri sur deux tables, borné par la période
+        Requete("rapports.par_jour", """
+            SELECT jour, SUM(nb_commandes), SUM(quantite) FROM rollup_client_jour
+            WHERE jour BETWEEN %s AND %s GROUP BY jour ORDER BY jour""", (date(AUJ.year, 1, 1), AUJ)),
+        Requete("rapports.top_produits", """
+            SELECT p.nom_produit, SUM(r.quantite) AS q FROM rollup_produit_jour r
+            JOIN produit p ON p.id_produit = r.id_produit
+            WHERE r.jour BETWEEN %s AND %s GROUP BY r.id_produit, p.nom_produit ORDER BY q DESC LIMIT 20""",
+                (date(AUJ.year, 1, 1), AUJ),
+                autorise={"filesort"}),           # tri des agrégats (quelques centaines de lignes)
+        Requete("rapports.snapshot", "SELECT MAX(date_snap) FROM stock_snapshot WHERE date_snap <= %s", (MAINTENANT,)),
+        Requete("rapports.stock_a", """
+            SELECT p.code_produit, p.nom_produit, COALESCE(sn.quantite, 0) + COALESCE(mv.delta, 0)
+            FROM produit p
+            LEFT JOIN stock_snapshot sn ON sn.id_produit = p.id_produit AND sn.date_snap = %s
+            LEFT JOIN (SELECT id_produit, SUM(quantite) AS delta FROM mouvement_stock
+                       WHERE date_mvt > %s AND date_mvt <= %s GROUP BY id_produit) mv
+                   ON mv.id_produit = p.id_produit
+            ORDER BY p.nom_produit""", (MAINTENANT, MAINTENANT, MAINTENANT),
+                autorise={"filesort"}),           # regroupement des mouvements d'un intervalle
+        Requete("rapports.alertes", """
+            SELECT a.id_produit, p.code_produit, p.nom_produit, a.quantite, a.seuil, a.depuis
+            FROM alerte_stock a JOIN produit p ON p.id_produit = a.id_produit
+            ORDER BY a.quantite - a.seuil, p.nom_produit""",
+                autorise={"scan", "filesort"}),   # table des seules alertes ouvertes
+        # --- archive.py ---
+        Requete("archive.mouvements_mois", archive.SOURCES["mouvement_stock"].select,
+                (date(AUJ.year - 2, 1, 1), date(AUJ.year - 2, 2, 1), 2**31 - 1),
+                autorise={"filesort"}),           # tri par id d'un mois lu par date (tâche mensuelle)
+        Requete("archive.commandes_mois", archive.SOURCES["commande"].select,
+                (date(AUJ.year - 2, 1, 1), date(AUJ.year - 2, 2, 1), 2**31 - 1),
+                autorise={"filesort"}),
+        # --- Utilisateurs ---
+        Requete("utilisateurs.liste", "SELECT id_user, login, role FROM utilisateur ORDER BY login"),
+    ]
+
+
+def analyser(cur, req, min_rows):
+    """Retourne la liste des problèmes du plan de `req`."""
+    cur.execute(f"EXPLAIN {req.sql}", req.params)
+    problemes = []
+    for ligne in cur.fetchall():
+        table, acces, extra = ligne.get("table") or "", ligne.get("type"), ligne.get("Extra") or ""
+        lignes = ligne.get("rows") or 0
+        if table.startswith("<") or lignes < min_rows:
+            continue                    # tables dérivées / tables trop petites pour conclure
+        if acces == "ALL" and "scan" not in req.autorise:
+            problemes.append(f"parcours complet de {table} (~{lignes} lignes)")
+        if "Using filesort" in extra and "filesort" not in req.autorise:
+            problemes.append(f"filesort sur {table}")
+    return problemes
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Vérifie les plans d'exécution des requêtes des pages.")
+    parser.add_argument("--min-rows", type=int, default=1000,
+                        help="ignore les tables estimées à moins de N lignes (défaut : 1000)")
+    args = parser.parse_args(argv)
+
+    migrations.ensure_schema()
+    echecs = 0
+    with connection() as conn:
+        cur = conn.cursor(dictionary=True)
+        for req in requetes():
+            problemes = analyser(cur, req, args.min_rows)
+            echecs += bool(problemes)
+            print(f"{'ÉCHEC' if problemes else 'ok   '}  {req.nom}" + "".join(f"\n       - {p}" for p in problemes))
+    print(f"\n{echecs} requête(s) dégradée(s)" if echecs else "\nTous les plans utilisent un index.")
+    return 1 if echecs else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
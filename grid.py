@@ -0,0 +1,122 @@
+# Grille paginée côté serveur (pagination par clé, filtres et tri en SQL)
+from dataclasses import dataclass
+
+import streamlit as st
+
+import profiling
+from cache import versions
+from database import connection, versions_requises
+from utils.colonnes import requete
+
+COUNT_CAP = 10_000      # au-delà, le total est affiché comme « 10 000+ »
+
+
+@dataclass
+class Column:
+    name: str                   # alias dans le résultat
+    expr: str                   # expression SQL (non NULL si triable sans sort_expr)
+    label: str = None
+    sortable: bool = False
+    filter: str = None          # None | "text" (préfixe) | "choice"
+    choices: tuple = ()
+    sort_expr: str = None       # expression de tri non NULL quand expr peut l'être (COALESCE)
+
+    @property
+    def title(self):
+        return self.label or self.name
+
+    @property
+    def sort_key(self):
+        return self.sort_expr or self.expr
+
+
+@st.cache_data(show_spinner=False, max_entries=256)
+def _count(tables_version, sql, params):
+    with versions_requises(dict(tables_version)), connection(replica=True) as conn:
+        cur = conn.cursor()
+        cur.execute(f"SELECT COUNT(*) FROM ({sql} LIMIT {COUNT_CAP + 1}) t", params)
+        return cur.fetchone()[0]
+
+
+def paginated_grid(key, source, columns, id_expr, tables, default_sort=None,
+                   descending=False, where="", params=(), page_size=50, formatter=None):
+    """Affiche une page de `SELECT ... FROM source` et retourne son DataFrame.
+
+    La navigation mémorise, en session, la clé (valeur de tri, id) de la dernière
+    ligne de chaque page : chaque page est une recherche d'index bornée par LIMIT,
+    quel que soit son rang. `tables` étiquette le comptage mis en cache.
+    """
+    state = st.session_state.setdefault(f"grid_{key}", {"cursors": [], "signature": None})
+
+    # ---- Filtres / tri ----
+    filtres = [c for c in columns if c.filter]
+    triables = {c.title: c for c in columns if c.sortable}
+    cols = st.columns(len(filtres) + 2) if filtres or triables else []
+    conds, args = ([where], list(params)) if where else ([], list(params))
+    for col, c in zip(cols, filtres):
+        if c.filter == "choice":
+            val = col.selectbox(c.title, ("Tous",) + tuple(c.choices), key=f"{key}_f_{c.name}")
+            if val != "Tous":
+                conds.append(f"{c.expr} = %s"); args.append(val)
+        else:
+            val = col.text_input(c.title, key=f"{key}_f_{c.name}", placeholder="Commence par…").strip()
+            if val:
+                conds.append(f"{c.expr} LIKE %s"); args.append(val.replace("%", r"\%").replace("_", r"\_") + "%")
+
+    sort = triables.get(default_sort) or next(iter(triables.values()), None)
+    if triables:
+        labels = list(triables)
+        choix = cols[-2].selectbox("Trier par", labels, index=labels.index(sort.title), key=f"{key}_sort")
+        sort = triables[choix]
+        descending = cols[-1].toggle("Décroissant", value=descending, key=f"{key}_desc")
+
+    base_where = " AND ".join(conds) or "1=1"
+    signature = (base_where, tuple(args), sort.name if sort else None, descending)
+    if state["signature"] != signature:
+        state.update(cursors=[], signature=signature)
+
+    # ---- Requête de la page (keyset) ----
+    select = ", ".join(f"{c.expr} AS {c.name}" for c in columns)
+    op, direction = ("<", "DESC") if descending else (">", "ASC")
+    page_conds, page_args = [base_where], list(args)
+    if state["cursors"]:
+        last_sort, last_id = state["cursors"][-1]
+        if sort is None or sort.sort_key == id_expr:
+            page_conds.append(f"{id_expr} {op} %s"); page_args.append(last_id)
+        else:
+            page_conds.append(f"({sort.sort_key} {op} %s OR ({sort.sort_key} = %s AND {id_expr} {op} %s))")
+            page_args += [last_sort, last_sort, last_id]
+    order = f"{id_expr} {direction}" if sort is None or sort.sort_key == id_expr \
+        else f"{sort.sort_key} {direction}, {id_expr} {direction}"
+    # clés de pagination gardées en objets Python : elles repartent en paramètres SQL
+    df = requete(f"""
+        SELECT {select}, {id_expr} AS _grid_id{", " + sort.sort_key + " AS _grid_sort" if sort else ""}
+        FROM {source}
+        WHERE {" AND ".join(page_conds)}
+        ORDER BY {order}
+        LIMIT {page_size + 1}
+    """, tuple(page_args), bruts=("_grid_id", "_grid_sort"))
+
+    has_next = len(df) > page_size
+    df = df.iloc[:page_size]
+    total = _count(tuple(zip(tables, versions(tables))), f"SELECT 1 FROM {source} WHERE {base_where}", tuple(args))
+
+    # ---- Affichage ----
+    keys = list(zip(df["_grid_sort" if sort else "_grid_id"].tolist(), df["_grid_id"].tolist()))
+    df = df[[c.name for c in columns]]
+    shown = formatter(df.copy()) if formatter is not None else df
+    profiling.rendu(shown)
+    st.dataframe(shown.rename(columns={c.name: c.title for c in columns}),
+                 use_container_width=True, hide_index=True)
+
+    start = len(state["cursors"]) * page_size
+    total_txt = f"{COUNT_CAP:,}+".replace(",", " ") if total > COUNT_CAP else f"{total:,}".replace(",", " ")
+    nav_prev, nav_info, nav_next = st.columns([1, 3, 1])
+    nav_info.caption(f"Lignes {start + 1 if len(df) else 0}–{start + len(df)} sur {total_txt}")
+    if nav_prev.button("◀ Précédent", key=f"{key}_prev", disabled=not state["cursors"]):
+        state["cursors"].pop()
+        st.rerun()
+    if nav_next.button("Suivant ▶", key=f"{key}_next", disabled=not has_next):
+        state["cursors"].append(keys[-1])
+        st.rerun()
+    return df
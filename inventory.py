@@ -0,0 +1,173 @@
+# Mouvements de stock : écriture unitaire ou en masse, en une transaction
+from datetime import datetime
+
+import pandas as pd
+
+import alertes
+import lots
+import stock_history
+from cache import invalidate
+
+TYPES_MVT = ("Entrée", "Sortie", "Ajustement")
+BATCH_SIZE = 1_000
+COLONNES_IMPORT = ("code_produit", "type_mvt", "quantite")
+# + description, date_mvt, numero_lot, date_peremption (optionnelles)
+
+
+class MouvementError(Exception):
+    """Mouvements refusés ; `erreurs` = [(n° de ligne, message), ...]."""
+
+    def __init__(self, erreurs):
+        self.erreurs = erreurs
+        super().__init__("; ".join(msg for _, msg in erreurs[:5]))
+
+
+def quantite_signee(type_mvt, qty):
+    return -qty if type_mvt == "Sortie" else qty
+
+
+def _chunks(seq, size=BATCH_SIZE):
+    for i in range(0, len(seq), size):
+        yield seq[i:i + size]
+
+
+def appliquer_mouvements(conn, mouvements):
+    """Journalise les mouvements et met à jour le stock, ensemble (set-based).
+
+    `mouvements` : dicts {ligne, id_produit, type_mvt, quantite (signée),
+    description, date_mvt, numero_lot, date_peremption}. Les entrées vont au
+    lot indiqué (créé au besoin), les sorties sont prélevées en FEFO.
+    À appeler dans database.transaction() : en cas de stock insuffisant,
+    MouvementError est levée avant toute écriture.
+    """
+    if not mouvements:
+        return 0
+    cur = conn.cursor()
+
+    # 1. Delta net par produit, contrôlé contre le stock verrouillé
+    deltas = {}
+    for m in mouvements:
+        deltas[m["id_produit"]] = deltas.get(m["id_produit"], 0) + m["quantite"]
+    actuels = {}
+    ids = list(deltas)
+    for part in _chunks(ids):
+        cur.execute(f"""
+            SELECT id_produit, quantite FROM stock
+            WHERE id_produit IN ({", ".join(["%s"] * len(part))}) FOR UPDATE
+        """, part)
+        actuels.update(cur.fetchall())
+
+    erreurs = []
+    for m in mouvements:
+        pid = m["id_produit"]
+        if pid not in actuels and deltas[pid] < 0:
+            erreurs.append((m["ligne"], "Stock inexistant pour ce produit."))
+        elif actuels.get(pid, 0) + deltas[pid] < 0:
+            erreurs.append((m["ligne"], "Quantité insuffisante pour cette sortie."))
+    if erreurs:
+        raise MouvementError(erreurs)
+
+    # 2. Lots : entrées d'abord (disponibles pour les sorties du même envoi), puis sorties FEFO
+    ids_lots = lots.entrer(conn, [(m["id_produit"], m.get("numero_lot"), m.get("date_peremption"), m["quantite"])
+                                  for m in mouvements if m["quantite"] > 0])
+    allocations = lots.allouer_fefo(conn, [(i, m["id_produit"], -m["quantite"])
+                                           for i, m in enumerate(mouvements) if m["quantite"] < 0])
+
+    # 3. Journal (une ligne par lot touché) + stock, par paquets (INSERT multi-lignes)
+    maintenant = datetime.now()
+    journal = []
+    for i, m in enumerate(mouvements):
+        debut = (m["id_produit"], m.get("date_mvt") or maintenant, m["type_mvt"])
+        desc = m.get("description") or ""
+        if m["quantite"] > 0:
+            id_lot = ids_lots[(m["id_produit"], m.get("numero_lot") or lots.LOT_PAR_DEFAUT)]
+            journal.append((*debut, m["quantite"], desc, id_lot))
+        else:
+            journal += [(*debut, -q, desc, id_lot) for id_lot, q in allocations[i]]
+    for part in _chunks(journal):
+        cur.executemany("""
+            INSERT INTO mouvement_stock (id_produit, date_mvt, type_mvt, quantite, description, id_lot)
+            VALUES (%s,%s,%s,%s,%s,%s)
+        """, part)
+    for part in _chunks([(pid, d, maintenant) for pid, d in deltas.items()]):
+        cur.executemany("""
+            INSERT INTO stock (id_produit, quantite, maj) VALUES (%s,%s,%s)
+            ON DUPLICATE KEY UPDATE quantite = quantite + VALUES(quantite), maj = VALUES(maj)
+        """, part)
+    # mouvements saisis après coup : les instantanés déjà pris à leur date en tiennent compte
+    stock_history.reporter(conn, [(m["id_produit"], m["date_mvt"], m["quantite"])
+                                  for m in mouvements if m.get("date_mvt")])
+    # alertes de stock faible : seuls les produits touchés sont réévalués
+    alertes.mettre_a_jour(conn, {pid: actuels.get(pid, 0) + d for pid, d in deltas.items()})
+    invalidate(conn, "stock", "mouvement_stock", *lots.TABLES)
+    return len(mouvements)
+
+
+# -----------------------------------------------------
+# 📂 Import de fichier (CSV / XLSX)
+# -----------------------------------------------------
+def lire_fichier(fichier):
+    if fichier.name.lower().endswith((".xlsx", ".xls")):
+        return pd.read_excel(fichier, dtype={"code_produit": str})
+    return pd.read_csv(fichier, sep=None, engine="python", dtype={"code_produit": str})
+
+
+def preparer_import(conn, df):
+    """Valide toutes les lignes d'un coup ; retourne (mouvements, erreurs)."""
+    df = df.rename(columns=lambda c: str(c).strip().lower())
+    manquantes = [c for c in COLONNES_IMPORT if c not in df.columns]
+    if manquantes:
+        return [], [(0, f"Colonnes manquantes : {', '.join(manquantes)}")]
+
+    df = df.reset_index(drop=True)
+    df["ligne"] = df.index + 2                      # n° de ligne du fichier (en-tête = 1)
+    df["code_produit"] = df["code_produit"].astype(str).str.strip()
+    df["type_mvt"] = df["type_mvt"].astype(str).str.strip().str.capitalize().replace({"Entree": "Entrée"})
+    qty = pd.to_numeric(df["quantite"], errors="coerce")
+    dates = pd.to_datetime(df["date_mvt"], errors="coerce", dayfirst=True) if "date_mvt" in df else None
+    peremptions = (pd.to_datetime(df["date_peremption"], errors="coerce", dayfirst=True)
+                   if "date_peremption" in df else None)
+    numeros = (df["numero_lot"].fillna("").astype(str).str.strip().str[:40]
+               if "numero_lot" in df else pd.Series("", index=df.index))
+
+    # correspondance code -> id en une requête par lot
+    codes = df["code_produit"].unique().tolist()
+    ids = {}
+    cur = conn.cursor()
+    for part in _chunks(codes):
+        cur.execute(f"""
+            SELECT code_produit, id_produit FROM produit
+            WHERE code_produit IN ({", ".join(["%s"] * len(part))})
+        """, part)
+        ids.update(cur.fetchall())
+    df["id_produit"] = df["code_produit"].map(ids)
+
+    controles = [
+        (df["id_produit"].isna(), "Code produit inconnu"),
+        (~df["type_mvt"].isin(TYPES_MVT), "Type de mouvement invalide"),
+        (qty.isna() | (qty <= 0) | (qty % 1 != 0), "Quantité invalide (entier > 0 attendu)"),
+    ]
+    if dates is not None:
+        controles.append((df["date_mvt"].notna() & dates.isna(), "Date invalide"))
+        controles.append((dates > pd.Timestamp.now(), "Date future"))
+    if peremptions is not None:
+        controles.append((df["date_peremption"].notna() & peremptions.isna(), "Date de péremption invalide"))
+    erreurs = []
+    for masque, msg in controles:
+        erreurs += [(ligne, msg) for ligne in df.loc[masque, "ligne"]]
+    if erreurs:
+        return [], sorted(erreurs)
+
+    qty = qty.astype(int)
+    signee = qty.where(df["type_mvt"] != "Sortie", -qty)
+    desc = df["description"].fillna("").astype(str) if "description" in df else pd.Series("", index=df.index)
+    aucune = [None] * len(df)
+    mouvements = [
+        {"ligne": l, "id_produit": int(p), "type_mvt": t, "quantite": int(q), "description": d,
+         "date_mvt": None if dates is None or pd.isna(dt) else dt.to_pydatetime(),
+         "numero_lot": n or None, "date_peremption": None if pd.isna(per) else per.date()}
+        for l, p, t, q, d, dt, n, per in zip(df["ligne"], df["id_produit"], df["type_mvt"], signee, desc,
+                                             dates if dates is not None else aucune, numeros,
+                                             peremptions if peremptions is not None else aucune)
+    ]
+    return mouvements, []
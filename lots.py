@@ -0,0 +1,117 @@
+# Stock par lot : dates de péremption, calendrier indexé, sorties FEFO
+import os
+from collections import deque
+from datetime import date, datetime, timedelta
+
+import pandas as pd
+
+from cache import cached
+from utils.colonnes import requete
+
+SANS_PEREMPTION = date(9999, 12, 31)    # lots sans date connue : sortis en dernier
+LOT_PAR_DEFAUT = "SANS-LOT"             # entrées saisies sans n° de lot
+ALERTE_JOURS = int(os.getenv("PEREMPTION_ALERTE_JOURS", "90"))
+TABLES = ("lot",)
+_PAQUET = 500           # couples (produit, lot) par requête
+
+
+def entrer(conn, entrees):
+    """Ajoute des quantités aux lots, créés au besoin (dans la transaction appelante).
+
+    `entrees` : [(id_produit, numero_lot, date_peremption, quantite > 0), ...].
+    Un lot existant garde sa date de péremption. Retourne
+    {(id_produit, numero_lot): id_lot}.
+    """
+    if not entrees:
+        return {}
+    maintenant = datetime.now()
+    cur = conn.cursor()
+    cur.executemany("""
+        INSERT INTO lot (id_produit, numero_lot, date_peremption, quantite, maj) VALUES (%s,%s,%s,%s,%s)
+        ON DUPLICATE KEY UPDATE quantite = quantite + VALUES(quantite), maj = VALUES(maj)
+    """, [(pid, num or LOT_PAR_DEFAUT, per or SANS_PEREMPTION, qty, maintenant)
+          for pid, num, per, qty in entrees])
+    cles = list({(pid, num or LOT_PAR_DEFAUT) for pid, num, _, _ in entrees})
+    ids = {}
+    for i in range(0, len(cles), _PAQUET):
+        part = cles[i:i + _PAQUET]
+        cur.execute(f"""
+            SELECT id_produit, numero_lot, id_lot FROM lot
+            WHERE (id_produit, numero_lot) IN ({", ".join(["(%s, %s)"] * len(part))})
+        """, [v for cle in part for v in cle])
+        ids.update({(pid, num): id_lot for pid, num, id_lot in cur.fetchall()})
+    return ids
+
+
+def allouer_fefo(conn, sorties):
+    """Répartit des sorties sur les lots, le premier à périmer sortant le premier.
+
+    `sorties` : [(cle, id_produit, quantite > 0), ...] dans l'ordre de saisie.
+    Seuls les lots non épuisés des produits concernés sont lus et verrouillés
+    (index idx_lot_fefo), jamais tout l'historique des lots. Les quantités des
+    lots sont décrémentées en un UPDATE. Retourne {cle: [(id_lot, quantite), ...]} ;
+    la part éventuelle non couverte par un lot a id_lot None.
+    """
+    ids = sorted({pid for _, pid, _ in sorties})
+    if not ids:
+        return {}
+    cur = conn.cursor()
+    cur.execute(f"""
+        SELECT id_produit, id_lot, quantite FROM lot
+        WHERE id_produit IN ({", ".join(["%s"] * len(ids))}) AND actif = 1
+        ORDER BY id_produit, date_peremption, id_lot
+        FOR UPDATE
+    """, ids)
+    files = {}
+    for pid, id_lot, qty in cur.fetchall():
+        files.setdefault(pid, deque()).append([id_lot, qty])
+
+    allocations, pris = {}, {}
+    for cle, pid, qty in sorties:
+        parts = allocations.setdefault(cle, [])
+        file = files.get(pid) or deque()
+        while qty > 0 and file:
+            lot = file[0]
+            n = min(qty, lot[1])
+            parts.append((lot[0], n))
+            pris[lot[0]] = pris.get(lot[0], 0) + n
+            lot[1] -= n
+            qty -= n
+            if lot[1] == 0:
+                file.popleft()
+        if qty > 0:
+            parts.append((None, qty))
+
+    if pris:
+        cas = " ".join(["WHEN %s THEN %s"] * len(pris))
+        cur.execute(f"""
+            UPDATE lot SET quantite = quantite - CASE id_lot {cas} END, maj = %s
+            WHERE id_lot IN ({", ".join(["%s"] * len(pris))})
+        """, [v for item in pris.items() for v in item] + [datetime.now()] + list(pris))
+    return allocations
+
+
+# -----------------------------------------------------
+# 🗓️ Calendrier des péremptions (index idx_lot_peremption)
+# -----------------------------------------------------
+@cached("lot", "produit")
+def a_perimer(jour, jours=ALERTE_JOURS):
+    """Lots non épuisés périmant au plus tard `jours` jours après `jour` (déjà périmés inclus)."""
+    df = requete("""
+        SELECT l.date_peremption, p.code_produit, p.nom_produit, l.numero_lot, l.quantite
+        FROM lot l JOIN produit p ON p.id_produit = l.id_produit
+        WHERE l.actif = 1 AND l.date_peremption <= %s
+        ORDER BY l.date_peremption, l.id_lot
+    """, (jour + timedelta(days=jours),))
+    df["jours_restants"] = (pd.to_datetime(df["date_peremption"]) - pd.Timestamp(jour)).dt.days
+    return df.astype({"quantite": "int64", "jours_restants": "int64"})
+
+
+@cached("lot")
+def lots_produit(id_produit):
+    """Lots non épuisés d'un produit, dans l'ordre de sortie FEFO."""
+    return requete("""
+        SELECT numero_lot, date_peremption, quantite FROM lot
+        WHERE id_produit = %s AND actif = 1
+        ORDER BY date_peremption, id_lot
+    """, (id_produit,), replica=False)
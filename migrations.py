@@ -0,0 +1,417 @@
+# Migrations versionnées du schéma cadmeko (tables + index des requêtes chaudes)
+import sys
+import threading
+
+from database import DB_CONFIG, connection
+
+# -----------------------------------------------------
+# 🧱 Étapes : chaînes SQL ou fonctions f(cur)
+# -----------------------------------------------------
+BASE = [
+    """
+    CREATE TABLE IF NOT EXISTS produit (
+        id_produit      INT AUTO_INCREMENT PRIMARY KEY,
+        code_produit    VARCHAR(20) NOT NULL,
+        nom_produit     VARCHAR(100) NOT NULL,
+        forme           VARCHAR(50),
+        dosage          VARCHAR(50),
+        date_peremption DATE,
+        prix_unitaire   DECIMAL(12,2) NOT NULL DEFAULT 0
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS stock (
+        id_produit INT PRIMARY KEY,
+        quantite   INT NOT NULL DEFAULT 0,
+        maj        DATETIME,
+        FOREIGN KEY (id_produit) REFERENCES produit (id_produit)
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS client (
+        id_client  INT AUTO_INCREMENT PRIMARY KEY,
+        nom_client VARCHAR(100) NOT NULL
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS fournisseur (
+        id_fournisseur  INT AUTO_INCREMENT PRIMARY KEY,
+        nom_fournisseur VARCHAR(100) NOT NULL
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS commande (
+        id_commande   INT AUTO_INCREMENT PRIMARY KEY,
+        code_commande VARCHAR(30) NOT NULL,
+        date_commande DATE NOT NULL,
+        statut        VARCHAR(20) NOT NULL DEFAULT 'En attente',
+        id_client     INT NOT NULL,
+        FOREIGN KEY (id_client) REFERENCES client (id_client)
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS commande_detail (
+        id_detail     INT AUTO_INCREMENT PRIMARY KEY,
+        id_commande   INT NOT NULL,
+        id_produit    INT NOT NULL,
+        quantite_dmd  INT NOT NULL,
+        quantite_livr INT NOT NULL DEFAULT 0,
+        FOREIGN KEY (id_commande) REFERENCES commande (id_commande),
+        FOREIGN KEY (id_produit) REFERENCES produit (id_produit)
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS mouvement_stock (
+        id_mvt      INT AUTO_INCREMENT PRIMARY KEY,
+        id_produit  INT NOT NULL,
+        date_mvt    DATETIME NOT NULL,
+        type_mvt    VARCHAR(20) NOT NULL,
+        quantite    INT NOT NULL,
+        description VARCHAR(255),
+        FOREIGN KEY (id_produit) REFERENCES produit (id_produit)
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS utilisateur (
+        id_user  INT AUTO_INCREMENT PRIMARY KEY,
+        login    VARCHAR(50) NOT NULL,
+        pwd_hash VARCHAR(255) NOT NULL,
+        role     VARCHAR(30) NOT NULL
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+    """,
+]
+
+APPLICATION = [
+    # cache.py : versions des tables
+    """
+    CREATE TABLE IF NOT EXISTS table_version (
+        nom     VARCHAR(64) PRIMARY KEY,
+        version BIGINT UNSIGNED NOT NULL DEFAULT 0
+    )
+    """,
+    # sequences.py : numérotation des commandes
+    """
+    CREATE TABLE IF NOT EXISTS sequence_commande (
+        jour    DATE PRIMARY KEY,
+        dernier INT UNSIGNED NOT NULL
+    )
+    """,
+    # rollups.py : agrégats journaliers
+    """
+    CREATE TABLE IF NOT EXISTS rollup_produit_jour (
+        jour       DATE NOT NULL,
+        id_produit INT NOT NULL,
+        quantite   BIGINT NOT NULL DEFAULT 0,
+        nb_lignes  INT NOT NULL DEFAULT 0,
+        PRIMARY KEY (jour, id_produit)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS rollup_client_jour (
+        jour         DATE NOT NULL,
+        id_client    INT NOT NULL,
+        nb_commandes INT NOT NULL DEFAULT 0,
+        quantite     BIGINT NOT NULL DEFAULT 0,
+        PRIMARY KEY (jour, id_client)
+    )
+    """,
+    # stock_history.py : instantanés
+    """
+    CREATE TABLE IF NOT EXISTS stock_snapshot (
+        date_snap  DATETIME NOT NULL,
+        id_produit INT NOT NULL,
+        quantite   INT NOT NULL,
+        PRIMARY KEY (date_snap, id_produit),
+        KEY idx_snapshot_produit (id_produit, date_snap)
+    )
+    """,
+]
+
+
+def _index(table, name, columns, unique=False):
+    """Étape : crée l'index sauf si un index existant commence déjà par ces colonnes."""
+    def step(cur):
+        cur.execute("""
+            SELECT INDEX_NAME, GROUP_CONCAT(COLUMN_NAME ORDER BY SEQ_IN_INDEX)
+            FROM information_schema.STATISTICS
+            WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s
+            GROUP BY INDEX_NAME
+        """, (table,))
+        voulu = ",".join(columns)
+        if any(f"{cols},".startswith(f"{voulu},") for _, cols in cur.fetchall()):
+            return
+        cur.execute(f"CREATE {'UNIQUE ' if unique else ''}INDEX {name} ON {table} ({', '.join(columns)})")
+    step.__doc__ = f"index {table}({', '.join(columns)})"
+    return step
+
+
+def _colonne(table, name, definition):
+    """Étape : ajoute la colonne si elle n'existe pas encore."""
+    def step(cur):
+        cur.execute("""
+            SELECT COUNT(*) FROM information_schema.COLUMNS
+            WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND COLUMN_NAME = %s
+        """, (table, name))
+        if not cur.fetchone()[0]:
+            cur.execute(f"ALTER TABLE {table} ADD COLUMN {name} {definition}")
+    step.__doc__ = f"colonne {table}.{name}"
+    return step
+
+
+INDEX_CHAUDS = [
+    _index("commande", "idx_commande_date", ["date_commande", "id_commande"]),   # historique, rapports, séquence
+    _index("commande", "idx_commande_code", ["code_commande"]),
+    _index("commande", "idx_commande_client", ["id_client"]),
+    _index("commande_detail", "idx_detail_commande", ["id_commande"]),
+    _index("commande_detail", "idx_detail_produit", ["id_produit"]),
+    _index("stock", "uq_stock_produit", ["id_produit"], unique=True),           # ON DUPLICATE KEY
+    _index("utilisateur", "uq_utilisateur_login", ["login"], unique=True),
+    _index("mouvement_stock", "idx_mvt_produit_date", ["id_produit", "date_mvt"]),
+    _index("mouvement_stock", "idx_mvt_date", ["date_mvt"]),                   # stock à une date
+    _index("produit", "idx_produit_code", ["code_produit"]),
+    _index("produit", "idx_produit_nom", ["nom_produit"]),                    # listes triées par nom
+    _index("client", "idx_client_nom", ["nom_client"]),
+]
+
+
+def _reprise_agregats(cur):
+    """reprise de l'historique dans les agrégats"""
+    import rollups
+    rollups.rattraper()
+
+
+def _reprise_lots(cur):
+    """stock existant → un lot INITIAL par produit, à la date de péremption du produit"""
+    cur.execute("""
+        INSERT IGNORE INTO lot (id_produit, numero_lot, date_peremption, quantite, maj)
+        SELECT s.id_produit, 'INITIAL', COALESCE(p.date_peremption, '9999-12-31'), s.quantite, NOW()
+        FROM stock s JOIN produit p ON p.id_produit = s.id_produit
+        WHERE s.quantite > 0
+    """)
+
+
+LOTS = [
+    # lots.py : stock par lot ; `actif` exclut les lots épuisés des index
+    """
+    CREATE TABLE IF NOT EXISTS lot (
+        id_lot          INT AUTO_INCREMENT PRIMARY KEY,
+        id_produit      INT NOT NULL,
+        numero_lot      VARCHAR(40) NOT NULL,
+        date_peremption DATE NOT NULL,
+        quantite        INT NOT NULL DEFAULT 0,
+        actif           TINYINT AS (quantite > 0) STORED,
+        maj             DATETIME,
+        UNIQUE KEY uq_lot_produit_numero (id_produit, numero_lot),
+        KEY idx_lot_fefo (id_produit, actif, date_peremption),
+        KEY idx_lot_peremption (actif, date_peremption),
+        FOREIGN KEY (id_produit) REFERENCES produit (id_produit)
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+    """,
+    _colonne("mouvement_stock", "id_lot", "INT NULL"),
+    _index("mouvement_stock", "idx_mvt_lot", ["id_lot"]),
+    _reprise_lots,
+]
+
+
+RECHERCHE = [
+    # recherche.py : relecture des seuls produits modifiés
+    _colonne("produit", "maj", "TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP"),
+    _index("produit", "idx_produit_maj", ["maj"]),
+]
+
+
+def _reprise_alertes(cur):
+    """alertes ouvertes d'après le stock actuel et le seuil par défaut"""
+    cur.execute("""
+        INSERT IGNORE INTO alerte_stock (id_produit, quantite, seuil, depuis)
+        SELECT p.id_produit, COALESCE(s.quantite, 0), p.seuil_alerte, NOW()
+        FROM produit p LEFT JOIN stock s ON s.id_produit = p.id_produit
+        WHERE COALESCE(s.quantite, 0) <= p.seuil_alerte
+    """)
+
+
+ALERTES = [
+    # alertes.py : seuil de réapprovisionnement par produit ; une ligne par alerte ouverte
+    _colonne("produit", "seuil_alerte", "INT NOT NULL DEFAULT 10"),
+    """
+    CREATE TABLE IF NOT EXISTS alerte_stock (
+        id_produit INT PRIMARY KEY,
+        quantite   INT NOT NULL,
+        seuil      INT NOT NULL,
+        depuis     DATETIME NOT NULL,
+        FOREIGN KEY (id_produit) REFERENCES produit (id_produit)
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+    """,
+    _reprise_alertes,
+]
+
+
+SYNCHRO = [
+    # synchro.py : horodatage d'insertion (capture des changements), commandes reçues des dépôts
+    _colonne("mouvement_stock", "saisi_le", "TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP"),
+    _colonne("commande", "saisi_le", "TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP"),
+    _colonne("commande", "origine", "VARCHAR(40) NULL"),
+    _colonne("commande", "id_origine", "INT NULL"),
+    _index("commande", "uq_commande_origine", ["origine", "id_origine"], unique=True),
+    # positions d'échange : dernier élément envoyé à chaque nœud, dernier reçu de chaque nœud
+    """
+    CREATE TABLE IF NOT EXISTS sync_envoye (
+        destination VARCHAR(40) NOT NULL,
+        flux        VARCHAR(40) NOT NULL,
+        position    VARCHAR(64) NOT NULL,
+        maj         DATETIME NOT NULL,
+        PRIMARY KEY (destination, flux)
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS sync_recu (
+        origine  VARCHAR(40) NOT NULL,
+        flux     VARCHAR(40) NOT NULL,
+        position VARCHAR(64) NOT NULL,
+        maj      DATETIME NOT NULL,
+        PRIMARY KEY (origine, flux)
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+    """,
+    # central : mouvements et stock de chaque dépôt (le stock du central reste le sien)
+    """
+    CREATE TABLE IF NOT EXISTS mouvement_site (
+        origine     VARCHAR(40) NOT NULL,
+        id_origine  INT NOT NULL,
+        id_produit  INT NOT NULL,
+        date_mvt    DATETIME NOT NULL,
+        type_mvt    VARCHAR(20) NOT NULL,
+        quantite    INT NOT NULL,
+        description VARCHAR(255),
+        numero_lot  VARCHAR(40),
+        recu_le     DATETIME NOT NULL,
+        PRIMARY KEY (origine, id_origine),
+        KEY idx_mvt_site_produit (id_produit, date_mvt),
+        FOREIGN KEY (id_produit) REFERENCES produit (id_produit)
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS stock_site (
+        origine    VARCHAR(40) NOT NULL,
+        id_produit INT NOT NULL,
+        quantite   INT NOT NULL DEFAULT 0,
+        maj        DATETIME NOT NULL,
+        PRIMARY KEY (origine, id_produit),
+        FOREIGN KEY (id_produit) REFERENCES produit (id_produit)
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS sync_conflit (
+        id_conflit BIGINT AUTO_INCREMENT PRIMARY KEY,
+        origine    VARCHAR(40) NOT NULL,
+        flux       VARCHAR(40) NOT NULL,
+        reference  VARCHAR(64) NOT NULL,
+        message    VARCHAR(255) NOT NULL,
+        le         DATETIME NOT NULL,
+        KEY idx_conflit_le (le)
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+    """,
+]
+
+
+ARCHIVES = [
+    # archive.py : un fichier Parquet par table et par mois archivé
+    """
+    CREATE TABLE IF NOT EXISTS archive_periode (
+        nom_table  VARCHAR(40) NOT NULL,
+        mois       DATE NOT NULL,
+        fichier    VARCHAR(255) NOT NULL,
+        lignes     INT NOT NULL,
+        elements   INT NOT NULL,
+        archive_le DATETIME NOT NULL,
+        PRIMARY KEY (nom_table, mois)
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+    """,
+]
+
+
+# (version, description, étapes) — ne jamais modifier une migration publiée
+MIGRATIONS = [
+    (1, "Schéma de base cadmeko", BASE),
+    (2, "Index des requêtes chaudes", INDEX_CHAUDS),
+    (3, "Tables applicatives (cache, séquences, agrégats, instantanés)", APPLICATION),
+    (4, "Reprise des agrégats journaliers", [_reprise_agregats]),
+    (5, "Stock par lot et calendrier des péremptions", LOTS),
+    (6, "Date de modification des produits (index de recherche)", RECHERCHE),
+    (7, "Seuils de réapprovisionnement et alertes de stock", ALERTES),
+    (8, "Synchronisation multi-sites", SYNCHRO),
+    (9, "Archivage Parquet des périodes closes", ARCHIVES),
+]
+DERNIERE = MIGRATIONS[-1][0]
+
+_lock = threading.Lock()
+_a_jour = False
+
+
+def version_courante(cur):
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version     INT PRIMARY KEY,
+            description VARCHAR(255) NOT NULL,
+            applique_le DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    cur.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version")
+    return cur.fetchone()[0]
+
+
+def migrer(log=print):
+    """Applique les migrations manquantes, dans l'ordre.
+
+    Un verrou nommé MySQL empêche deux processus de migrer en même temps.
+    Les DDL MySQL ne sont pas transactionnels : chaque étape est idempotente,
+    et la version n'est enregistrée qu'une fois toutes ses étapes passées.
+    """
+    with connection() as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT GET_LOCK('cadmeko_migrations', 60)")
+        if cur.fetchone()[0] != 1:
+            raise RuntimeError("Verrou de migration indisponible")
+        try:
+            courante = version_courante(cur)
+            for version, description, etapes in MIGRATIONS:
+                if version <= courante:
+                    continue
+                log(f"→ {version:03d} {description}")
+                for etape in etapes:
+                    if callable(etape):
+                        etape(cur)
+                    else:
+                        cur.execute(etape)
+                cur.execute("INSERT INTO schema_version (version, description) VALUES (%s, %s)",
+                            (version, description))
+        finally:
+            cur.execute("SELECT RELEASE_LOCK('cadmeko_migrations')")
+            cur.fetchone()
+
+
+def ensure_schema():
+    """Migre au premier appel du processus ; ensuite, ne coûte rien."""
+    global _a_jour
+    if _a_jour:
+        return
+    with _lock:
+        if _a_jour:
+            return
+        with connection() as conn:
+            cur = conn.cursor()
+            a_jour = version_courante(cur) >= DERNIERE
+        if not a_jour:
+            migrer(log=lambda msg: None)
+        _a_jour = True
+
+
+if __name__ == "__main__":
+    # python migrations.py            → applique les migrations
+    # python migrations.py --status   → affiche la version courante
+    if "--status" in sys.argv:
+        with connection() as conn:
+            v = version_courante(conn.cursor())
+        print(f"{DB_CONFIG['database']} : version {v} / {DERNIERE}")
+    else:
+        migrer()
+        print("Schéma à jour.")
@@ -0,0 +1,77 @@
+# Commandes : enregistrement d'un panier en une transaction
+from datetime import date, datetime
+
+import alertes
+import lots
+import rollups
+from cache import invalidate
+from sequences import code_commande
+
+STATUTS = ("En attente", "Livrée", "Annulée")
+
+
+class StockInsuffisant(Exception):
+    """Au moins une ligne dépasse le stock disponible au moment du COMMIT."""
+
+    def __init__(self, manquants):
+        self.manquants = manquants          # {id_produit: (demandé, disponible)}
+        super().__init__("Stock insuffisant pour " + ", ".join(str(p) for p in manquants))
+
+
+def enregistrer_commande(conn, id_client, lignes, statut="En attente", code=None):
+    """Écrit l'en-tête, toutes les lignes et les décréments de stock.
+
+    `lignes` : [(id_produit, quantite), ...]. Le stock des produits concernés est
+    verrouillé puis contrôlé en une requête ; s'il manque quoi que ce soit,
+    StockInsuffisant est levée avant toute écriture et la transaction appelante
+    (database.transaction) est annulée. Retourne (id_commande, code_commande).
+    `code` : réservé par l'appelant avant sa transaction (sequences.code_commande) ;
+    à défaut, réservé sur `conn`, dont la transaction garde alors le compteur
+    du jour verrouillé jusqu'au COMMIT.
+    """
+    cur = conn.cursor()
+    demandes = {}
+    for pid, qty in lignes:
+        demandes[pid] = demandes.get(pid, 0) + qty
+    ids = list(demandes)
+    cur.execute(f"""
+        SELECT id_produit, quantite FROM stock
+        WHERE id_produit IN ({", ".join(["%s"] * len(ids))}) FOR UPDATE
+    """, ids)
+    dispo = dict(cur.fetchall())
+    manquants = {pid: (qty, dispo.get(pid, 0)) for pid, qty in demandes.items() if dispo.get(pid, 0) < qty}
+    if manquants:
+        raise StockInsuffisant(manquants)
+
+    jour = date.today()
+    code = code or code_commande(jour, conn)
+    cur.execute("""
+        INSERT INTO commande (code_commande, date_commande, statut, id_client)
+        VALUES (%s,%s,%s,%s)
+    """, (code, jour, statut, id_client))
+    id_commande = cur.lastrowid
+
+    cur.executemany("""
+        INSERT INTO commande_detail (id_commande,id_produit,quantite_dmd,quantite_livr)
+        VALUES (%s,%s,%s,0)
+    """, [(id_commande, pid, qty) for pid, qty in lignes])
+    # un seul UPDATE pour tous les produits (lignes déjà verrouillées et contrôlées)
+    maintenant = datetime.now()
+    cas = " ".join(["WHEN %s THEN %s"] * len(demandes))
+    cur.execute(f"""
+        UPDATE stock SET quantite = quantite - CASE id_produit {cas} END, maj = %s
+        WHERE id_produit IN ({", ".join(["%s"] * len(ids))})
+    """, [v for item in demandes.items() for v in item] + [maintenant] + ids)
+    # prélèvement FEFO sur les lots non épuisés des seuls produits commandés
+    allocations = lots.allouer_fefo(conn, [(pid, pid, qty) for pid, qty in demandes.items()])
+    # sorties journalisées par lot : le journal reste la source de l'historique du stock
+    cur.executemany("""
+        INSERT INTO mouvement_stock (id_produit, date_mvt, type_mvt, quantite, description, id_lot)
+        VALUES (%s,%s,'Sortie',%s,%s,%s)
+    """, [(pid, maintenant, -q, f"Commande {code}", id_lot)
+          for pid in demandes for id_lot, q in allocations[pid]])
+
+    rollups.enregistrer(conn, jour, id_client, lignes)
+    alertes.mettre_a_jour(conn, {pid: dispo[pid] - qty for pid, qty in demandes.items()})
+    invalidate(conn, "commande", "commande_detail", "stock", "mouvement_stock", *lots.TABLES)
+    return id_commande, code
@@ -1,16 +1,27 @@
+import hashlib
 import streamlit as st
+import profiling
 import pandas as pd
-import pathlib
-from database import get_connection
+import alertes
+import catalogue
+from database import transaction
 from security import login_user, require_role
+from cache import invalidate
+from grid import Column, paginated_grid
+from utils.colonnes import dates, montants
+from utils.export import export_widget
 from datetime import date
+from utils import inject_styles
 
+profiling.debut_page("Produits")
+profiling.etape("authentification")
 login_user()
 require_role(["Administrateur", "Gestionnaire", "Pharmacien"])
 
-st.markdown(f"<style>{pathlib.Path('assets/styles.css').read_text()}</style>", unsafe_allow_html=True)
+inject_styles()
 
 st.title("🏷️ Gestion des Produits")
+profiling.etape("formulaire")
 
 # -----------------------------------------------------
 # 🔸 FORMULAIRE D’AJOUT DE PRODUIT
@@ -24,61 +35,117 @@ with st.expander("➕ Ajouter un nouveau produit", expanded=True):
         dosage = col2.text_input("Dosage", placeholder="Ex : 500 mg, 1g")
         date_peremption = col3.date_input("Date de péremption", min_value=date.today())
         prix   = col3.number_input("Prix unitaire (CDF)", step=100.0, min_value=0.0, format="%.2f")
+        seuil  = col3.number_input("Seuil d’alerte (stock)", min_value=0, step=1, value=alertes.SEUIL_DEFAUT)
 
         if st.form_submit_button("💾 Enregistrer le produit"):
             try:
-                conn = get_connection()
-                cur = conn.cursor()
-                cur.execute("""
-                    INSERT INTO produit 
-                    (code_produit, nom_produit, forme, dosage, date_peremption, prix_unitaire)
-                    VALUES (%s, %s, %s, %s, %s, %s)
-                """, (code, nom, forme, dosage, date_peremption, prix))
-                conn.commit()
+                with transaction() as conn:
+                    cur = conn.cursor()
+                    cur.execute("""
+                        INSERT INTO produit 
+                        (code_produit, nom_produit, forme, dosage, date_peremption, prix_unitaire, seuil_alerte)
+                        VALUES (%s, %s, %s, %s, %s, %s, %s)
+                    """, (code, nom, forme, dosage, date_peremption, prix, seuil))
+                    alertes.recalculer(conn, [cur.lastrowid])       # pas encore de stock : alerte ouverte
+                    invalidate(conn, "produit")
                 st.success("✅ Produit enregistré avec succès")
             except Exception as e:
                 st.error(f"❌ Erreur : {e}")
-            finally:
-                conn.close()
+
+# -----------------------------------------------------
+# 📂 IMPORT D’UN CATALOGUE (CSV / XLSX)
+# -----------------------------------------------------
+profiling.etape("import catalogue")
+with st.expander("📂 Importer un catalogue fournisseur (CSV / XLSX)"):
+    st.caption("Colonnes : code_produit, nom_produit ; forme, dosage, date_peremption, prix_unitaire, "
+               "seuil_alerte (optionnelles, cellule vide = valeur inchangée). Les codes existants sont mis "
+               "à jour, les autres créés. Une seule ligne invalide bloque l'import.")
+    fichier = st.file_uploader("Fichier catalogue", type=["csv", "xlsx"], key="import_catalogue")
+    if fichier is not None:
+        # contrôle et simulation faits une fois par contenu, pas à chaque rerun (un fichier
+        # corrigé puis renvoyé sous le même nom et de même taille est bien réanalysé)
+        empreinte = hashlib.sha256(fichier.getvalue()).hexdigest()
+        analyse = st.session_state.get("catalogue_analyse")
+        if analyse is None or analyse[0] != empreinte:
+            try:
+                with st.spinner("Contrôle du fichier…"):
+                    n_lignes, erreurs = catalogue.analyser(fichier)
+                    apercu = None if erreurs else catalogue.importer(fichier, simulation=True)
+            except Exception as e:
+                st.error(f"Fichier illisible : {e}")
+                profiling.fin_page()
+                st.stop()
+            analyse = (empreinte, n_lignes, erreurs, apercu)
+            st.session_state["catalogue_analyse"] = analyse
+        _, n_lignes, erreurs, apercu = analyse
+
+        if erreurs:
+            st.error(f"❌ {len(erreurs)} erreur(s) : rien n'a été importé.")
+            st.dataframe(pd.DataFrame(erreurs, columns=["Ligne", "Erreur"]), hide_index=True,
+                         use_container_width=True)
+        else:
+            col1, col2, col3 = st.columns(3)
+            col1.metric("Nouveaux", apercu["ajoutes"])
+            col2.metric("Modifiés", apercu["modifies"])
+            col3.metric("Inchangés", apercu["inchanges"])
+            if apercu["changements"]:
+                st.dataframe(pd.DataFrame(apercu["changements"]).astype({"Avant": str, "Après": str}),
+                             hide_index=True, use_container_width=True, height=250)
+            if st.button("💾 Appliquer l'import", key="apply_catalogue",
+                         disabled=not (apercu["ajoutes"] or apercu["modifies"])):
+                barre = st.progress(0.0)
+                try:
+                    resume = catalogue.importer(
+                        fichier, progression=lambda n: barre.progress(min(n / max(n_lignes, 1), 1.0)))
+                    st.success(f"✅ {resume['ajoutes']} produit(s) ajouté(s), {resume['modifies']} modifié(s), "
+                               f"{resume['inchanges']} inchangé(s).")
+                except Exception as e:
+                    st.error(f"Erreur : {e} (les paquets déjà traités restent enregistrés)")
+                st.session_state.pop("catalogue_analyse", None)
 
 # -----------------------------------------------------
 # 🔍 AFFICHAGE DES PRODUITS
 # -----------------------------------------------------
 st.divider()
 st.subheader("📋 Liste des produits enregistrés")
+profiling.etape("liste")
 
-# Chargement des données
-conn = get_connection()
-cursor = conn.cursor(dictionary=True)
-cursor.execute("SELECT * FROM produit ORDER BY id_produit DESC")
-rows = cursor.fetchall()
-conn.close()
-
-if rows:
-    df = pd.DataFrame(rows)
-    
-    # 👁️ Formatage affichage
-    df["prix_unitaire"] = df["prix_unitaire"].apply(lambda x: f"{x:,.0f} CDF".replace(",", " "))
-    df["date_peremption"] = pd.to_datetime(df["date_peremption"]).dt.strftime("%d/%m/%Y")
+# 👁️ Formatage affichage
+def formater(df):
+    df["prix_unitaire"] = montants(df["prix_unitaire"])
+    df["date_peremption"] = dates(df["date_peremption"])
+    return df
 
-    st.data_editor(df, use_container_width=True, disabled=True, hide_index=True, height=400)
+# Pagination, filtres et tri exécutés par MySQL : seule la page affichée est chargée
+page = paginated_grid(
+    "produits", "produit",
+    [
+        Column("id_produit", "id_produit", "ID", sortable=True),
+        Column("code_produit", "code_produit", "Code", sortable=True, filter="text"),
+        Column("nom_produit", "nom_produit", "Nom", sortable=True, filter="text"),
+        Column("forme", "forme", "Forme", filter="text"),
+        Column("dosage", "dosage", "Dosage"),
+        # date facultative : tri sur une valeur non NULL, sans date en dernier
+        Column("date_peremption", "date_peremption", "Péremption", sortable=True,
+               sort_expr="COALESCE(date_peremption, '9999-12-31')"),
+        Column("prix_unitaire", "prix_unitaire", "Prix unitaire", sortable=True),
+        Column("seuil_alerte", "seuil_alerte", "Seuil d’alerte"),
+    ],
+    id_expr="id_produit", tables=("produit",), default_sort="ID", descending=True,
+    formatter=formater,
+)
 
+if not page.empty:
     # -----------------------------------------------------
     # ⬇️ EXPORTS
     # -----------------------------------------------------
+    profiling.etape("export")
     st.markdown("### 📤 Exporter les données")
 
-    col1, col2 = st.columns(2)
-    with col1:
-        csv = df.to_csv(index=False).encode("utf-8")
-        st.download_button(
-            label="⬇️ Télécharger en CSV",
-            data=csv,
-            file_name="produits.csv",
-            mime="text/csv",
-            use_container_width=True,
-            help="Exporter la liste des produits au format CSV"
-        )
+    # Le catalogue complet n'est lu que sur demande, en flux
+    export_widget("export_produits", "SELECT * FROM produit ORDER BY id_produit DESC",
+                  filename="produits", formatter=formater, tables=("produit",))
 else:
     st.info("Aucun produit enregistré.")
 
+profiling.fin_page()
@@ -1,53 +1,92 @@
+import hashlib
 import streamlit as st
-from datetime import datetime
+import profiling
 import pandas as pd
-import pathlib
-from database import get_connection
+from datetime import date, timedelta
+from database import connection, transaction
 from security import login_user, require_role
+import lots
+import stock_history
+from inventory import MouvementError, appliquer_mouvements, lire_fichier, preparer_import, quantite_signee
+from grid import Column, paginated_grid
+from recherche import champ_recherche, libelle
+from utils import inject_styles
+from utils.colonnes import dates
+
+profiling.debut_page("Stock")
 
 # Authentification et styles
+profiling.etape("authentification")
 login_user()
 require_role(["Administrateur", "Gestionnaire", "Pharmacien"])
-st.markdown(f"<style>{pathlib.Path('assets/styles.css').read_text()}</style>", unsafe_allow_html=True)
+inject_styles()
 
 st.title("📦 Gestion du Stock")
 
 # -----------------------------------------------
 # 🔍 1. Tableau interactif des stocks
 # -----------------------------------------------
-@st.cache_data(ttl=60)
-def fetch_stock():
-    conn = get_connection()
-    cur = conn.cursor(dictionary=True)
-    cur.execute("""
-        SELECT p.code_produit, p.nom_produit,
-               COALESCE(s.quantite,0) AS quantite,
-               s.maj AS maj
-        FROM produit p
-        LEFT JOIN stock s ON s.id_produit = p.id_produit
-        ORDER BY p.nom_produit
-    """)
-    rows = cur.fetchall()
-    conn.close()
-    return rows
-
 st.subheader("📊 État actuel du stock")
+profiling.etape("état du stock")
+
+def formater(df):
+    df["maj"] = dates(df["maj"], "%d/%m/%Y %H:%M")
+    return df
+
+paginated_grid(
+    "stock", "produit p LEFT JOIN stock s ON s.id_produit = p.id_produit",
+    [
+        Column("code_produit", "p.code_produit", "Code", sortable=True, filter="text"),
+        Column("nom_produit", "p.nom_produit", "Produit", sortable=True, filter="text"),
+        Column("quantite", "COALESCE(s.quantite,0)", "Quantité", sortable=True),
+        Column("maj", "s.maj", "Dernière mise à jour"),
+    ],
+    id_expr="p.id_produit", tables=("produit", "stock"), default_sort="Produit",
+    formatter=formater,
+)
 
-stock_rows = fetch_stock()
-
-if stock_rows:
-    df = pd.DataFrame(stock_rows)
-    df["maj"] = pd.to_datetime(df["maj"]).dt.strftime("%d/%m/%Y %H:%M")
-    df.rename(columns={
-        "code_produit": "Code",
-        "nom_produit": "Produit",
-        "quantite": "Quantité",
-        "maj": "Dernière mise à jour"
-    }, inplace=True)
+# -----------------------------------------------
+# 📈 Évolution du stock d'un produit (instantané + mouvements)
+# -----------------------------------------------
+profiling.etape("évolution")
+stock_history.snapshot_si_necessaire()
+with st.expander("📈 Évolution du stock d'un produit"):
+    produits_hist = champ_recherche("recherche_hist")
+    if produits_hist:
+        choix = {libelle(p): p["id_produit"] for p in produits_hist}
+        col1, col2, col3 = st.columns([2, 1, 1])
+        label = col1.selectbox("Produit", list(choix.keys()), key="hist_produit")
+        # pas de courbe avant le premier instantané : le stock initial n'est pas journalisé
+        premier = stock_history.premier_jour() or date.today()
+        debut = col2.date_input("Du", value=max(date.today() - timedelta(days=90), premier), min_value=premier,
+                                key="hist_debut")
+        fin = col3.date_input("Au", value=date.today(), min_value=premier, key="hist_fin")
+        if debut <= fin:
+            try:
+                st.line_chart(stock_history.serie_produit(choix[label], debut, fin))
+            except stock_history.HorsHistorique as e:
+                st.warning(str(e))
+        st.caption("Lots en stock, dans l'ordre de sortie (premier périmé, premier sorti)")
+        st.dataframe(lots.lots_produit(choix[label]).rename(columns={
+            "numero_lot": "Lot", "date_peremption": "Péremption", "quantite": "Quantité"}),
+            hide_index=True, use_container_width=True)
 
-    st.data_editor(df, use_container_width=True, disabled=True, hide_index=True, height=400)
-else:
-    st.info("Aucun stock trouvé.")
+# -----------------------------------------------
+# 🗓️ Calendrier des péremptions (lots non épuisés)
+# -----------------------------------------------
+profiling.etape("péremptions")
+with st.expander("🗓️ Lots à périmer"):
+    horizon = st.slider("Horizon (jours)", 0, 365, lots.ALERTE_JOURS, step=15, key="horizon_peremption")
+    a_perimer = lots.a_perimer(date.today(), horizon)
+    perimes = a_perimer[a_perimer["jours_restants"] < 0]
+    col1, col2 = st.columns(2)
+    col1.metric("Lots déjà périmés", len(perimes), f"{int(perimes['quantite'].sum())} unités", delta_color="off")
+    col2.metric(f"Lots périmant sous {horizon} j", len(a_perimer) - len(perimes))
+    profiling.rendu(a_perimer)
+    st.dataframe(a_perimer.rename(columns={
+        "date_peremption": "Péremption", "code_produit": "Code", "nom_produit": "Produit",
+        "numero_lot": "Lot", "quantite": "Quantité", "jours_restants": "Jours restants"}),
+        hide_index=True, use_container_width=True)
 
 st.divider()
 
@@ -55,15 +94,10 @@ st.divider()
 # 📥 2. Formulaire d'enregistrement d’un mouvement
 # -----------------------------------------------
 st.subheader("📥 Enregistrer un mouvement de stock")
+profiling.etape("formulaire mouvement")
 
-# Liste des produits disponibles
-conn = get_connection()
-cur = conn.cursor(dictionary=True)
-cur.execute("SELECT id_produit, nom_produit, code_produit FROM produit ORDER BY nom_produit")
-produits = cur.fetchall()
-conn.close()
-
-prod_dict = {f"{p['nom_produit']} ({p['code_produit']})": p["id_produit"] for p in produits}
+produits = champ_recherche("recherche_mvt")
+prod_dict = {libelle(p): p["id_produit"] for p in produits}
 
 with st.form("mvt_form", clear_on_submit=True, border=True):
     col1, col2 = st.columns(2)
@@ -71,52 +105,70 @@ with st.form("mvt_form", clear_on_submit=True, border=True):
     mvt_type = col2.selectbox("Type de mouvement", ["Entrée", "Sortie", "Ajustement"])
     qty = col1.number_input("Quantité", min_value=1, step=1)
     desc = col2.text_input("Description (optionnel)", placeholder="Ex : réception fournisseur, perte, etc.")
+    numero_lot = col1.text_input("N° de lot (entrées)", max_chars=40)
+    peremption = col2.date_input("Péremption du lot (entrées)", value=None, format="DD/MM/YYYY")
+    st.caption("Les sorties sont prélevées automatiquement sur les lots qui périment en premier.")
 
     submitted = st.form_submit_button("💾 Valider le mouvement")
 
-    if submitted:
+    if submitted and produit_label is None:
+        st.warning("Aucun produit ne correspond à la recherche.")
+    elif submitted:
         id_prod = prod_dict[produit_label]
-        qty_signed = qty if mvt_type == "Entrée" else -qty if mvt_type == "Sortie" else qty
-
-        conn = get_connection()
-        cur = conn.cursor()
         try:
-            # 1. Journal du mouvement
-            cur.execute("""
-                INSERT INTO mouvement_stock (id_produit, date_mvt, type_mvt, quantite, description)
-                VALUES (%s,%s,%s,%s,%s)
-            """, (id_prod, datetime.now(), mvt_type, qty_signed, desc))
-
-            # 2. Mise à jour du stock
-            cur.execute("SELECT quantite FROM stock WHERE id_produit=%s", (id_prod,))
-            row = cur.fetchone()
-
-            if row:
-                nouvelle_qte = row[0] + qty_signed
-                if nouvelle_qte < 0:
-                    st.error("❌ Quantité insuffisante pour cette sortie.")
-                    conn.rollback()
-                else:
-                    cur.execute(
-                        "UPDATE stock SET quantite=%s, maj=%s WHERE id_produit=%s",
-                        (nouvelle_qte, datetime.now(), id_prod)
-                    )
-                    conn.commit()
-                    st.success("✅ Mouvement enregistré avec succès.")
-            else:
-                if qty_signed < 0:
-                    st.error("❌ Stock inexistant pour ce produit.")
-                    conn.rollback()
-                else:
-                    cur.execute(
-                        "INSERT INTO stock (id_produit, quantite, maj) VALUES (%s, %s, %s)",
-                        (id_prod, qty_signed, datetime.now())
-                    )
-                    conn.commit()
-                    st.success("✅ Stock créé et mouvement enregistré.")
+            with transaction() as conn:
+                appliquer_mouvements(conn, [{
+                    "ligne": 1, "id_produit": id_prod, "type_mvt": mvt_type,
+                    "quantite": quantite_signee(mvt_type, qty), "description": desc,
+                    "numero_lot": numero_lot.strip() or None, "date_peremption": peremption,
+                }])
+            st.success("✅ Mouvement enregistré avec succès.")
+        except MouvementError as e:
+            st.error(f"❌ {e}")
         except Exception as e:
-            conn.rollback()
             st.error(f"Erreur : {e}")
-        finally:
-            conn.close()
-            st.rerun()
+        st.rerun()
+
+# -----------------------------------------------
+# 📂 3. Import en masse (réception fournisseur, inventaire…)
+# -----------------------------------------------
+profiling.etape("import")
+with st.expander("📂 Importer des mouvements (CSV / XLSX)"):
+    st.caption("Colonnes : code_produit, type_mvt (Entrée / Sortie / Ajustement), quantite ; "
+               "description, date_mvt, numero_lot et date_peremption (optionnelles). "
+               "Tout ou rien : une seule erreur bloque l'import.")
+    fichier = st.file_uploader("Fichier de mouvements", type=["csv", "xlsx"], key="import_mvt")
+    # empreintes des fichiers déjà appliqués : le rerun suivant ne les repropose pas
+    appliques = st.session_state.setdefault("imports_appliques", set())
+    empreinte = hashlib.sha256(fichier.getvalue()).hexdigest() if fichier is not None else None
+    if empreinte in appliques:
+        st.warning("Ce fichier a déjà été appliqué : ses mouvements ne seront pas journalisés une seconde fois.")
+    elif fichier is not None:
+        try:
+            df_import = lire_fichier(fichier)
+        except Exception as e:
+            st.error(f"Fichier illisible : {e}")
+            profiling.fin_page()
+            st.stop()
+        with connection() as conn:
+            mouvements, erreurs = preparer_import(conn, df_import)
+        if erreurs:
+            st.error(f"❌ {len(erreurs)} ligne(s) invalide(s) : rien n'a été importé.")
+            st.dataframe(pd.DataFrame(erreurs, columns=["Ligne", "Erreur"]), hide_index=True,
+                         use_container_width=True)
+        else:
+            st.info(f"{len(mouvements)} mouvement(s) valides, prêts à être appliqués.")
+            if st.button("💾 Appliquer l'import", key="apply_import"):
+                try:
+                    with transaction() as conn:
+                        n = appliquer_mouvements(conn, mouvements)
+                    appliques.add(empreinte)
+                    st.success(f"✅ {n} mouvement(s) enregistrés.")
+                except MouvementError as e:
+                    st.error(f"❌ {len(e.erreurs)} ligne(s) refusée(s) : rien n'a été importé.")
+                    st.dataframe(pd.DataFrame(e.erreurs, columns=["Ligne", "Erreur"]), hide_index=True,
+                                 use_container_width=True)
+                except Exception as e:
+                    st.error(f"Erreur : {e}")
+
+profiling.fin_page()
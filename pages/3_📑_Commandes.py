@@ -1,150 +1,153 @@
 # Page commandes 
 import streamlit as st
-from datetime import datetime
-from database import get_connection
-import pathlib
+import profiling
+from database import connection, transaction
 from security import login_user, require_role
+from cache import cached
+from orders import STATUTS, StockInsuffisant, enregistrer_commande
+from sequences import code_commande
+from grid import Column, paginated_grid
+from recherche import champ_recherche, libelle
+from utils import inject_styles
+from utils.colonnes import dates
+
+profiling.debut_page("Commandes")
 
 # -------------------------------------------------
 # 1. Authentification / rôles
 # -------------------------------------------------
+profiling.etape("authentification")
 login_user()
 require_role(["Administrateur", "Gestionnaire", "Pharmacien", "Agent de saisie"])
 user_role = st.session_state["user"]["role"]
-st.markdown(f"<style>{pathlib.Path('assets/styles.css').read_text()}</style>", unsafe_allow_html=True)
+inject_styles()
 
 st.title("📑 Gestion des commandes")
 
 # -------------------------------------------------
 # 2. Helpers BDD
 # -------------------------------------------------
+@cached("client", ttl=300)   # clients saisis hors de l'application
 def get_clients():
-    conn = get_connection(); cur = conn.cursor(dictionary=True)
-    cur.execute("SELECT id_client, nom_client FROM client ORDER BY nom_client")
-    rows = cur.fetchall(); conn.close()
-    return rows
-
-def get_produits():
-    conn = get_connection(); cur = conn.cursor(dictionary=True)
-    cur.execute("""
-        SELECT p.id_produit, p.nom_produit, COALESCE(s.quantite,0) AS quantite
-        FROM produit p LEFT JOIN stock s ON s.id_produit=p.id_produit
-        ORDER BY p.nom_produit
-    """)
-    rows = cur.fetchall(); conn.close()
-    return rows
-
-def gen_code_commande():
-    """CMD-20250709-001"""
-    conn = get_connection(); cur = conn.cursor()
-    cur.execute("SELECT COUNT(*) FROM commande WHERE date_commande=CURRENT_DATE")
-    n = cur.fetchone()[0] + 1
-    conn.close()
-    return f"CMD-{datetime.now():%Y%m%d}-{n:03d}"
+    with connection() as conn:
+        cur = conn.cursor(dictionary=True)
+        cur.execute("SELECT id_client, nom_client FROM client ORDER BY nom_client")
+        return cur.fetchall()
+
+@cached("stock")   # indicatif : le contrôle qui fait foi est fait sous FOR UPDATE (enregistrer_commande)
+def get_stock(ids):
+    """Stock des seuls produits proposés (quelques dizaines), mis en cache jusqu'au prochain mouvement."""
+    if not ids:
+        return {}
+    with connection(replica=True) as conn:
+        cur = conn.cursor()
+        cur.execute(f"SELECT id_produit, quantite FROM stock WHERE id_produit IN ({', '.join(['%s'] * len(ids))})",
+                    list(ids))
+        return dict(cur.fetchall())
 
 # -------------------------------------------------
-# 3. Création d'une nouvelle commande (étape 1)
+# 3. Panier (session) : choix du client
 # -------------------------------------------------
-if "commande_en_cours" not in st.session_state:
+# Les lignes restent en session jusqu'à la finalisation : aucune écriture en
+# base avant, et la disponibilité est contrôlée sur l'instantané de stock en cache.
+profiling.etape("panier")
+if "panier" not in st.session_state:
     st.subheader("🆕 Créer une commande")
 
     clients = get_clients()
     if not clients:
         st.warning("Aucun client enregistré.")
+        profiling.fin_page()
         st.stop()
 
     client_map = {c["nom_client"]: c["id_client"] for c in clients}
     cli_nom = st.selectbox("Client", list(client_map.keys()))
     if st.button("Créer commande"):
-        code = gen_code_commande()
-        conn = get_connection(); cur = conn.cursor()
-        cur.execute("""
-            INSERT INTO commande (code_commande, date_commande, statut, id_client)
-            VALUES (%s,CURDATE(),'En attente',%s)
-        """, (code, client_map[cli_nom]))
-        conn.commit(); last_id = cur.lastrowid; conn.close()
-        st.session_state["commande_en_cours"] = last_id
-        st.session_state["commande_code"] = code
-        st.success(f"Commande {code} créée ✅")
+        st.session_state["panier"] = {"id_client": client_map[cli_nom], "client": cli_nom, "lignes": []}
         st.rerun()
 
 # -------------------------------------------------
 # 4. Ajout de produits (étape 2)
 # -------------------------------------------------
-if "commande_en_cours" in st.session_state:
-    cmd_id = st.session_state["commande_en_cours"]
-    st.subheader(f"🛒 Commande {st.session_state['commande_code']} – Ajout d’articles")
-
-    produits = get_produits()
-    prod_map = {f"{p['nom_produit']}  |  Stock : {p['quantite']}": (p["id_produit"], p["quantite"])
-                for p in produits}
-    prod_label = st.selectbox("Produit", list(prod_map.keys()))
-    qty = st.number_input("Quantité demandée", min_value=1, step=1)
-    col_add, col_fin = st.columns([1,1])
-
-    # ---- Bouton "Ajouter ligne" ----
-    if col_add.button("➕ Ajouter ligne"):
-        id_prod, stock_dispo = prod_map[prod_label]
+if "panier" in st.session_state:
+    panier = st.session_state["panier"]
+    st.subheader(f"🛒 Commande pour {panier['client']} – Ajout d’articles")
+
+    # le catalogue n'est jamais chargé en entier : seuls les meilleurs résultats sont proposés
+    produits = champ_recherche("recherche_commande")
+    stock = get_stock(tuple(p["id_produit"] for p in produits))
+    reserve = {}
+    for l in panier["lignes"]:
+        reserve[l["id_produit"]] = reserve.get(l["id_produit"], 0) + l["quantite"]
+    prod_map = {}
+    for p in produits:
+        dispo = stock.get(p["id_produit"], 0) - reserve.get(p["id_produit"], 0)
+        prod_map[f"{libelle(p)}  |  Stock : {dispo}"] = (p["id_produit"], p["nom_produit"], dispo)
+    with st.form("ajout_ligne", clear_on_submit=True, border=False):
+        prod_label = st.selectbox("Produit", list(prod_map.keys()))
+        qty = st.number_input("Quantité demandée", min_value=1, step=1)
+        ajout = st.form_submit_button("➕ Ajouter ligne")
+
+    # ---- Bouton "Ajouter ligne" : session uniquement ----
+    if ajout and prod_label:
+        id_prod, nom, stock_dispo = prod_map[prod_label]
         if qty > stock_dispo:
-            st.error("Stock insuffisant !")
+            st.error("Stock insuffisant !")
         else:
-            conn = get_connection(); cur = conn.cursor()
-            # 1) Insérer dans commande_detail
-            cur.execute("""
-                INSERT INTO commande_detail (id_commande,id_produit,quantite_dmd,quantite_livr)
-                VALUES (%s,%s,%s,0)
-            """, (cmd_id, id_prod, qty))
-            # 2) Réserver le stock (décrément immédiat)
-            cur.execute("""
-                UPDATE stock SET quantite = quantite - %s
-                WHERE id_produit = %s
-            """, (qty, id_prod))
-            conn.commit(); conn.close()
-            st.success("Ligne ajoutée ✅")
+            panier["lignes"].append({"id_produit": id_prod, "nom_produit": nom, "quantite": int(qty)})
             st.rerun()
 
     # -------------------------------------------------
-    # 5. Affichage des lignes déjà ajoutées
+    # 5. Lignes du panier
     # -------------------------------------------------
-    conn = get_connection(); cur = conn.cursor(dictionary=True)
-    cur.execute("""
-        SELECT d.id_detail, p.nom_produit, d.quantite_dmd
-        FROM commande_detail d
-        JOIN produit p ON p.id_produit=d.id_produit
-        WHERE d.id_commande=%s
-    """, (cmd_id,))
-    lignes = cur.fetchall(); conn.close()
-
-    if lignes:
-        st.table(lignes)
+    if panier["lignes"]:
+        st.table([{"Produit": l["nom_produit"], "Quantité": l["quantite"]} for l in panier["lignes"]])
 
     # ---- Bouton "Finaliser commande" ----
     statut_final = "En attente" if user_role == "Agent de saisie" else st.selectbox(
-        "Statut final", ["En attente", "Livrée", "Annulée"], index=0
+        "Statut final", STATUTS, index=0
     )
 
-    if col_fin.button("✅ Finaliser"):
-        conn = get_connection(); cur = conn.cursor()
-        cur.execute("UPDATE commande SET statut=%s WHERE id_commande=%s",
-                    (statut_final, cmd_id))
-        conn.commit(); conn.close()
-        st.success(f"Commande finalisée ({statut_final})")
-        # Nettoyer la session
-        del st.session_state["commande_en_cours"]
-        del st.session_state["commande_code"]
+    col_fin, col_vider = st.columns([1,1])
+    if col_fin.button("✅ Finaliser", disabled=not panier["lignes"]):
+        try:
+            # code réservé avant la transaction : une seule connexion du pool à la fois
+            code = code_commande()
+            # en-tête, lignes et décréments de stock : une seule transaction
+            with transaction() as conn:
+                enregistrer_commande(
+                    conn, panier["id_client"],
+                    [(l["id_produit"], l["quantite"]) for l in panier["lignes"]], statut_final, code,
+                )
+        except StockInsuffisant as e:
+            noms = {l["id_produit"]: l["nom_produit"] for l in panier["lignes"]}
+            st.error("Stock insuffisant : " + ", ".join(
+                f"{noms[pid]} (demandé {dmd}, disponible {dispo})" for pid, (dmd, dispo) in e.manquants.items()))
+        else:
+            st.success(f"Commande {code} finalisée ({statut_final})")
+            # Nettoyer la session
+            del st.session_state["panier"]
+            st.rerun()
+    if col_vider.button("🗑️ Abandonner"):
+        del st.session_state["panier"]
         st.rerun()
 
 # -------------------------------------------------
 # 6. Historique des commandes
 # -------------------------------------------------
 st.subheader("📜 Historique des commandes")
-conn = get_connection(); cur = conn.cursor(dictionary=True)
-cur.execute("""
-    SELECT c.id_commande, c.code_commande, DATE_FORMAT(c.date_commande,'%%d/%%m/%%Y') AS date,
-           cl.nom_client, c.statut
-    FROM commande c
-    JOIN client cl ON cl.id_client=c.id_client
-    ORDER BY c.date_commande DESC, c.id_commande DESC
-""")
-hist = cur.fetchall(); conn.close()
-st.dataframe(hist, use_container_width=True)
+profiling.etape("historique")
+paginated_grid(
+    "historique", "commande c JOIN client cl ON cl.id_client=c.id_client",
+    [
+        Column("id_commande", "c.id_commande", "ID"),
+        Column("code_commande", "c.code_commande", "Code", filter="text"),
+        Column("date", "c.date_commande", "Date", sortable=True),
+        Column("nom_client", "cl.nom_client", "Client", filter="text"),
+        Column("statut", "c.statut", "Statut", filter="choice", choices=STATUTS),
+    ],
+    id_expr="c.id_commande", tables=("commande", "client"), default_sort="Date", descending=True,
+    formatter=lambda df: df.assign(date=dates(df["date"])),
+)
+
+profiling.fin_page()
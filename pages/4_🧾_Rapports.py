@@ -1,17 +1,93 @@
 import streamlit as st
-import pandas as pd
-from database import get_connection
+import profiling
+from database import transaction
+import alertes
+import archive
+import migrations
+import rollups
+import stock_history
+import taches
+from grid import Column, paginated_grid
+from utils.colonnes import dates, requete
+from utils.export import export_widget
+from recherche import champ_recherche, libelle
 from security import login_user, require_role
-from datetime import date
-import pathlib
+from datetime import date, datetime, time
+from utils import inject_styles
+
+profiling.debut_page("Rapports")
 
 # Auth + Style
+profiling.etape("authentification")
 login_user()
 require_role(["Administrateur", "Gestionnaire", "Pharmacien"])
-st.markdown(f"<style>{pathlib.Path('assets/styles.css').read_text()}</style>", unsafe_allow_html=True)
+inject_styles()
 
 st.title("🧾 Rapports et Statistiques")
 
+STOCK_SQL = """
+    SELECT p.nom_produit, p.forme, p.dosage,
+           COALESCE(s.quantite, 0) AS quantite
+    FROM produit p
+    LEFT JOIN stock s ON s.id_produit = p.id_produit
+    ORDER BY quantite ASC
+"""
+
+COMMANDES_SQL = """
+    SELECT c.code_commande, c.date_commande,
+           cl.nom_client, p.nom_produit, d.quantite_dmd
+    FROM commande c
+    JOIN client cl ON cl.id_client = c.id_client
+    JOIN commande_detail d ON d.id_commande = c.id_commande
+    JOIN produit p ON p.id_produit = d.id_produit
+    WHERE c.date_commande BETWEEN %s AND %s
+    ORDER BY c.date_commande DESC
+"""
+EXPORT_MAX_ROWS = 500_000
+
+def formater_commandes(data):
+    data["date_commande"] = dates(data["date_commande"])
+    return data.rename(columns={
+        "code_commande": "Code",
+        "date_commande": "Date",
+        "nom_client": "Client",
+        "nom_produit": "Produit",
+        "quantite_dmd": "Quantité demandée"
+    })
+
+TOP_PRODUITS = 20
+STOCK_TABLES = ("produit", "stock")
+COMMANDES_TABLES = ("commande", "commande_detail", "client", "produit", "archive_periode")
+
+# Rapports calculés en arrière-plan (taches.py) : résultat conservé sur disque
+# par paramètres et versions des tables, demandes simultanées fusionnées
+def charger_stock():
+    return requete(STOCK_SQL)
+
+def fetch_commandes_par_jour(debut, fin):
+    df = requete("""
+        SELECT jour, SUM(nb_commandes) AS Commandes, SUM(quantite) AS Quantité
+        FROM rollup_client_jour
+        WHERE jour BETWEEN %s AND %s
+        GROUP BY jour ORDER BY jour
+    """, (debut, fin)).set_index("jour")
+    return df.astype("int64")
+
+def fetch_top_produits(debut, fin, limit=TOP_PRODUITS):
+    df = requete("""
+        SELECT p.nom_produit AS Produit, SUM(r.quantite) AS `Quantité demandée`
+        FROM rollup_produit_jour r
+        JOIN produit p ON p.id_produit = r.id_produit
+        WHERE r.jour BETWEEN %s AND %s
+        GROUP BY r.id_produit, p.nom_produit
+        ORDER BY `Quantité demandée` DESC
+        LIMIT %s
+    """, (debut, fin, limit)).set_index("Produit")
+    return df["Quantité demandée"].astype("int64")
+
+def rapport_commandes(debut, fin):
+    return {"par_jour": fetch_commandes_par_jour(debut, fin), "top": fetch_top_produits(debut, fin)}
+
 # Tabs
 tab1, tab2 = st.tabs(["📦 Stock Produits", "📑 Commandes Clients"])
 
@@ -20,78 +96,133 @@ tab1, tab2 = st.tabs(["📦 Stock Produits", "📑 Commandes Clients"])
 # ----------------------------------------------------------
 with tab1:
     st.subheader("📦 État général du stock")
+    profiling.etape("rapport stock")
 
-    conn = get_connection()
-    cur = conn.cursor(dictionary=True)
-    cur.execute("""
-        SELECT p.nom_produit, p.forme, p.dosage,
-               COALESCE(s.quantite, 0) AS quantite
-        FROM produit p
-        LEFT JOIN stock s ON s.id_produit = p.id_produit
-        ORDER BY quantite ASC
-    """)
-    stock_data = pd.DataFrame(cur.fetchall())
-    conn.close()
-
-    if not stock_data.empty:
-        st.data_editor(stock_data, use_container_width=True, disabled=True, hide_index=True, height=350)
+    cle_stock = taches.soumettre("stock", charger_stock, tables=STOCK_TABLES)
+    pret = taches.attendre(cle_stock, "État du stock en préparation…")
+    stock_data = taches.resultat(cle_stock) if pret else None
 
-        st.markdown("#### ⚠️ Produits avec stock faible")
-        seuil = st.slider("Seuil d’alerte", min_value=0, max_value=50, value=10)
-        faibles = stock_data[stock_data["quantite"] <= seuil]
+    if stock_data is not None and not stock_data.empty:
+        profiling.rendu(stock_data)
+        st.data_editor(stock_data, use_container_width=True, disabled=True, hide_index=True, height=350)
 
-        st.dataframe(faibles, use_container_width=True)
         st.markdown("#### 📊 Graphique des quantités par produit")
         st.bar_chart(stock_data.set_index("nom_produit")["quantite"])
 
-        csv = stock_data.to_csv(index=False).encode("utf-8")
-        st.download_button("📥 Télécharger (CSV)", data=csv, file_name="rapport_stock.csv")
-    else:
+        export_widget("export_stock", STOCK_SQL, filename="rapport_stock", tables=STOCK_TABLES)
+    elif stock_data is not None:
         st.info("Aucune donnée de stock disponible.")
 
+    # Alertes ouvertes, tenues à jour par les écritures de stock (alertes.py) :
+    # lecture proportionnelle au nombre d'alertes, pas à la taille du catalogue
+    st.markdown("#### ⚠️ Produits avec stock faible")
+    profiling.etape("alertes")
+    ouvertes = alertes.ouvertes()
+    if ouvertes.empty:
+        st.success("Aucun produit sous son seuil d’alerte.")
+    else:
+        profiling.rendu(ouvertes)
+        st.dataframe(ouvertes.drop(columns="id_produit").rename(columns={
+            "code_produit": "Code", "nom_produit": "Produit", "forme": "Forme", "dosage": "Dosage",
+            "quantite": "Quantité", "seuil": "Seuil", "depuis": "Depuis"}),
+            use_container_width=True, hide_index=True, height=300)
+
+    if st.session_state["user"]["role"] in ("Administrateur", "Gestionnaire"):
+        with st.expander("🎚️ Modifier le seuil d’alerte d’un produit"):
+            resultats = champ_recherche("seuil_recherche")
+            if resultats:
+                choix = st.selectbox("Produit", resultats, format_func=libelle, key="seuil_produit")
+                nouveau = st.number_input("Nouveau seuil", min_value=0, step=1, value=alertes.SEUIL_DEFAUT,
+                                          key="seuil_valeur")
+                if st.button("💾 Enregistrer le seuil", key="seuil_enregistrer"):
+                    with transaction() as conn:
+                        alertes.definir_seuils(conn, {choix["id_produit"]: int(nouveau)})
+                    st.rerun()
+            else:
+                st.info("Aucun produit ne correspond à la recherche.")
+
+    st.markdown("#### 🕰️ Stock à une date passée")
+    profiling.etape("stock à une date")
+    stock_history.snapshot_si_necessaire()
+    # avant le premier instantané, le journal seul ne donne pas le stock (stock initial non journalisé)
+    premier = stock_history.premier_jour() or date.today()
+    jour_hist = st.date_input("Stock en fin de journée du", value=date.today(), min_value=premier,
+                              max_value=date.today())
+    st.caption(f"Historique disponible à partir du {premier:%d/%m/%Y} (premier instantané du stock).")
+    try:
+        historique = stock_history.stock_a(datetime.combine(jour_hist, time.max).replace(microsecond=0))
+    except stock_history.HorsHistorique as e:
+        st.warning(str(e))
+    else:
+        profiling.rendu(historique)
+        st.dataframe(historique.rename(columns={"code_produit": "Code", "nom_produit": "Produit",
+                                                "quantite": "Quantité"}),
+                     use_container_width=True, hide_index=True, height=350)
+
 # ----------------------------------------------------------
 # 📑 RAPPORT COMMANDES
 # ----------------------------------------------------------
 with tab2:
     st.subheader("📑 Historique des commandes clients")
+    profiling.etape("rapport commandes")
 
     # Filtres
     col1, col2 = st.columns(2)
     date_debut = col1.date_input("📅 Date début", value=date(2024, 1, 1))
     date_fin   = col2.date_input("📅 Date fin", value=date.today())
 
-    conn = get_connection()
-    cur = conn.cursor(dictionary=True)
-    cur.execute("""
-        SELECT c.code_commande, c.date_commande,
-               cl.nom_client, p.nom_produit, d.quantite_dmd
-        FROM commande c
-        JOIN client cl ON cl.id_client = c.id_client
-        JOIN commande_detail d ON d.id_commande = c.id_commande
-        JOIN produit p ON p.id_produit = d.id_produit
-        WHERE c.date_commande BETWEEN %s AND %s
-        ORDER BY c.date_commande DESC
-    """, (date_debut, date_fin))
-    data = pd.DataFrame(cur.fetchall())
-    conn.close()
-
-    if not data.empty:
-        data["date_commande"] = pd.to_datetime(data["date_commande"]).dt.strftime("%d/%m/%Y")
-        data.rename(columns={
-            "code_commande": "Code",
-            "date_commande": "Date",
-            "nom_client": "Client",
-            "nom_produit": "Produit",
-            "quantite_dmd": "Quantité demandée"
-        }, inplace=True)
-
-        st.data_editor(data, use_container_width=True, disabled=True, hide_index=True, height=350)
+    # Graphiques et totaux : lus dans les agrégats journaliers (rollups.py)
+    migrations.ensure_schema()
+    cle_commandes = taches.soumettre("commandes", rapport_commandes, (date_debut, date_fin),
+                                     tables=("produit", *rollups.TABLES))
+    pret = taches.attendre(cle_commandes, "Synthèse de la période en préparation…")
+    commandes = taches.resultat(cle_commandes) if pret else None
+    par_jour = commandes["par_jour"] if commandes is not None else None
+
+    if par_jour is not None and not par_jour.empty:
+        col1, col2 = st.columns(2)
+        col1.metric("Commandes", int(par_jour["Commandes"].sum()))
+        col2.metric("Quantité demandée", int(par_jour["Quantité"].sum()))
+
+        paginated_grid(
+            "rapport_commandes",
+            """commande c
+               JOIN client cl ON cl.id_client = c.id_client
+               JOIN commande_detail d ON d.id_commande = c.id_commande
+               JOIN produit p ON p.id_produit = d.id_produit""",
+            [
+                Column("code_commande", "c.code_commande", "Code", filter="text"),
+                Column("date_commande", "c.date_commande", "Date", sortable=True),
+                Column("nom_client", "cl.nom_client", "Client", filter="text"),
+                Column("nom_produit", "p.nom_produit", "Produit"),
+                Column("quantite_dmd", "d.quantite_dmd", "Quantité demandée"),
+            ],
+            id_expr="d.id_detail", tables=("commande", "commande_detail"), default_sort="Date",
+            descending=True, where="c.date_commande BETWEEN %s AND %s", params=(date_debut, date_fin),
+            formatter=lambda df: df.assign(date_commande=dates(df["date_commande"])),
+        )
+        horizon = archive.horizon("commande")
+        if horizon is not None and date_debut < horizon:
+            st.caption(f"🗄️ Lignes antérieures au {horizon:%d/%m/%Y} archivées : absentes de ce tableau, "
+                       "comptées dans les totaux et graphiques et incluses dans l'export.")
 
         st.markdown("#### 📊 Produits les plus demandés")
-        top_produits = data.groupby("Produit")["Quantité demandée"].sum().sort_values(ascending=False)
-        st.bar_chart(top_produits)
+        st.bar_chart(commandes["top"])
 
-        csv_cmd = data.to_csv(index=False).encode("utf-8")
-        st.download_button("📥 Télécharger (CSV)", data=csv_cmd, file_name="rapport_commandes.csv")
-    else:
+        st.markdown("#### 📈 Commandes par jour")
+        st.line_chart(par_jour["Commandes"])
+
+        export_widget("export_commandes", COMMANDES_SQL, (date_debut, date_fin),
+                      filename="rapport_commandes", formatter=formater_commandes,
+                      max_rows=EXPORT_MAX_ROWS, tables=COMMANDES_TABLES,
+                      complement=archive.commandes_detaillees)
+    elif par_jour is not None:
         st.info("Aucune commande trouvée pour cette période.")
+
+    if st.session_state["user"]["role"] == "Administrateur":
+        if st.button("🔁 Recalculer les agrégats de la période",
+                     help="À utiliser après une correction faite directement en base"):
+            rollups.rattraper(date_debut, date_fin)
+            st.rerun()
+
+profiling.fin_page()
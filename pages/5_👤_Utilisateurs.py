@@ -1,61 +1,66 @@
 # Page utilisateurs 
 import streamlit as st
-import bcrypt
-import pathlib
-from database import get_connection
-from security import login_user, require_role
+from database import connection, transaction
+from security import ServeurOccupe, hash_password, login_user, require_role
+from cache import cached, invalidate
+from utils import inject_styles
+import profiling
+
+profiling.debut_page("Utilisateurs")
 
 # ------------------------------------------------------------------
 # 1. Authentification & autorisation
 # ------------------------------------------------------------------
+profiling.etape("authentification")
 login_user()
 require_role(["Administrateur"])           # ← ACCÈS RÉSERVÉ
-st.markdown(f"<style>{pathlib.Path('assets/styles.css').read_text()}</style>", unsafe_allow_html=True)
+inject_styles()
 
 st.title("👤 Gestion des utilisateurs")
 
 # ------------------------------------------------------------------
 # 2. Fonctions BDD réutilisables
 # ------------------------------------------------------------------
+@cached("utilisateur")
 def fetch_users():
-    conn = get_connection()
-    cur  = conn.cursor(dictionary=True)
-    cur.execute("SELECT id_user, login, role FROM utilisateur ORDER BY login")
-    rows = cur.fetchall()
-    conn.close()
-    return rows
+    with connection() as conn:
+        cur  = conn.cursor(dictionary=True)
+        cur.execute("SELECT id_user, login, role FROM utilisateur ORDER BY login")
+        return cur.fetchall()
 
 def create_user(login, pwd, role):
-    conn = get_connection()
-    cur  = conn.cursor()
-    cur.execute(
-        "INSERT INTO utilisateur (login, pwd_hash, role) VALUES (%s,%s,%s)",
-        (login, bcrypt.hashpw(pwd.encode(), bcrypt.gensalt()).decode(), role)
-    )
-    conn.commit(); conn.close()
+    with transaction() as conn:
+        cur  = conn.cursor()
+        cur.execute(
+            "INSERT INTO utilisateur (login, pwd_hash, role) VALUES (%s,%s,%s)",
+            (login, hash_password(pwd), role)
+        )
+        invalidate(conn, "utilisateur")
 
 def update_role(user_id, role):
-    conn = get_connection(); cur = conn.cursor()
-    cur.execute("UPDATE utilisateur SET role=%s WHERE id_user=%s", (role, user_id))
-    conn.commit(); conn.close()
+    with transaction() as conn:
+        conn.cursor().execute("UPDATE utilisateur SET role=%s WHERE id_user=%s", (role, user_id))
+        invalidate(conn, "utilisateur")
 
 def reset_pwd(user_id, new_pwd):
-    conn = get_connection(); cur = conn.cursor()
-    cur.execute(
-        "UPDATE utilisateur SET pwd_hash=%s WHERE id_user=%s",
-        (bcrypt.hashpw(new_pwd.encode(), bcrypt.gensalt()).decode(), user_id)
-    )
-    conn.commit(); conn.close()
+    with transaction() as conn:
+        conn.cursor().execute(
+            "UPDATE utilisateur SET pwd_hash=%s WHERE id_user=%s",
+            (hash_password(new_pwd), user_id)
+        )
+        invalidate(conn, "utilisateur")
 
 def delete_user(user_id):
-    conn = get_connection(); cur = conn.cursor()
-    cur.execute("DELETE FROM utilisateur WHERE id_user=%s", (user_id,))
-    conn.commit(); conn.close()
+    with transaction() as conn:
+        conn.cursor().execute("DELETE FROM utilisateur WHERE id_user=%s", (user_id,))
+        invalidate(conn, "utilisateur")
 
 # ------------------------------------------------------------------
 # 3. Tableau + actions
 # ------------------------------------------------------------------
+profiling.etape("liste")
 users = fetch_users()
+profiling.rendu(users)
 st.subheader("Liste des utilisateurs")
 st.dataframe(users, use_container_width=True)
 
@@ -75,13 +80,17 @@ with st.expander("➕ Ajouter un utilisateur"):
             else:
                 try:
                     create_user(login, pwd1, role)
-                    st.success("Utilisateur créé ✅")
+                except ServeurOccupe:
+                    st.warning("Serveur occupé, veuillez réessayer dans un instant.")
                 except Exception as e:
                     st.error(f"Erreur : {e}")
-                st.rerun()
+                else:
+                    st.success("Utilisateur créé ✅")
+                    st.rerun()
 
 st.divider()
 st.subheader("🛠️ Actions rapides")
+profiling.etape("actions")
 
 # Sélection d’un utilisateur
 user_options = {f"{u['login']} ({u['role']})": u["id_user"] for u in users}
@@ -105,8 +114,12 @@ if user_options:
         if st.button("🔑 Réinitialiser mot de passe"):
             new_pwd = st.text_input("Nouveau mot de passe :", type="password", key="reset_pwd")
             if new_pwd:
-                reset_pwd(uid, new_pwd)
-                st.success("Mot de passe réinitialisé ✅")
+                try:
+                    reset_pwd(uid, new_pwd)
+                except ServeurOccupe:
+                    st.warning("Serveur occupé, veuillez réessayer dans un instant.")
+                else:
+                    st.success("Mot de passe réinitialisé ✅")
 
     # ---- Supprimer ----
     with col3:
@@ -117,3 +130,5 @@ if user_options:
 
 else:
     st.info("Aucun utilisateur dans la base.")
+
+profiling.fin_page()
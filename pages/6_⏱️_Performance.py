@@ -0,0 +1,83 @@
+# Page performance : temps des reruns par page et par étape (administrateurs)
+import streamlit as st
+import pandas as pd
+import profiling
+import query_stats
+from datetime import datetime
+from database import REPLICA_MAX_LAG, etat_replicas
+from security import login_user, require_role
+from utils import inject_styles
+
+login_user()
+require_role(["Administrateur"])
+inject_styles()
+
+st.title("⏱️ Performance des pages")
+st.caption(f"Derniers reruns de ce processus (anneau de {profiling.TAILLE_ANNEAU} exécutions).")
+
+pages, etapes = profiling.resume()
+if pages.empty:
+    st.info("Aucun rerun enregistré pour l'instant : parcourez les pages puis revenez ici.")
+    st.stop()
+
+# -------------------------------------------------
+# 📊 Par page
+# -------------------------------------------------
+st.subheader("📊 Par page")
+st.dataframe(pages.rename(columns={
+    "reruns": "Reruns", "p50_ms": "p50 (ms)", "p95_ms": "p95 (ms)",
+    "lignes_moy": "Lignes affichées (moy.)", "octets_moy": "Octets affichés (moy.)",
+    "interrompus": "Interrompus (hors percentiles)"}),
+    use_container_width=True)
+st.bar_chart(pages[["p50_ms", "p95_ms"]])
+
+# -------------------------------------------------
+# 🔍 Par étape
+# -------------------------------------------------
+st.subheader("🔍 Par étape")
+choix = st.selectbox("Page", ["Toutes"] + list(pages.index))
+detail = etapes if choix == "Toutes" else etapes.loc[[choix]]
+st.dataframe(detail.rename(columns={"mesures": "Mesures", "p50_ms": "p50 (ms)", "p95_ms": "p95 (ms)"}),
+             use_container_width=True)
+
+# -------------------------------------------------
+# 🐢 Requêtes SQL
+# -------------------------------------------------
+st.subheader("🐢 Requêtes SQL")
+st.caption(f"Requêtes au-delà de {query_stats.SLOW_QUERY_MS:g} ms journalisées dans "
+           f"`{query_stats.SLOW_QUERY_LOG}`.")
+sql = pd.DataFrame(query_stats.statistiques())
+if not sql.empty:
+    sql["moy_ms"] = (sql["duree_ms"] / sql["appels"]).round(1)
+    sql["lignes_moy"] = (sql["lignes"] / sql["appels"]).round(1)
+    st.dataframe(sql[["page", "sql", "appels", "duree_ms", "moy_ms", "max_ms", "lignes_moy", "lentes", "erreurs"]]
+                 .round(1).rename(columns={
+                     "page": "Page", "sql": "Requête (empreinte)", "appels": "Appels", "duree_ms": "Total (ms)",
+                     "moy_ms": "Moyenne (ms)", "max_ms": "Max (ms)", "lignes_moy": "Lignes (moy.)",
+                     "lentes": "Lentes", "erreurs": "Erreurs"}),
+                 use_container_width=True, hide_index=True)
+
+# -------------------------------------------------
+# 📚 Répliques en lecture
+# -------------------------------------------------
+replicas = etat_replicas()
+if replicas:
+    st.subheader("📚 Répliques en lecture")
+    st.caption(f"Utilisées si leur retard ≤ {REPLICA_MAX_LAG:g} s ; sinon lecture sur le primaire (repli).")
+    st.dataframe(pd.DataFrame(replicas).rename(columns={
+        "replique": "Réplique", "retard_s": "Retard (s)", "lectures": "Lectures servies", "replis": "Replis"}),
+        use_container_width=True, hide_index=True)
+
+# -------------------------------------------------
+# 📤 Export / remise à zéro
+# -------------------------------------------------
+col1, col2 = st.columns(2)
+with col1:
+    st.download_button("📥 Exporter (JSON)", data=profiling.export_json(),
+                       file_name=f"profilage_{datetime.now():%Y%m%d_%H%M}.json",
+                       mime="application/json")
+with col2:
+    if st.button("🗑️ Vider l'historique"):
+        profiling.vider()
+        query_stats.vider()
+        st.rerun()
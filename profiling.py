@@ -0,0 +1,135 @@
+# Profilage des reruns : temps par page et par étape, lignes et volume affichés
+import json
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+import pandas as pd
+
+TAILLE_ANNEAU = int(os.getenv("PROFILING_RING", "2000"))   # reruns conservés en mémoire
+
+_runs = deque(maxlen=TAILLE_ANNEAU)
+_lock = threading.Lock()
+_local = threading.local()      # chaque rerun Streamlit s'exécute dans son propre thread
+
+
+class Rerun:
+    __slots__ = ("page", "debut", "_t0", "_etape", "_t_etape", "etapes", "total_ms", "lignes", "octets", "termine")
+
+    def __init__(self, page):
+        self.page = page
+        self.debut = datetime.now()
+        self._t0 = self._t_etape = time.perf_counter()
+        self._etape = "début"
+        self.etapes = {}
+        self.total_ms = 0.0
+        self.lignes = 0
+        self.octets = 0
+        self.termine = False    # fin_page() atteint : seuls ces reruns entrent dans les percentiles
+
+    def _cloturer(self):
+        maintenant = time.perf_counter()
+        self.etapes[self._etape] = self.etapes.get(self._etape, 0.0) + (maintenant - self._t_etape) * 1000
+        self._t_etape = maintenant
+        self.total_ms = (maintenant - self._t0) * 1000
+
+    def as_dict(self):
+        return {"page": self.page, "debut": self.debut.isoformat(timespec="seconds"),
+                "total_ms": round(self.total_ms, 1), "termine": self.termine,
+                "lignes": self.lignes, "octets": self.octets,
+                "etapes": {k: round(v, 1) for k, v in self.etapes.items()}}
+
+
+def debut_page(page):
+    """À appeler en tête de script : ouvre l'enregistrement du rerun courant."""
+    run = Rerun(page)
+    _local.run = run
+    with _lock:
+        _runs.append(run)       # visible tout de suite : st.stop() / st.rerun() n'empêchent rien
+    return run
+
+
+def fin_page():
+    """À appeler en fin de script : clôt la dernière étape et fige le total du rerun.
+
+    Un rerun qui ne l'atteint pas (st.stop(), st.rerun(), exception) reste
+    ouvert : il est compté à part, hors des percentiles.
+    """
+    run = getattr(_local, "run", None)
+    if run is not None:
+        run._cloturer()
+        run.termine = True
+        _local.run = None
+
+
+def page_courante():
+    run = getattr(_local, "run", None)
+    return run.page if run else None
+
+
+def etape(nom):
+    """Clôt l'étape en cours (temps depuis le repère précédent) et ouvre `nom`."""
+    run = getattr(_local, "run", None)
+    if run is not None:
+        run._cloturer()
+        run._etape = nom
+
+
+def rendu(data):
+    """Comptabilise un tableau envoyé au navigateur (DataFrame ou liste de lignes)."""
+    run = getattr(_local, "run", None)
+    if run is None or data is None:
+        return
+    if isinstance(data, (pd.DataFrame, pd.Series)):
+        run.lignes += len(data)
+        mem = data.memory_usage(deep=True, index=False)
+        run.octets += int(mem.sum() if isinstance(mem, pd.Series) else mem)
+    else:
+        run.lignes += len(data)
+        run.octets += len(json.dumps(data, default=str))
+    run.total_ms = (time.perf_counter() - run._t0) * 1000
+
+
+def historique():
+    with _lock:
+        runs = list(_runs)
+    for run in runs:
+        if run is getattr(_local, "run", None):
+            run._cloturer()
+    return runs
+
+
+def resume():
+    """p50 / p95 du temps total par page, et par étape (reruns terminés seulement)."""
+    tous = historique()
+    runs = [r for r in tous if r.termine]
+    if not runs:
+        return pd.DataFrame(), pd.DataFrame()
+    df = pd.DataFrame([{"page": r.page, "total_ms": r.total_ms, "lignes": r.lignes, "octets": r.octets}
+                       for r in runs])
+    pages = df.groupby("page").agg(
+        reruns=("total_ms", "size"),
+        p50_ms=("total_ms", "median"),
+        p95_ms=("total_ms", lambda s: s.quantile(0.95)),
+        lignes_moy=("lignes", "mean"),
+        octets_moy=("octets", "mean"),
+    ).round(1).sort_values("p95_ms", ascending=False)
+    # arrêtés avant fin_page() : temps partiels, seulement comptés
+    ouverts = pd.Series([r.page for r in tous if not r.termine], dtype=object).value_counts()
+    pages["interrompus"] = ouverts.reindex(pages.index).fillna(0).astype(int)
+    det = pd.DataFrame([{"page": r.page, "etape": k, "ms": v} for r in runs for k, v in r.etapes.items()])
+    etapes = det.groupby(["page", "etape"])["ms"].describe(percentiles=[0.5, 0.95])[["count", "50%", "95%"]] \
+        .rename(columns={"count": "mesures", "50%": "p50_ms", "95%": "p95_ms"}).round(1) \
+        .sort_values("p95_ms", ascending=False)
+    return pages, etapes
+
+
+def export_json():
+    return json.dumps([r.as_dict() for r in historique()], ensure_ascii=False, indent=1)
+
+
+def vider():
+    with _lock:
+        _runs.clear()
@@ -0,0 +1,243 @@
+# Instrumentation SQL : empreinte, durée, lignes et page de chaque requête
+import hashlib
+import logging
+import os
+import re
+import threading
+import time
+from functools import lru_cache
+from logging.handlers import RotatingFileHandler
+
+import profiling
+
+# -----------------------------------------------------
+# ⚙️ Paramètres
+# -----------------------------------------------------
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "250"))           # seuil du journal des requêtes lentes
+SLOW_QUERY_LOG = os.getenv("SLOW_QUERY_LOG", "logs/requetes_lentes.log")
+SLOW_QUERY_LOG_MB = float(os.getenv("SLOW_QUERY_LOG_MB", "10"))    # taille avant rotation
+METRICS_FILE = os.getenv("SQL_METRICS_FILE", "logs/sql_{pid}.prom")  # format texte Prometheus
+METRICS_INTERVAL = float(os.getenv("SQL_METRICS_INTERVAL", "15"))  # s entre deux écritures
+
+_lock = threading.Lock()
+_stats = {}             # (empreinte, page) -> compteurs
+_etat = {"ecrit": 0.0, "journal": None}
+
+
+# -----------------------------------------------------
+# 🔎 Empreinte : la requête sans ses valeurs
+# -----------------------------------------------------
+_COMMENTAIRES = re.compile(r"--[^\n]*|/\*.*?\*/", re.S)
+_CHAINES = re.compile(r"'(?:[^'\\]|\\.)*'|\"(?:[^\"\\]|\\.)*\"")
+_PARAMS = re.compile(r"%\(\w+\)s|%s|\b\d+(?:\.\d+)?\b")
+_LISTES_IN = re.compile(r"\bin\s*\(\s*\?(?:\s*,\s*\?)*\s*\)")
+_VALUES = re.compile(r"\bvalues\s*\([^()]*\)(?:\s*,\s*\([^()]*\))*")
+_ESPACES = re.compile(r"\s+")
+
+
+@lru_cache(maxsize=2048)
+def fingerprint(sql):
+    """`WHERE id IN (%s, %s)` et `WHERE id IN (1, 2, 3)` donnent la même empreinte."""
+    sql = _COMMENTAIRES.sub(" ", sql)
+    sql = _CHAINES.sub("?", sql)
+    sql = _PARAMS.sub("?", sql)
+    sql = _ESPACES.sub(" ", sql).strip().lower()
+    sql = _LISTES_IN.sub("in (?+)", sql)
+    return _VALUES.sub("values (...)", sql)
+
+
+def _identifiant(empreinte):
+    return hashlib.sha1(empreinte.encode()).hexdigest()[:10]
+
+
+# -----------------------------------------------------
+# 📝 Enregistrement
+# -----------------------------------------------------
+def _journal():
+    if _etat["journal"] is None:
+        logger = logging.getLogger("cadmeko.requetes_lentes")
+        logger.propagate = False
+        if SLOW_QUERY_LOG and not logger.handlers:
+            os.makedirs(os.path.dirname(SLOW_QUERY_LOG) or ".", exist_ok=True)
+            handler = RotatingFileHandler(SLOW_QUERY_LOG, maxBytes=int(SLOW_QUERY_LOG_MB * 1024 * 1024),
+                                          backupCount=5, encoding="utf-8")
+            handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+            logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+        _etat["journal"] = logger
+    return _etat["journal"]
+
+
+def enregistrer(sql, duree_ms, lignes, page=None, erreur=False):
+    """Comptabilise une requête terminée (lecture des résultats comprise)."""
+    empreinte = fingerprint(sql)
+    page = page or "-"
+    lente = SLOW_QUERY_MS >= 0 and duree_ms >= SLOW_QUERY_MS
+    with _lock:
+        s = _stats.get((empreinte, page))
+        if s is None:
+            s = _stats[(empreinte, page)] = {"appels": 0, "duree_ms": 0.0, "max_ms": 0.0,
+                                             "lignes": 0, "erreurs": 0, "lentes": 0}
+        s["appels"] += 1
+        s["duree_ms"] += duree_ms
+        s["max_ms"] = max(s["max_ms"], duree_ms)
+        s["lignes"] += max(lignes, 0)
+        s["erreurs"] += erreur
+        s["lentes"] += lente
+        a_ecrire = METRICS_FILE and time.monotonic() - _etat["ecrit"] >= METRICS_INTERVAL
+        if a_ecrire:
+            _etat["ecrit"] = time.monotonic()
+    if lente:
+        _journal().info("%.1f ms | %s lignes | page=%s | %s%s", duree_ms, lignes, page,
+                        empreinte, " | ERREUR" if erreur else "")
+    if a_ecrire:
+        ecrire_metriques()
+
+
+def statistiques():
+    """Compteurs agrégés par empreinte et par page, les plus coûteux d'abord."""
+    with _lock:
+        lignes = [{"requete": _identifiant(e), "page": p, "sql": e, **s} for (e, p), s in _stats.items()]
+    return sorted(lignes, key=lambda s: s["duree_ms"], reverse=True)
+
+
+def vider():
+    with _lock:
+        _stats.clear()
+
+
+# -----------------------------------------------------
+# 📈 Export au format texte Prometheus (node_exporter --collector.textfile)
+# -----------------------------------------------------
+_METRIQUES = [
+    ("cadmeko_sql_requetes_total", "counter", "Requêtes SQL exécutées", lambda s: s["appels"]),
+    ("cadmeko_sql_duree_seconds_total", "counter", "Temps cumulé (exécution + lecture)",
+     lambda s: s["duree_ms"] / 1000),
+    ("cadmeko_sql_duree_max_seconds", "gauge", "Requête la plus longue", lambda s: s["max_ms"] / 1000),
+    ("cadmeko_sql_lignes_total", "counter", "Lignes lues ou modifiées", lambda s: s["lignes"]),
+    ("cadmeko_sql_erreurs_total", "counter", "Requêtes en erreur", lambda s: s["erreurs"]),
+    ("cadmeko_sql_lentes_total", "counter", "Requêtes au-delà de SLOW_QUERY_MS", lambda s: s["lentes"]),
+]
+
+
+def _echapper(valeur):
+    return str(valeur).replace("\\", "\\\\").replace("\n", " ").replace('"', '\\"')
+
+
+def metriques_texte():
+    stats = statistiques()
+    sortie = []
+    for nom, type_, aide, valeur in _METRIQUES:
+        sortie += [f"# HELP {nom} {aide}", f"# TYPE {nom} {type_}"]
+        sortie += [f'{nom}{{requete="{s["requete"]}",page="{_echapper(s["page"])}"}} {valeur(s):g}'
+                   for s in stats]
+    sortie += ["# HELP cadmeko_sql_requete_info Texte normalisé de chaque empreinte",
+               "# TYPE cadmeko_sql_requete_info gauge"]
+    vues = set()
+    for s in stats:
+        if s["requete"] not in vues:
+            vues.add(s["requete"])
+            sortie.append(f'cadmeko_sql_requete_info{{requete="{s["requete"]}",sql="{_echapper(s["sql"][:300])}"}} 1')
+    return "\n".join(sortie) + "\n"
+
+
+def ecrire_metriques(chemin=None):
+    """Écrit le fichier de métriques (remplacement atomique, un fichier par processus)."""
+    chemin = (chemin or METRICS_FILE).format(pid=os.getpid())
+    os.makedirs(os.path.dirname(chemin) or ".", exist_ok=True)
+    tmp = f"{chemin}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(metriques_texte())
+    os.replace(tmp, chemin)
+
+
+# -----------------------------------------------------
+# 🧮 Curseur instrumenté
+# -----------------------------------------------------
+class InstrumentedCursor:
+    """Enveloppe un curseur mysql-connector.
+
+    Une requête est mesurée de son execute() jusqu'à la fin de la lecture de
+    ses lignes (ou jusqu'au execute() suivant / à la fermeture du curseur).
+    """
+
+    def __init__(self, raw):
+        self._raw = raw
+        self._en_cours = None       # [sql, page, durée_ms, lignes]
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
+
+    def __iter__(self):
+        return iter(self.fetchone, None)
+
+    def _terminer(self, erreur=False):
+        if self._en_cours is not None:
+            sql, page, duree_ms, lignes = self._en_cours
+            self._en_cours = None
+            enregistrer(sql, duree_ms, lignes, page, erreur)
+
+    def _lire(self, fetch, *args):
+        t0 = time.perf_counter()
+        try:
+            resultat = fetch(*args)
+        except Exception:
+            self._terminer(erreur=True)
+            raise
+        if self._en_cours is not None:
+            self._en_cours[2] += (time.perf_counter() - t0) * 1000
+        return resultat
+
+    def execute(self, operation, params=None, *args, **kwargs):
+        self._terminer()
+        page = profiling.page_courante()
+        t0 = time.perf_counter()
+        try:
+            resultat = self._raw.execute(operation, params, *args, **kwargs)
+        except Exception:
+            enregistrer(operation, (time.perf_counter() - t0) * 1000, 0, page, erreur=True)
+            raise
+        self._en_cours = [operation, page, (time.perf_counter() - t0) * 1000, 0]
+        if not getattr(self._raw, "with_rows", False):
+            self._en_cours[3] = self._raw.rowcount      # lignes modifiées
+            self._terminer()
+        return resultat
+
+    def executemany(self, operation, seq_params, *args, **kwargs):
+        self._terminer()
+        page = profiling.page_courante()
+        t0 = time.perf_counter()
+        try:
+            resultat = self._raw.executemany(operation, seq_params, *args, **kwargs)
+        except Exception:
+            enregistrer(operation, (time.perf_counter() - t0) * 1000, 0, page, erreur=True)
+            raise
+        enregistrer(operation, (time.perf_counter() - t0) * 1000, self._raw.rowcount, page)
+        return resultat
+
+    def fetchone(self):
+        row = self._lire(self._raw.fetchone)
+        if row is None:
+            self._terminer()
+        elif self._en_cours is not None:
+            self._en_cours[3] += 1
+        return row
+
+    def fetchmany(self, size=None):
+        rows = self._lire(self._raw.fetchmany, size) if size else self._lire(self._raw.fetchmany)
+        if self._en_cours is not None:
+            self._en_cours[3] += len(rows)
+            if not rows:
+                self._terminer()
+        return rows
+
+    def fetchall(self):
+        rows = self._lire(self._raw.fetchall)
+        if self._en_cours is not None:
+            self._en_cours[3] += len(rows)
+        self._terminer()
+        return rows
+
+    def close(self):
+        self._terminer()
+        return self._raw.close()
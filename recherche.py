@@ -0,0 +1,219 @@
+# Recherche de produits à la frappe : index en mémoire (préfixes + trigrammes), partagé par les sessions
+import bisect
+import heapq
+import itertools
+import os
+import re
+import sys
+import threading
+import time
+import unicodedata
+from collections import defaultdict
+from functools import lru_cache
+
+import streamlit as st
+
+import migrations
+from cache import versions
+from database import connection
+
+TOP_K = int(os.getenv("RECHERCHE_TOP_K", "20"))
+RECONSTRUCTION = float(os.getenv("RECHERCHE_RECONSTRUCTION", "86400"))  # s entre deux reconstructions complètes
+# s relus avant maj_max à chaque mise à jour : une transaction validée tard porte un maj antérieur
+RECOUVREMENT = int(os.getenv("RECHERCHE_RECOUVREMENT", "300"))
+SIMILARITE_MIN = 0.3        # part des trigrammes de la saisie à retrouver (recherche approchée)
+
+_NON_ALNUM = re.compile(r"[^0-9a-z]+")
+
+
+def normaliser(texte):
+    """Minuscules, sans accents ni ponctuation : « Paracétamol 500mg » → « paracetamol 500mg »."""
+    texte = unicodedata.normalize("NFKD", str(texte or "")).encode("ascii", "ignore").decode().lower()
+    return _NON_ALNUM.sub(" ", texte).strip()
+
+
+@lru_cache(maxsize=65536)
+def _trigrammes_mot(mot):
+    return frozenset(mot[i:i + 3] for i in range(len(mot) - 2)) if len(mot) >= 3 else frozenset((mot,))
+
+
+def trigrammes(texte):
+    """Trigrammes de chaque mot (les mots se répètent beaucoup d'un produit à l'autre : mis en cache)."""
+    return set().union(*map(_trigrammes_mot, texte.split()))
+
+
+class IndexProduits:
+    """Catalogue en mémoire : mots triés (préfixes) et trigrammes → produits.
+
+    Mis à jour par incréments (produits modifiés depuis la dernière lecture,
+    colonne produit.maj) ; reconstruit entièrement si des produits ont été
+    supprimés ou toutes les RECONSTRUCTION secondes.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self.docs = {}              # id -> (code, nom, forme, dosage, mots, trigrammes, nom normalisé, code normalisé)
+        self._mots = []             # [(mot, id)] trié
+        self._tri = defaultdict(set)    # trigramme -> {id}
+        self._par_nom = None        # [(nom normalisé, id)] trié (saisie courte), recalculé au besoin
+        self.version = None
+        self.maj_max = None
+        self.construit_le = float("-inf")
+
+    # ---------- écriture ----------
+    def _retirer(self, pid):
+        doc = self.docs.pop(pid, None)
+        if doc is None:
+            return
+        for mot in doc[4]:
+            i = bisect.bisect_left(self._mots, (mot, pid))
+            if i < len(self._mots) and self._mots[i] == (mot, pid):
+                del self._mots[i]
+        for t in doc[5]:
+            ids = self._tri.get(t)
+            if ids:
+                ids.discard(pid)
+                if not ids:
+                    del self._tri[t]
+
+    def _ajouter(self, pid, code, nom, forme, dosage, en_masse=False):
+        nom_n, code_n = normaliser(nom), normaliser(code)
+        mots = {sys.intern(m) for m in f"{nom_n} {code_n} {normaliser(forme)} {normaliser(dosage)}".split()}
+        tri = trigrammes(nom_n)         # fautes de frappe : sur le nom seulement
+        self.docs[pid] = (code, nom, forme, dosage, mots, tri, nom_n, code_n)
+        if en_masse:
+            self._mots.extend((mot, pid) for mot in mots)
+        else:
+            for mot in mots:
+                bisect.insort(self._mots, (mot, pid))
+        postings = self._tri
+        for t in tri:
+            postings[t].add(pid)
+
+    def charger(self, lignes, complet):
+        """`lignes` : (id, code, nom, forme, dosage, maj)."""
+        with self._lock:
+            if complet:
+                self.docs, self._mots, self._tri = {}, [], defaultdict(set)
+            for pid, code, nom, forme, dosage, maj in lignes:
+                if not complet:
+                    self._retirer(pid)
+                self._ajouter(pid, code, nom, forme, dosage, en_masse=complet)
+                if self.maj_max is None or maj > self.maj_max:
+                    self.maj_max = maj
+            if complet:
+                self._mots.sort()
+            self._par_nom = None
+
+    # ---------- lecture ----------
+    def _prefixe(self, debut):
+        i = bisect.bisect_left(self._mots, (debut,))
+        ids = set()
+        while i < len(self._mots) and self._mots[i][0].startswith(debut):
+            ids.add(self._mots[i][1])
+            i += 1
+        return ids
+
+    def _approche(self, requete, exclus, k):
+        """Produits partageant au moins SIMILARITE_MIN des trigrammes de la saisie.
+
+        Candidats tirés des listes les plus rares (principe des tiroirs : un
+        produit en partageant m sur n figure dans l'une des n-m+1 plus rares),
+        puis score de Jaccard exact.
+        """
+        q = trigrammes(requete)
+        if not q:
+            return []
+        listes = sorted((self._tri.get(t, ()) for t in q), key=len)
+        m = max(1, int(len(q) * SIMILARITE_MIN + 0.999))
+        candidats = set().union(*listes[:len(q) - m + 1]) - exclus
+        scores = []
+        for pid in candidats:
+            commun = len(q & self.docs[pid][5])
+            if commun >= m:
+                scores.append((commun / (len(q) + len(self.docs[pid][5]) - commun), pid))
+        return [pid for _, pid in heapq.nlargest(k, scores)]
+
+    def rechercher(self, texte, k=TOP_K):
+        requete = normaliser(texte)
+        with self._lock:
+            if len(requete) < 2:
+                # saisie vide ou d'une lettre : ordre alphabétique, sans parcourir l'index
+                if self._par_nom is None:
+                    self._par_nom = sorted((doc[6], pid) for pid, doc in self.docs.items())
+                debut = bisect.bisect_left(self._par_nom, (requete,))
+                ids = [pid for nom, pid in itertools.islice(self._par_nom, debut, debut + k) if nom.startswith(requete)]
+                return [self._resultat(pid) for pid in ids]
+            mots = requete.split()
+            # préfixes : chaque mot saisi doit commencer un mot du produit
+            ensembles = sorted((self._prefixe(m) for m in mots), key=len)
+            trouves = set.intersection(*ensembles) if ensembles else set()
+
+            def rang(pid):
+                doc = self.docs[pid]
+                return (doc[7] != requete, not doc[6].startswith(requete), len(doc[1]), doc[1])
+
+            ids = heapq.nsmallest(k, trouves, key=rang)
+            if len(ids) < k:
+                ids += self._approche(requete, trouves, k - len(ids))
+            return [self._resultat(pid) for pid in ids]
+
+    def _resultat(self, pid):
+        code, nom, forme, dosage = self.docs[pid][:4]
+        return {"id_produit": pid, "code_produit": code, "nom_produit": nom, "forme": forme, "dosage": dosage}
+
+
+_index = IndexProduits()
+_maj_lock = threading.Lock()
+
+_COLONNES = "SELECT id_produit, code_produit, nom_produit, forme, dosage, maj FROM produit"
+
+
+def _rafraichir():
+    """Aligne l'index sur la table produit si sa version a changé (cache.versions).
+
+    Une reconstruction complète se fait dans un nouvel index, échangé une fois
+    prêt : les recherches des autres sessions continuent sur l'ancien.
+    """
+    global _index
+    version = versions(("produit",))
+    if version == _index.version and time.monotonic() - _index.construit_le < RECONSTRUCTION:
+        return
+    with _maj_lock:
+        if version == _index.version and time.monotonic() - _index.construit_le < RECONSTRUCTION:
+            return
+        migrations.ensure_schema()
+        with connection() as conn:
+            cur = conn.cursor()
+            complet = _index.maj_max is None or time.monotonic() - _index.construit_le >= RECONSTRUCTION
+            if not complet:
+                # fenêtre de recouvrement : les modifications validées après coup avec un maj
+                # antérieur à maj_max sont relues (sans effet si déjà vues)
+                cur.execute(f"{_COLONNES} WHERE maj >= %s - INTERVAL %s SECOND", (_index.maj_max, RECOUVREMENT))
+                _index.charger(cur.fetchall(), complet=False)
+                cur.execute("SELECT COUNT(*) FROM produit")
+                complet = cur.fetchone()[0] != len(_index.docs)      # suppressions
+            if complet:
+                cur.execute(_COLONNES)
+                nouveau = IndexProduits()
+                nouveau.charger(cur.fetchall(), complet=True)
+                nouveau.construit_le = time.monotonic()
+                _index = nouveau
+        _index.version = version
+
+
+def rechercher(texte, k=TOP_K):
+    """Les k produits les plus pertinents : préfixes de mots d'abord, puis approchés (fautes de frappe)."""
+    _rafraichir()
+    return _index.rechercher(texte, k)
+
+
+def champ_recherche(key, label="Rechercher un produit"):
+    """Champ de saisie (hors formulaire, pour filtrer à chaque frappe validée) ; retourne les résultats."""
+    texte = st.text_input(f"🔎 {label}", key=key, placeholder="Nom, code, forme ou dosage…")
+    return rechercher(texte)
+
+
+def libelle(p):
+    details = " ".join(x for x in (p["forme"], p["dosage"]) if x)
+    return f"{p['nom_produit']} ({p['code_produit']})" + (f" – {details}" if details else "")
@@ -0,0 +1,82 @@
+# Agrégats journaliers des commandes (par produit, par client), tenus à jour à l'écriture
+import sys
+from datetime import date
+
+from cache import invalidate
+from database import transaction
+
+TABLES = ("rollup_produit_jour", "rollup_client_jour")
+
+
+def enregistrer(conn, jour, id_client, lignes):
+    """Ajoute une commande aux agrégats, dans la transaction qui l'écrit.
+
+    `lignes` : [(id_produit, quantite), ...].
+    """
+    par_produit = {}
+    for pid, qty in lignes:
+        q, n = par_produit.get(pid, (0, 0))
+        par_produit[pid] = (q + qty, n + 1)
+    cur = conn.cursor()
+    cur.executemany("""
+        INSERT INTO rollup_produit_jour (jour, id_produit, quantite, nb_lignes) VALUES (%s,%s,%s,%s)
+        ON DUPLICATE KEY UPDATE quantite = quantite + VALUES(quantite), nb_lignes = nb_lignes + VALUES(nb_lignes)
+    """, [(jour, pid, q, n) for pid, (q, n) in par_produit.items()])
+    cur.execute("""
+        INSERT INTO rollup_client_jour (jour, id_client, nb_commandes, quantite) VALUES (%s,%s,1,%s)
+        ON DUPLICATE KEY UPDATE nb_commandes = nb_commandes + 1, quantite = quantite + VALUES(quantite)
+    """, (jour, id_client, sum(qty for _, qty in lignes)))
+    invalidate(conn, *TABLES)
+
+
+def rattraper(debut=None, fin=None):
+    """Recalcule les agrégats des jours [debut, fin] depuis les tables de détail.
+
+    Sert à l'initialisation (migration 4) et après une correction faite hors
+    de l'application. Sans bornes : tout l'historique. Les mois archivés
+    (archive.py) sont exclus : leurs lignes ne sont plus en base, leurs
+    agrégats sont définitifs. Appelée par la migration 4, avant que la table
+    archive_periode existe : sa présence est vérifiée.
+    """
+    with transaction() as conn:
+        cur = conn.cursor()
+        if debut is None or fin is None:
+            cur.execute("SELECT MIN(date_commande), MAX(date_commande) FROM commande")
+            mini, maxi = cur.fetchone()
+            debut, fin = debut or mini, fin or maxi
+        cur.execute("""
+            SELECT COUNT(*) FROM information_schema.tables
+            WHERE table_schema = DATABASE() AND table_name = 'archive_periode'
+        """)
+        if cur.fetchone()[0] and debut is not None:
+            cur.execute("""
+                SELECT MAX(mois) + INTERVAL 1 MONTH FROM archive_periode WHERE nom_table = 'commande'
+            """)
+            horizon = cur.fetchone()[0]
+            if horizon is not None and debut < horizon:
+                debut = horizon
+        if debut is None or fin is None or debut > fin:
+            return
+        for table in TABLES:
+            cur.execute(f"DELETE FROM {table} WHERE jour BETWEEN %s AND %s", (debut, fin))
+        cur.execute("""
+            INSERT INTO rollup_produit_jour (jour, id_produit, quantite, nb_lignes)
+            SELECT c.date_commande, d.id_produit, SUM(d.quantite_dmd), COUNT(*)
+            FROM commande c JOIN commande_detail d ON d.id_commande = c.id_commande
+            WHERE c.date_commande BETWEEN %s AND %s
+            GROUP BY c.date_commande, d.id_produit
+        """, (debut, fin))
+        cur.execute("""
+            INSERT INTO rollup_client_jour (jour, id_client, nb_commandes, quantite)
+            SELECT c.date_commande, c.id_client, COUNT(DISTINCT c.id_commande), COALESCE(SUM(d.quantite_dmd), 0)
+            FROM commande c LEFT JOIN commande_detail d ON d.id_commande = c.id_commande
+            WHERE c.date_commande BETWEEN %s AND %s
+            GROUP BY c.date_commande, c.id_client
+        """, (debut, fin))
+        invalidate(conn, *TABLES)
+
+
+if __name__ == "__main__":
+    # python rollups.py [AAAA-MM-JJ AAAA-MM-JJ]
+    bornes = [date.fromisoformat(a) for a in sys.argv[1:3]]
+    rattraper(*bornes)
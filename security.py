@@ -1,7 +1,181 @@
-# Authentification + roles 
+# Authentification + roles
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
 import streamlit as st
 import bcrypt
-from database import get_connection
+from cache import invalidate
+from database import connection, transaction
+
+# -----------------------------------------------------
+# ⚙️ Paramètres
+# -----------------------------------------------------
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+BCRYPT_WORKERS = int(os.getenv("BCRYPT_WORKERS", "2"))         # hachages simultanés max
+BCRYPT_QUEUE = int(os.getenv("BCRYPT_QUEUE", "8"))             # vérifications en attente max
+LOGIN_MAX_ECHECS = int(os.getenv("LOGIN_MAX_ECHECS", "5"))     # par identifiant depuis un même poste
+CLIENT_MAX_ECHECS = int(os.getenv("CLIENT_MAX_ECHECS", "20"))  # par poste client
+FENETRE_ECHECS = float(os.getenv("LOGIN_FENETRE", "900"))      # s
+LOGIN_DELAI_MAX = float(os.getenv("LOGIN_DELAI_MAX", "60"))    # s, attente max imposée à un identifiant
+# seuls ces proxies (reverse proxy devant Streamlit) peuvent fixer X-Forwarded-For
+PROXIES_CONFIANCE = {p.strip() for p in os.getenv("PROXIES_CONFIANCE", "").split(",") if p.strip()}
+
+# bcrypt libère le GIL : le pool borne le CPU consacré aux connexions
+# et évite de bloquer les reruns des autres sessions.
+_pool = ThreadPoolExecutor(max_workers=BCRYPT_WORKERS, thread_name_prefix="bcrypt")
+_places = threading.BoundedSemaphore(BCRYPT_WORKERS + BCRYPT_QUEUE)
+# vérifiée quand l'identifiant n'existe pas : même durée de réponse
+_HASH_LEURRE = bcrypt.hashpw(b"cadmeko", bcrypt.gensalt(BCRYPT_ROUNDS))
+
+
+class ServeurOccupe(Exception):
+    """Trop de vérifications de mot de passe en cours."""
+
+
+class _Limiteur:
+    """Compte les échecs récents par clé (fenêtre glissante).
+
+    Au-delà de `maximum` échecs, la clé est bloquée jusqu'à la fin de la
+    fenêtre ; avec `delai_max`, elle attend seulement un délai qui double à
+    chaque échec (plafonné), sans jamais être verrouillée.
+    """
+
+    def __init__(self, maximum, fenetre=FENETRE_ECHECS, delai_max=None):
+        self.maximum = maximum
+        self.fenetre = fenetre
+        self.delai_max = delai_max
+        self._echecs = {}
+        self._lock = threading.Lock()
+
+    def _purger(self, cle, maintenant):
+        file = self._echecs.get(cle)
+        while file and maintenant - file[0] > self.fenetre:
+            file.popleft()
+        if file is not None and not file:
+            del self._echecs[cle]
+        return file
+
+    def bloque(self, cle):
+        with self._lock:
+            maintenant = time.monotonic()
+            file = self._purger(cle, maintenant)
+            if not file or len(file) < self.maximum:
+                return False
+            if self.delai_max is None:
+                return True
+            delai = min(2 ** (len(file) - self.maximum), self.delai_max)
+            return maintenant - file[-1] < delai
+
+    def echec(self, cle):
+        with self._lock:
+            maintenant = time.monotonic()
+            self._echecs.setdefault(cle, deque()).append(maintenant)
+            # clés jamais reconsultées (identifiants au hasard, postes de passage)
+            if len(self._echecs) > 10_000:
+                for autre in list(self._echecs):
+                    self._purger(autre, maintenant)
+
+    def reinitialiser(self, cle):
+        with self._lock:
+            self._echecs.pop(cle, None)
+
+
+# un identifiant n'est jamais verrouillé pour tous (sinon 5 essais suffiraient à
+# bloquer l'administrateur) : blocage par (poste, identifiant), attente croissante
+# par identifiant contre les essais répartis sur plusieurs postes
+_par_poste_login = _Limiteur(LOGIN_MAX_ECHECS)
+_par_login = _Limiteur(LOGIN_MAX_ECHECS, delai_max=LOGIN_DELAI_MAX)
+_par_client = _Limiteur(CLIENT_MAX_ECHECS)
+
+
+def _bloque(login, client):
+    return _par_poste_login.bloque((client, login)) or _par_login.bloque(login) or _par_client.bloque(client)
+
+
+def _executer(fn, *args):
+    if not _places.acquire(blocking=False):
+        raise ServeurOccupe()
+    try:
+        return _pool.submit(fn, *args).result()
+    finally:
+        _places.release()
+
+
+def hash_password(pwd):
+    """Hachage bcrypt au coût BCRYPT_ROUNDS, exécuté dans le pool borné."""
+    return _executer(lambda: bcrypt.hashpw(pwd.encode(), bcrypt.gensalt(BCRYPT_ROUNDS)).decode())
+
+
+def _cout(pwd_hash):
+    try:
+        return int(pwd_hash.split("$")[2])
+    except (IndexError, ValueError):
+        return None
+
+
+def _client_id():
+    """Adresse du poste client si Streamlit l'expose, sinon la session.
+
+    X-Forwarded-For n'est lu que si la connexion vient d'un proxy de
+    PROXIES_CONFIANCE : on retient, de droite à gauche, la première adresse
+    qui n'est pas l'un d'eux (les précédentes sont fournies par le client).
+    """
+    ctx = getattr(st, "context", None)
+    ip = getattr(ctx, "ip_address", None) if ctx is not None else None
+    if ip in PROXIES_CONFIANCE:
+        chaine = (getattr(ctx, "headers", None) or {}).get("X-Forwarded-For", "")
+        for adresse in reversed([a.strip() for a in chaine.split(",") if a.strip()]):
+            ip = adresse
+            if adresse not in PROXIES_CONFIANCE:
+                break
+    if ip:
+        return ip
+    from streamlit.runtime.scriptrunner import get_script_run_ctx
+    run_ctx = get_script_run_ctx()
+    return run_ctx.session_id if run_ctx else "inconnu"
+
+
+def authentifier(login, pwd, client):
+    """Retourne l'utilisateur {id, login, role} ou None.
+
+    Lève ServeurOccupe si le pool de hachage est saturé. Les tentatives sont
+    refusées avant tout hachage quand le poste, l'identifiant depuis ce poste
+    ou l'identifiant (attente croissante) a trop d'échecs.
+    """
+    if _bloque(login, client):
+        return None
+
+    with connection() as conn:
+        cursor = conn.cursor(dictionary=True)
+        cursor.execute("SELECT id_user, login, role, pwd_hash FROM utilisateur WHERE login=%s", (login,))
+        user = cursor.fetchone()
+
+    pwd_hash = user["pwd_hash"].encode() if user else _HASH_LEURRE
+    ok = _executer(bcrypt.checkpw, pwd.encode(), pwd_hash) and user is not None
+    if not ok:
+        _par_poste_login.echec((client, login))
+        _par_login.echec(login)
+        _par_client.echec(client)
+        return None
+
+    _par_poste_login.reinitialiser((client, login))
+    _par_login.reinitialiser(login)
+    if _cout(user["pwd_hash"]) != BCRYPT_ROUNDS:
+        # coût modifié : rehachage transparent avec le mot de passe en clair
+        try:
+            nouveau = hash_password(pwd)
+        except ServeurOccupe:
+            nouveau = None              # ce sera pour la prochaine connexion
+        if nouveau:
+            with transaction() as conn:
+                conn.cursor().execute("UPDATE utilisateur SET pwd_hash=%s WHERE id_user=%s",
+                                      (nouveau, user["id_user"]))
+                invalidate(conn, "utilisateur")
+    return {"id": user["id_user"], "login": user["login"], "role": user["role"]}
+
 
 def login_user():
     if "user" in st.session_state:
@@ -14,14 +188,18 @@ def login_user():
         submitted = st.form_submit_button("Se connecter")
 
         if submitted:
-            conn = get_connection()
-            cursor = conn.cursor(dictionary=True)
-            cursor.execute("SELECT * FROM utilisateur WHERE login=%s", (login,))
-            user = cursor.fetchone()
-            conn.close()
-
-            if user and bcrypt.checkpw(pwd.encode(), user["pwd_hash"].encode()):
-                st.session_state["user"] = {"id": user["id_user"], "login": user["login"], "role": user["role"]}
+            client = _client_id()
+            if _bloque(login, client):
+                st.error("Trop de tentatives échouées. Réessayez dans quelques minutes.")
+                return None
+            try:
+                user = authentifier(login, pwd, client)
+            except ServeurOccupe:
+                st.error("Serveur occupé, veuillez réessayer dans un instant.")
+                return None
+
+            if user:
+                st.session_state["user"] = user
                 st.success("Connexion réussie ✅")
                 st.rerun()
             else:
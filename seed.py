@@ -0,0 +1,221 @@
+# Jeu de données synthétique aux volumes réels (banc d'essai, recette)
+#
+#   python seed.py --base cadmeko_bench --vider              → 100k produits, 1M mouvements, 500k commandes
+#   python seed.py --base cadmeko_bench --vider --echelle 0.1
+#
+# La base cible doit être une base MySQL dédiée : --vider efface toutes les
+# données métier (les utilisateurs sont conservés).
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import date, datetime, timedelta
+from itertools import accumulate
+
+# Volumes à l'échelle 1
+VOLUMES = {
+    "produits": 100_000,
+    "mouvements": 1_000_000,
+    "commandes": 500_000,
+    "clients": 5_000,
+    "fournisseurs": 200,
+}
+LOT = 5_000         # lignes par INSERT multi-lignes
+
+DCI = ["Paracétamol", "Amoxicilline", "Ibuprofène", "Métronidazole", "Ciprofloxacine", "Oméprazole",
+       "Artéméther-Luméfantrine", "Quinine", "Cotrimoxazole", "Diclofénac", "Vitamine C", "Fer-Acide folique",
+       "Salbutamol", "Metformine", "Amlodipine", "Doxycycline", "Albendazole", "Mébendazole", "Hydrochlorothiazide",
+       "Ceftriaxone", "Gentamicine", "Prednisolone", "Loratadine", "Captopril", "Glibenclamide", "Fluconazole",
+       "Azithromycine", "Ampicilline", "Dexaméthasone", "Zinc", "SRO", "Chlorphéniramine"]
+FORMES = ["Comprimé", "Gélule", "Sirop", "Injectable", "Pommade", "Suspension", "Sachet", "Collyre"]
+DOSAGES = ["5 mg", "10 mg", "100 mg", "250 mg", "500 mg", "1 g", "125 mg/5 ml", "250 mg/5 ml", "1 %"]
+LABOS = ["Cadmeko", "Pharmakina", "Zenufa", "Shalina", "Bioforce", "Medipharm", "Sanofi", "Cipla", "Denk", "Mylan"]
+VILLES = ["Kinshasa", "Lubumbashi", "Goma", "Bukavu", "Kisangani", "Matadi", "Kananga", "Mbuji-Mayi", "Kolwezi"]
+CLIENTS = ["Pharmacie", "Centre de santé", "Hôpital", "Clinique", "Dépôt pharmaceutique", "Poste de santé"]
+STATUTS = (["Livrée"] * 80) + (["En attente"] * 15) + (["Annulée"] * 5)
+
+TABLES_METIER = ["mouvement_site", "stock_site", "sync_conflit", "sync_envoye", "sync_recu",
+                 "mouvement_stock", "commande_detail", "commande", "lot", "alerte_stock", "stock",
+                 "stock_snapshot", "rollup_produit_jour", "rollup_client_jour", "sequence_commande",
+                 "produit", "client", "fournisseur"]
+
+
+def volumes(echelle):
+    return {k: max(10, int(v * echelle)) for k, v in VOLUMES.items()}
+
+
+def _inserer(cur, sql, lignes, total, libelle):
+    """INSERT par lots de LOT lignes (mysql-connector regroupe executemany en un seul INSERT)."""
+    lot, faites, t0 = [], 0, time.perf_counter()
+    for ligne in lignes:
+        lot.append(ligne)
+        if len(lot) == LOT:
+            cur.executemany(sql, lot)
+            faites += len(lot)
+            lot = []
+            print(f"\r  {libelle:<18} {faites:>10,} / {total:,}", end="", file=sys.stderr)
+    if lot:
+        cur.executemany(sql, lot)
+        faites += len(lot)
+    print(f"\r  {libelle:<18} {faites:>10,} lignes en {time.perf_counter() - t0:.1f} s", file=sys.stderr)
+    return faites
+
+
+# -----------------------------------------------------
+# 🧪 Générateurs (déterministes pour une graine donnée)
+# -----------------------------------------------------
+def _poids(rng, n):
+    """Popularité très inégale, comme en officine : quelques produits font l'essentiel du volume."""
+    return [rng.paretovariate(1.2) for _ in range(n)]
+
+
+def gen_produits(rng, n):
+    aujourdhui = date.today()
+    for i in range(1, n + 1):
+        dci, forme, dosage = rng.choice(DCI), rng.choice(FORMES), rng.choice(DOSAGES)
+        yield (i, f"P{i:07d}", f"{dci} {dosage} {forme} {rng.choice(LABOS)} {i % 97}", forme, dosage,
+               aujourdhui + timedelta(days=rng.randint(-60, 1100)), round(rng.uniform(0.5, 80), 2))
+
+
+def gen_clients(rng, n):
+    for i in range(1, n + 1):
+        yield (i, f"{rng.choice(CLIENTS)} {rng.choice(VILLES)} {i:05d}")
+
+
+def gen_fournisseurs(rng, n):
+    for i in range(1, n + 1):
+        yield (i, f"{rng.choice(LABOS)} Distribution {rng.choice(VILLES)} {i:03d}")
+
+
+def gen_mouvements(rng, n, n_produits, debut, fin, stock):
+    """Journal chronologique ; le stock courant (dict) est tenu à jour et ne passe jamais sous zéro."""
+    poids = _poids(rng, n_produits)
+    etendue = (fin - debut).total_seconds()
+    instants = sorted(rng.random() * etendue for _ in range(n))
+    produits = rng.choices(range(1, n_produits + 1), weights=poids, k=n)
+    for t, pid in zip(instants, produits):
+        quand = (debut + timedelta(seconds=t)).replace(microsecond=0)
+        tirage = rng.random()
+        dispo = stock.get(pid, 0)
+        if tirage < 0.35 and dispo > 0:
+            qty = -rng.randint(1, min(dispo, 50))
+            type_mvt, desc = "Sortie", "Vente comptoir"
+        elif tirage < 0.40 and dispo > 0:
+            qty = -rng.randint(1, min(dispo, 5))
+            type_mvt, desc = "Ajustement", "Inventaire"
+        else:
+            qty = rng.choice((10, 20, 50, 100, 200, 500))
+            type_mvt, desc = "Entrée", "Réception fournisseur"
+        stock[pid] = dispo + qty
+        yield (pid, quand, type_mvt, qty, desc)
+
+
+def gen_lots(rng, stock, maj):
+    """Stock final réparti sur 1 à 3 lots par produit, péremptions étalées (quelques-unes dépassées)."""
+    for pid, qty in stock.items():
+        nb = min(qty, rng.randint(1, 3))
+        coupures = sorted(rng.sample(range(1, qty), nb - 1)) if nb > 1 else []
+        for j, (a, b) in enumerate(zip([0] + coupures, coupures + [qty]), start=1):
+            yield (pid, f"L{pid:07d}-{j}", maj.date() + timedelta(days=rng.randint(-30, 900)), b - a, maj)
+
+
+def gen_commandes(rng, n, n_clients, debut, fin):
+    """En-têtes id 1..n, numérotés par jour comme sequences.code_commande."""
+    jours = (fin - debut).days + 1
+    dates = sorted(debut + timedelta(days=int(rng.random() * jours)) for _ in range(n))
+    poids_clients = _poids(rng, n_clients)
+    clients = rng.choices(range(1, n_clients + 1), weights=poids_clients, k=n)
+    numero, jour_prec = 0, None
+    for i, (jour, client) in enumerate(zip(dates, clients), start=1):
+        numero = numero + 1 if jour == jour_prec else 1
+        jour_prec = jour
+        yield (i, f"CMD-{jour:%Y%m%d}-{numero:03d}", jour, rng.choice(STATUTS), client)
+
+
+def gen_details(rng, n_commandes, n_produits):
+    cumul = list(accumulate(_poids(rng, n_produits)))     # poids cumulés : calculés une seule fois
+    ids = range(1, n_produits + 1)
+    for id_commande in range(1, n_commandes + 1):
+        nb = rng.choice((1, 1, 2, 2, 3, 3, 4, 5, 8))
+        for pid in set(rng.choices(ids, cum_weights=cumul, k=nb)):
+            qty = rng.randint(1, 60)
+            yield (id_commande, pid, qty, qty)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Remplit une base de test avec des volumes réalistes.")
+    parser.add_argument("--base", default=os.getenv("DB_NAME", "cadmeko"), help="base MySQL cible")
+    parser.add_argument("--echelle", type=float, default=1.0,
+                        help="facteur appliqué aux volumes (1 = 100k produits, 1M mouvements, 500k commandes)")
+    parser.add_argument("--jours", type=int, default=730, help="profondeur de l'historique (jours)")
+    parser.add_argument("--graine", type=int, default=42)
+    parser.add_argument("--vider", action="store_true", help="efface les données métier existantes")
+    args = parser.parse_args(argv)
+
+    os.environ["DB_NAME"] = args.base       # lu par database.DB_CONFIG à l'import
+    import alertes
+    import migrations
+    import rollups
+    import stock_history
+    from cache import invalidate
+    from database import connection, transaction
+
+    migrations.ensure_schema()
+    n = volumes(args.echelle)
+    rng = random.Random(args.graine)
+    fin = datetime.now().replace(microsecond=0) - timedelta(minutes=1)
+    debut = fin - timedelta(days=args.jours)
+    print(f"Base {args.base} : " + ", ".join(f"{v:,} {k}" for k, v in n.items()), file=sys.stderr)
+
+    with connection() as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT COUNT(*) FROM produit")
+        if cur.fetchone()[0] and not args.vider:
+            parser.error(f"la base {args.base} contient déjà des produits (ajouter --vider)")
+        # chargement en masse : les clés générées sont cohérentes, contrôles inutiles
+        cur.execute("SET SESSION foreign_key_checks = 0, unique_checks = 0")
+        try:
+            for table in TABLES_METIER:
+                cur.execute(f"TRUNCATE TABLE {table}")
+
+            _inserer(cur, """INSERT INTO produit (id_produit, code_produit, nom_produit, forme, dosage,
+                             date_peremption, prix_unitaire) VALUES (%s,%s,%s,%s,%s,%s,%s)""",
+                     gen_produits(rng, n["produits"]), n["produits"], "produits")
+            _inserer(cur, "INSERT INTO client (id_client, nom_client) VALUES (%s,%s)",
+                     gen_clients(rng, n["clients"]), n["clients"], "clients")
+            _inserer(cur, "INSERT INTO fournisseur (id_fournisseur, nom_fournisseur) VALUES (%s,%s)",
+                     gen_fournisseurs(rng, n["fournisseurs"]), n["fournisseurs"], "fournisseurs")
+
+            stock = {}
+            _inserer(cur, """INSERT INTO mouvement_stock (id_produit, date_mvt, type_mvt, quantite, description)
+                             VALUES (%s,%s,%s,%s,%s)""",
+                     gen_mouvements(rng, n["mouvements"], n["produits"], debut, fin, stock),
+                     n["mouvements"], "mouvements")
+            _inserer(cur, "INSERT INTO stock (id_produit, quantite, maj) VALUES (%s,%s,%s)",
+                     ((pid, q, fin) for pid, q in stock.items()), len(stock), "stock")
+            _inserer(cur, """INSERT INTO lot (id_produit, numero_lot, date_peremption, quantite, maj)
+                             VALUES (%s,%s,%s,%s,%s)""",
+                     gen_lots(rng, {p: q for p, q in stock.items() if q > 0}, fin), len(stock) * 2, "lots")
+
+            _inserer(cur, """INSERT INTO commande (id_commande, code_commande, date_commande, statut, id_client)
+                             VALUES (%s,%s,%s,%s,%s)""",
+                     gen_commandes(rng, n["commandes"], n["clients"], debut.date(), fin.date()),
+                     n["commandes"], "commandes")
+            _inserer(cur, """INSERT INTO commande_detail (id_commande, id_produit, quantite_dmd, quantite_livr)
+                             VALUES (%s,%s,%s,%s)""",
+                     gen_details(rng, n["commandes"], n["produits"]), n["commandes"] * 3, "lignes commande")
+        finally:
+            cur.execute("SET SESSION foreign_key_checks = 1, unique_checks = 1")
+
+    print("  agrégats journaliers…", file=sys.stderr)
+    rollups.rattraper()
+    stock_history.prendre_snapshot()
+    with transaction() as conn:
+        alertes.reconstruire(conn)
+        invalidate(conn, *TABLES_METIER)
+    print("Terminé.", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+# Numérotation des commandes : compteur journalier atomique, par blocs optionnels
+import os
+import threading
+from contextlib import nullcontext
+from datetime import date
+
+import migrations
+from database import connection
+
+# Numéros réservés d'un coup par processus (1 = numérotation dense et ordonnée)
+BLOCK_SIZE = max(1, int(os.getenv("SEQUENCE_BLOCK", "1")))
+
+# requêtes exactes (reprises par explain_check.py)
+SQL_RESERVER = "UPDATE sequence_commande SET dernier = LAST_INSERT_ID(dernier + %s) WHERE jour = %s"
+# premier numéro du jour : on repart du plus grand numéro déjà attribué
+# (un COUNT réattribuerait un code après une suppression)
+SQL_AMORCE = """
+    INSERT IGNORE INTO sequence_commande (jour, dernier)
+    SELECT %s, COALESCE(MAX(CAST(SUBSTRING_INDEX(code_commande, '-', -1) AS UNSIGNED)), 0)
+    FROM commande WHERE code_commande LIKE %s
+"""
+
+_lock = threading.Lock()
+_bloc = {"jour": None, "suivant": 0, "fin": -1}
+
+
+def motif(jour):
+    """Codes de commande du jour, pour LIKE."""
+    return f"CMD-{jour:%Y%m%d}-%"
+
+
+def _reserver(jour, n, conn=None):
+    """Réserve n numéros pour `jour` ; retourne le dernier.
+
+    Par défaut, instruction autocommit sur sa propre connexion : le verrou sur
+    la ligne du jour ne dure que le temps de l'UPDATE ; à appeler avant
+    d'ouvrir la transaction de commande (jamais une seconde connexion du pool
+    tenue en même temps). Avec `conn`, l'UPDATE rejoint la transaction de
+    l'appelant et le verrou court jusqu'à son COMMIT. Le nouveau compteur est
+    renvoyé par LAST_INSERT_ID(expr) dans le paquet OK (cursor.lastrowid),
+    sans second aller-retour.
+    """
+    migrations.ensure_schema()
+    with nullcontext(conn) if conn is not None else connection() as conn:
+        cur = conn.cursor()
+        cur.execute(SQL_RESERVER, (n, jour))
+        if cur.rowcount == 0:
+            cur.execute(SQL_AMORCE, (jour, motif(jour)))
+            cur.execute(SQL_RESERVER, (n, jour))
+        return cur.lastrowid
+
+
+def prochain_numero(jour=None, conn=None):
+    jour = jour or date.today()
+    if BLOCK_SIZE == 1 or conn is not None:
+        return _reserver(jour, 1, conn)
+    with _lock:
+        if _bloc["jour"] != jour or _bloc["suivant"] > _bloc["fin"]:
+            fin = _reserver(jour, BLOCK_SIZE)
+            _bloc.update(jour=jour, suivant=fin - BLOCK_SIZE + 1, fin=fin)
+        numero = _bloc["suivant"]
+        _bloc["suivant"] += 1
+        return numero
+
+
+def code_commande(jour=None, conn=None):
+    """CMD-20250709-001 ; `conn` : voir _reserver."""
+    jour = jour or date.today()
+    return f"CMD-{jour:%Y%m%d}-{prochain_numero(jour, conn):03d}"
+
+
+def codes_commande(n, jour=None):
+    """n codes consécutifs réservés en un UPDATE (lots de commandes de l'API)."""
+    jour = jour or date.today()
+    dernier = _reserver(jour, n)
+    return [f"CMD-{jour:%Y%m%d}-{numero:03d}" for numero in range(dernier - n + 1, dernier + 1)]
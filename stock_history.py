@@ -0,0 +1,209 @@
+# Historique du stock : instantanés périodiques + journal des mouvements
+import os
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+import archive
+import migrations
+from cache import cached, invalidate
+from database import connection, transaction
+from utils.colonnes import lire
+
+# Intervalle entre deux instantanés : borne le nombre de mouvements à rejouer
+SNAPSHOT_INTERVAL = timedelta(hours=float(os.getenv("STOCK_SNAPSHOT_HOURS", "24")))
+_CHECK_EVERY = 600      # s entre deux vérifications de la date du dernier instantané
+_PAQUET_REPORT = 500    # mouvements saisis après coup reportés par instruction
+
+_lock = threading.Lock()
+_etat = {"verifie": 0.0}
+
+
+class HorsHistorique(ValueError):
+    """Date antérieure au premier instantané : le stock initial n'est pas dans le
+    journal, la somme des mouvements ne donnerait pas le stock réel."""
+
+    def __init__(self, premier):
+        self.premier = premier
+        super().__init__(f"Historique du stock disponible à partir du {premier:%d/%m/%Y %H:%M}")
+
+
+def prendre_snapshot(instant=None):
+    """Copie le stock courant de tous les produits, horodaté."""
+    migrations.ensure_schema()
+    instant = (instant or datetime.now()).replace(microsecond=0)
+    with transaction() as conn:
+        cur = conn.cursor()
+        # INSERT ... SELECT pose des verrous partagés : aucun mouvement ne s'intercale
+        cur.execute("""
+            INSERT INTO stock_snapshot (date_snap, id_produit, quantite)
+            SELECT %s, id_produit, quantite FROM stock
+        """, (instant,))
+        invalidate(conn, "stock_snapshot")
+    return instant
+
+
+def reporter(conn, mouvements):
+    """Mouvements saisis après coup (date_mvt fournie) : ajoutés aux instantanés
+    déjà pris à leur date ou après, qui restent le stock à leur date.
+
+    `mouvements` : [(id_produit, date_mvt, quantite signée)]. À appeler dans la
+    transaction qui les journalise (verrous du stock déjà posés).
+    """
+    deltas = {}
+    for pid, date_mvt, qty in mouvements:
+        deltas[(pid, date_mvt)] = deltas.get((pid, date_mvt), 0) + qty
+    if not deltas:
+        return
+    cur = conn.cursor()
+    lignes = [(pid, d, q) for (pid, d), q in deltas.items()]
+    for i in range(0, len(lignes), _PAQUET_REPORT):
+        part = lignes[i:i + _PAQUET_REPORT]
+        # une instruction par paquet : chaque instantané reçoit la somme des mouvements datés avant lui
+        valeurs = " UNION ALL ".join(["SELECT %s AS id_produit, %s AS date_mvt, %s AS quantite"] * len(part))
+        cur.execute(f"""
+            INSERT INTO stock_snapshot (date_snap, id_produit, quantite)
+            SELECT s.date_snap, d.id_produit, SUM(d.quantite)
+            FROM (SELECT DISTINCT date_snap FROM stock_snapshot WHERE date_snap >= %s) s
+            JOIN ({valeurs}) d ON s.date_snap >= d.date_mvt
+            GROUP BY s.date_snap, d.id_produit
+            ON DUPLICATE KEY UPDATE quantite = quantite + VALUES(quantite)
+        """, [min(d for _, d, _ in part), *(v for ligne in part for v in ligne)])
+    invalidate(conn, "stock_snapshot")
+
+
+def snapshot_si_necessaire():
+    """Prend un instantané si le dernier date de plus de SNAPSHOT_INTERVAL."""
+    with _lock:
+        if time.monotonic() - _etat["verifie"] < _CHECK_EVERY:
+            return
+        _etat["verifie"] = time.monotonic()
+    migrations.ensure_schema()
+    with connection() as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT MAX(date_snap) FROM stock_snapshot")
+        dernier = cur.fetchone()[0]
+    if dernier is None or datetime.now() - dernier >= SNAPSHOT_INTERVAL:
+        prendre_snapshot()
+
+
+def _snapshot_avant(cur, instant):
+    cur.execute("SELECT MAX(date_snap) FROM stock_snapshot WHERE date_snap <= %s", (instant,))
+    return cur.fetchone()[0]
+
+
+@cached("stock_snapshot")
+def premier_snapshot():
+    """Date du premier instantané (None s'il n'y en a pas) : début de l'historique."""
+    migrations.ensure_schema()
+    with connection(replica=True) as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT MIN(date_snap) FROM stock_snapshot")
+        return cur.fetchone()[0]
+
+
+def premier_jour():
+    """Premier jour dont le stock de fin de journée est connu (None sans instantané)."""
+    premier = premier_snapshot()
+    return premier.date() if premier else None
+
+
+@cached("produit", "stock_snapshot", "mouvement_stock", "archive_periode")
+def stock_a(instant):
+    """Stock de chaque produit à `instant` : instantané le plus proche + mouvements depuis.
+
+    Le coût est borné par le volume de mouvements d'un intervalle d'instantanés,
+    quelle que soit la longueur du journal ; les mois archivés de l'intervalle
+    sont lus dans leurs fichiers (archive.py). HorsHistorique avant le premier
+    instantané.
+    """
+    migrations.ensure_schema()
+    with connection(replica=True) as conn:
+        cur = conn.cursor()
+        snap = _snapshot_avant(cur, instant)
+        if snap is None:
+            raise HorsHistorique(premier_snapshot() or instant)
+        df = lire(cur, """
+            SELECT p.id_produit, p.code_produit, p.nom_produit,
+                   COALESCE(sn.quantite, 0) + COALESCE(mv.delta, 0) AS quantite
+            FROM produit p
+            LEFT JOIN stock_snapshot sn ON sn.id_produit = p.id_produit AND sn.date_snap = %s
+            LEFT JOIN (
+                SELECT id_produit, SUM(quantite) AS delta
+                FROM mouvement_stock
+                WHERE date_mvt > %s AND date_mvt <= %s
+                GROUP BY id_produit
+            ) mv ON mv.id_produit = p.id_produit
+            ORDER BY p.nom_produit
+        """, (snap, snap, instant))
+    archives = archive.lire("mouvement_stock", snap, instant, ["id_produit", "quantite"],
+                            [("date_mvt", ">", snap), ("date_mvt", "<=", instant)])
+    if not archives.empty:
+        delta = archives.groupby("id_produit")["quantite"].sum()
+        df["quantite"] = df["quantite"].astype("int64") + df["id_produit"].map(delta).fillna(0).astype("int64")
+    return df.drop(columns="id_produit").astype({"quantite": "int64"})
+
+
+@cached("stock_snapshot", "mouvement_stock", "archive_periode")
+def serie_produit(id_produit, debut, fin):
+    """Stock de fin de journée d'un produit, jour par jour, sur [debut, fin].
+
+    HorsHistorique si `debut` précède le jour du premier instantané.
+    """
+    migrations.ensure_schema()
+    premier = premier_snapshot()
+    if premier is None or debut < premier.date():
+        raise HorsHistorique(premier or datetime.now())
+    depart = datetime.combine(debut, datetime.min.time())
+    arrivee = datetime.combine(fin, datetime.max.time())
+    with connection(replica=True) as conn:
+        cur = conn.cursor()
+        # premier jour de l'historique : instantané pris dans la journée, base ramenée à minuit
+        snap = _snapshot_avant(cur, depart) or premier
+        cur.execute("SELECT quantite FROM stock_snapshot WHERE date_snap = %s AND id_produit = %s",
+                    (snap, id_produit))
+        row = cur.fetchone()
+        base = row[0] if row else 0
+        # mouvements entre l'instantané et le début de période, puis par jour sur la période
+        if snap <= depart:
+            cur.execute("""
+                SELECT COALESCE(SUM(quantite), 0) FROM mouvement_stock
+                WHERE id_produit = %s AND date_mvt > %s AND date_mvt < %s
+            """, (id_produit, snap, depart))
+            base += int(cur.fetchone()[0])
+        else:
+            cur.execute("""
+                SELECT COALESCE(SUM(quantite), 0) FROM mouvement_stock
+                WHERE id_produit = %s AND date_mvt >= %s AND date_mvt <= %s
+            """, (id_produit, depart, snap))
+            base -= int(cur.fetchone()[0])
+        cur.execute("""
+            SELECT DATE(date_mvt) AS jour, SUM(quantite)
+            FROM mouvement_stock
+            WHERE id_produit = %s AND date_mvt >= %s AND date_mvt <= %s
+            GROUP BY jour
+        """, (id_produit, depart, arrivee))
+        deltas = dict(cur.fetchall())
+    borne = min(snap, depart)
+    archives = archive.lire("mouvement_stock", borne, arrivee, ["date_mvt", "quantite"],
+                            [("id_produit", "==", id_produit),
+                             ("date_mvt", ">" if snap <= depart else ">=", borne), ("date_mvt", "<=", arrivee)])
+    if not archives.empty:
+        avant = archives["date_mvt"] < depart
+        base += int(archives.loc[avant, "quantite"].sum())
+        if snap > depart:
+            base -= int(archives.loc[archives["date_mvt"] <= snap, "quantite"].sum())
+        for jour, q in archives[~avant].groupby(archives["date_mvt"].dt.date)["quantite"].sum().items():
+            deltas[jour] = int(deltas.get(jour, 0)) + int(q)
+    jours = pd.date_range(debut, fin, freq="D").date
+    serie = pd.Series([int(deltas.get(j, 0)) for j in jours], index=jours).cumsum() + base
+    serie.index.name = "Jour"
+    return serie.rename("Stock")
+
+
+if __name__ == "__main__":
+    # Tâche planifiée (cron) : python stock_history.py
+    print(f"Instantané pris : {prendre_snapshot():%d/%m/%Y %H:%M}", file=sys.stderr)
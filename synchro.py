@@ -0,0 +1,436 @@
+# Synchronisation multi-sites : chaque dépôt travaille sur sa base locale et échange
+# des paquets compressés avec le nœud central
+#
+#   SITE_ID=goma python synchro.py synchroniser --central hote:3307   → les deux sens, en direct
+#   SITE_ID=goma python synchro.py exporter paquets/                  → paquets en attente vers le central
+#   SITE_ID=central python synchro.py importer paquets/*.json.gz      → rejeu (idempotent)
+#   SITE_ID=central python synchro.py exporter paquets/ --vers goma   → catalogue vers un dépôt
+#   python synchro.py etat
+#
+# Règles :
+# - Le stock d'un dépôt n'est jamais copié, seuls ses mouvements remontent. Au central
+#   ils alimentent stock_site (stock par dépôt), jamais le stock propre du central ;
+#   un stock de dépôt qui deviendrait négatif est accepté (le mouvement a eu lieu)
+#   et signalé dans sync_conflit.
+# - Les commandes remontent avec leurs lignes (numéro préfixé du dépôt) et entrent
+#   dans les agrégats du central, sans toucher à son stock : la sortie arrive par
+#   les mouvements du dépôt.
+# - Catalogue : le central fait foi. Un produit créé dans un dépôt est ajouté au
+#   central si son code y est inconnu, ignoré sinon ; les produits du central
+#   redescendent et remplacent la copie locale (sauf le seuil d'alerte, propre au dépôt).
+# - Rejeu idempotent : le récepteur retient, par origine et par flux, la position du
+#   dernier élément appliqué (sync_recu) dans la transaction qui l'applique. Un paquet
+#   déjà appliqué est ignoré, un paquet qui laisserait un trou est refusé.
+import argparse
+import glob
+import gzip
+import json
+import os
+import sys
+from datetime import datetime
+
+import alertes
+import migrations
+import rollups
+from cache import invalidate
+from database import DB_CONFIG, ConnectionPool, connection, transaction
+
+SITE = os.getenv("SITE_ID", "central")
+CENTRAL = os.getenv("SYNC_CENTRAL_ID", "central")
+PAQUET = int(os.getenv("SYNC_PAQUET", "5000"))          # éléments par paquet
+MARGE = int(os.getenv("SYNC_MARGE", "300"))             # s : lignes plus récentes gardées pour plus tard
+FORMAT = 1
+
+FLUX_MONTANTS = ("produit", "mouvement_stock", "commande")      # dépôt → central (produits d'abord)
+FLUX_DESCENDANTS = ("produit",)                                  # central → dépôt
+DEBUT = {"produit": ["", 0], "mouvement_stock": 0, "commande": 0}
+
+
+class SyncError(Exception):
+    """Paquet inapplicable (trou dans la séquence, mauvais destinataire, format inconnu)."""
+
+
+def _marques(n):
+    return ", ".join(["%s"] * n)
+
+
+# -----------------------------------------------------
+# 📤 Extraction (capture des changements)
+# -----------------------------------------------------
+def _limite_sure(cur, table, cle, depuis):
+    """Première clé saisie depuis moins de MARGE s : les lignes suivantes attendent.
+
+    Une transaction encore ouverte peut valider plus tard une clé inférieure
+    à une clé déjà visible ; on suppose qu'aucune ne dure plus de MARGE s.
+    """
+    cur.execute(f"""
+        SELECT MIN({cle}) FROM {table}
+        WHERE {cle} > %s AND saisi_le >= NOW() - INTERVAL %s SECOND
+    """, (depuis, MARGE))
+    return cur.fetchone()[0] or 2**31
+
+
+def _extraire_produit(cur, depuis):
+    maj, pid = depuis
+    cur.execute("""
+        SELECT id_produit, maj, code_produit, nom_produit, forme, dosage, date_peremption, prix_unitaire
+        FROM produit
+        WHERE (maj > %s OR (maj = %s AND id_produit > %s)) AND maj < NOW() - INTERVAL %s SECOND
+        ORDER BY maj, id_produit
+        LIMIT %s
+    """, (maj or "1970-01-02", maj or "1970-01-02", pid, MARGE, PAQUET))
+    return [[pid, str(maj), *reste] for pid, maj, *reste in cur.fetchall()]
+
+
+def _extraire_mouvement_stock(cur, depuis):
+    cur.execute("""
+        SELECT m.id_mvt, p.code_produit, m.date_mvt, m.type_mvt, m.quantite, m.description, l.numero_lot
+        FROM mouvement_stock m
+        JOIN produit p ON p.id_produit = m.id_produit
+        LEFT JOIN lot l ON l.id_lot = m.id_lot
+        WHERE m.id_mvt > %s AND m.id_mvt < %s
+        ORDER BY m.id_mvt
+        LIMIT %s
+    """, (depuis, _limite_sure(cur, "mouvement_stock", "id_mvt", depuis), PAQUET))
+    return [list(ligne) for ligne in cur.fetchall()]
+
+
+def _extraire_commande(cur, depuis):
+    cur.execute("""
+        SELECT c.id_commande, c.code_commande, c.date_commande, c.statut, cl.nom_client
+        FROM commande c JOIN client cl ON cl.id_client = c.id_client
+        WHERE c.id_commande > %s AND c.id_commande < %s AND c.origine IS NULL
+        ORDER BY c.id_commande
+        LIMIT %s
+    """, (depuis, _limite_sure(cur, "commande", "id_commande", depuis), PAQUET))
+    commandes = [list(ligne) + [[]] for ligne in cur.fetchall()]
+    if commandes:
+        par_id = {c[0]: c for c in commandes}
+        cur.execute(f"""
+            SELECT d.id_commande, p.code_produit, d.quantite_dmd, d.quantite_livr
+            FROM commande_detail d JOIN produit p ON p.id_produit = d.id_produit
+            WHERE d.id_commande IN ({_marques(len(par_id))})
+            ORDER BY d.id_detail
+        """, list(par_id))
+        for id_commande, *ligne in cur.fetchall():
+            par_id[id_commande][-1].append(ligne)
+    return commandes
+
+
+EXTRAIRE = {"produit": _extraire_produit, "mouvement_stock": _extraire_mouvement_stock,
+            "commande": _extraire_commande}
+
+
+def _position(flux, ligne):
+    return [ligne[1], ligne[0]] if flux == "produit" else ligne[0]
+
+
+def extraire(conn, flux, depuis, destination, origine=SITE):
+    """Prochain paquet du flux après `depuis`, ou None s'il n'y a rien à envoyer."""
+    lignes = EXTRAIRE[flux](conn.cursor(), depuis)
+    if not lignes:
+        return None
+    return {"format": FORMAT, "origine": origine, "destination": destination, "flux": flux,
+            "depuis": depuis, "jusqua": _position(flux, lignes[-1]), "lignes": lignes}
+
+
+# -----------------------------------------------------
+# 📥 Application chez le récepteur
+# -----------------------------------------------------
+def _conflit(cur, origine, flux, reference, message):
+    cur.execute("""
+        INSERT INTO sync_conflit (origine, flux, reference, message, le) VALUES (%s,%s,%s,%s,%s)
+    """, (origine, flux, str(reference)[:64], message[:255], datetime.now()))
+
+
+def _ids_produits(cur, codes):
+    ids = {}
+    codes = list(set(codes))
+    if not codes:
+        return ids
+    for i in range(0, len(codes), 1000):
+        part = codes[i:i + 1000]
+        cur.execute(f"SELECT code_produit, id_produit FROM produit WHERE code_produit IN ({_marques(len(part))})",
+                    part)
+        ids.update(cur.fetchall())
+    return ids
+
+
+def _appliquer_produit(conn, origine, lignes):
+    cur = conn.cursor()
+    codes = [l[2] for l in lignes]
+    cur.execute(f"SELECT code_produit, id_produit FROM produit WHERE code_produit IN ({_marques(len(codes))}) "
+                "FOR UPDATE", codes)
+    existants = dict(cur.fetchall())
+    nouveaux = [l[2:] for l in lignes if l[2] not in existants]
+    if nouveaux:
+        cur.executemany("""
+            INSERT INTO produit (code_produit, nom_produit, forme, dosage, date_peremption, prix_unitaire)
+            VALUES (%s,%s,%s,%s,%s,%s)
+        """, nouveaux)
+        alertes.recalculer(conn, _ids_produits(cur, [l[0] for l in nouveaux]).values())
+    if origine == CENTRAL:
+        # le central fait foi : sa version remplace la copie locale
+        modifies = [(existants[l[2]], *l[2:]) for l in lignes if l[2] in existants]
+        if modifies:
+            cur.executemany("""
+                INSERT INTO produit (id_produit, code_produit, nom_produit, forme, dosage, date_peremption,
+                                     prix_unitaire)
+                VALUES (%s,%s,%s,%s,%s,%s,%s)
+                ON DUPLICATE KEY UPDATE nom_produit = VALUES(nom_produit), forme = VALUES(forme),
+                    dosage = VALUES(dosage), date_peremption = VALUES(date_peremption),
+                    prix_unitaire = VALUES(prix_unitaire)
+            """, modifies)
+    invalidate(conn, "produit")
+
+
+def _appliquer_mouvement_stock(conn, origine, lignes):
+    cur = conn.cursor()
+    ids = _ids_produits(cur, [l[1] for l in lignes])
+    maintenant = datetime.now()
+    journal, deltas = [], {}
+    for id_mvt, code, date_mvt, type_mvt, qty, desc, numero_lot in lignes:
+        if code not in ids:
+            _conflit(cur, origine, "mouvement_stock", id_mvt, f"Produit {code} inconnu du central : ignoré")
+            continue
+        journal.append((origine, id_mvt, ids[code], date_mvt, type_mvt, qty, desc, numero_lot, maintenant))
+        deltas[ids[code]] = deltas.get(ids[code], 0) + qty
+    if journal:
+        cur.executemany("""
+            INSERT IGNORE INTO mouvement_site (origine, id_origine, id_produit, date_mvt, type_mvt, quantite,
+                                               description, numero_lot, recu_le)
+            VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s)
+        """, journal)
+        cur.executemany("""
+            INSERT INTO stock_site (origine, id_produit, quantite, maj) VALUES (%s,%s,%s,%s)
+            ON DUPLICATE KEY UPDATE quantite = quantite + VALUES(quantite), maj = VALUES(maj)
+        """, [(origine, pid, d, maintenant) for pid, d in deltas.items()])
+        cur.execute(f"""
+            SELECT id_produit, quantite FROM stock_site
+            WHERE origine = %s AND quantite < 0 AND id_produit IN ({_marques(len(deltas))})
+        """, [origine, *deltas])
+        for pid, qty in cur.fetchall():
+            _conflit(cur, origine, "mouvement_stock", f"produit {pid}", f"Stock du dépôt négatif ({qty})")
+        invalidate(conn, "mouvement_site", "stock_site")
+
+
+def _appliquer_commande(conn, origine, lignes):
+    cur = conn.cursor()
+    noms = sorted({l[4] for l in lignes})
+    cur.execute(f"SELECT nom_client, id_client FROM client WHERE nom_client IN ({_marques(len(noms))})", noms)
+    clients = dict(cur.fetchall())
+    for nom in noms:
+        if nom not in clients:
+            cur.execute("INSERT INTO client (nom_client) VALUES (%s)", (nom,))
+            clients[nom] = cur.lastrowid
+    produits = _ids_produits(cur, [d[0] for l in lignes for d in l[5]])
+
+    cur.executemany("""
+        INSERT IGNORE INTO commande (code_commande, date_commande, statut, id_client, origine, id_origine)
+        VALUES (%s,%s,%s,%s,%s,%s)
+    """, [(f"{origine[:9]}/{code}"[:30], jour, statut, clients[nom], origine, id_cmd)
+          for id_cmd, code, jour, statut, nom, _ in lignes])
+    cur.execute(f"SELECT id_origine, id_commande FROM commande WHERE origine = %s AND id_origine IN "
+                f"({_marques(len(lignes))})", [origine, *(l[0] for l in lignes)])
+    ids = dict(cur.fetchall())
+
+    details = []
+    for id_cmd, code, jour, statut, nom, lignes_cmd in lignes:
+        connues = []
+        for code_produit, dmd, livr in lignes_cmd:
+            if code_produit in produits:
+                details.append((ids[id_cmd], produits[code_produit], dmd, livr))
+                connues.append((produits[code_produit], dmd))
+            else:
+                _conflit(cur, origine, "commande", code, f"Produit {code_produit} inconnu du central : ligne ignorée")
+        rollups.enregistrer(conn, datetime.strptime(str(jour)[:10], "%Y-%m-%d").date(), clients[nom], connues)
+    if details:
+        cur.executemany("""
+            INSERT INTO commande_detail (id_commande, id_produit, quantite_dmd, quantite_livr)
+            VALUES (%s,%s,%s,%s)
+        """, details)
+    invalidate(conn, "commande", "commande_detail", "client")
+
+
+APPLIQUER = {"produit": _appliquer_produit, "mouvement_stock": _appliquer_mouvement_stock,
+             "commande": _appliquer_commande}
+
+
+def appliquer(conn, paquet, noeud=None):
+    """Rejoue un paquet dans la transaction `conn` ; retourne le nombre d'éléments appliqués.
+
+    `noeud` : nœud récepteur, ce site par défaut (le central en connexion directe).
+    """
+    noeud = noeud or SITE
+    if paquet.get("format") != FORMAT or paquet.get("flux") not in APPLIQUER:
+        raise SyncError(f"Paquet illisible (format {paquet.get('format')}, flux {paquet.get('flux')})")
+    if paquet["destination"] != noeud:
+        raise SyncError(f"Paquet destiné à {paquet['destination']}, ce nœud est {noeud}")
+    origine, flux = paquet["origine"], paquet["flux"]
+    cur = conn.cursor()
+    cur.execute("SELECT position FROM sync_recu WHERE origine = %s AND flux = %s FOR UPDATE", (origine, flux))
+    ligne = cur.fetchone()
+    position = json.loads(ligne[0]) if ligne else DEBUT[flux]
+    if paquet["jusqua"] <= position:
+        return 0                                    # déjà appliqué
+    if paquet["depuis"] > position:
+        raise SyncError(f"Paquet manquant : {flux} de {origine} reçu à partir de {paquet['depuis']}, "
+                        f"appliqué jusqu'à {position}")
+    lignes = [l for l in paquet["lignes"] if _position(flux, l) > position]
+    if lignes:
+        APPLIQUER[flux](conn, origine, lignes)
+    cur.execute("""
+        INSERT INTO sync_recu (origine, flux, position, maj) VALUES (%s,%s,%s,%s)
+        ON DUPLICATE KEY UPDATE position = VALUES(position), maj = VALUES(maj)
+    """, (origine, flux, json.dumps(paquet["jusqua"]), datetime.now()))
+    return len(lignes)
+
+
+# -----------------------------------------------------
+# 🔁 Positions d'envoi
+# -----------------------------------------------------
+def position_envoyee(conn, destination, flux):
+    cur = conn.cursor()
+    cur.execute("SELECT position FROM sync_envoye WHERE destination = %s AND flux = %s FOR UPDATE",
+                (destination, flux))
+    ligne = cur.fetchone()
+    return json.loads(ligne[0]) if ligne else DEBUT[flux]
+
+
+def noter_envoi(conn, destination, flux, position):
+    conn.cursor().execute("""
+        INSERT INTO sync_envoye (destination, flux, position, maj) VALUES (%s,%s,%s,%s)
+        ON DUPLICATE KEY UPDATE position = VALUES(position), maj = VALUES(maj)
+    """, (destination, flux, json.dumps(position), datetime.now()))
+
+
+# -----------------------------------------------------
+# 🚚 Transports : fichiers .json.gz ou connexion directe au central
+# -----------------------------------------------------
+def exporter(dossier, destination):
+    """Écrit les paquets en attente pour `destination` ; retourne les fichiers créés.
+
+    La position d'envoi avance une fois le fichier écrit : un fichier perdu se
+    renvoie avec --reprendre (le récepteur ignore ce qu'il a déjà appliqué).
+    """
+    os.makedirs(dossier, exist_ok=True)
+    fichiers = []
+    for flux in FLUX_DESCENDANTS if SITE == CENTRAL else FLUX_MONTANTS:
+        while True:
+            with transaction() as conn:
+                paquet = extraire(conn, flux, position_envoyee(conn, destination, flux), destination)
+                if paquet is None:
+                    break
+                nom = os.path.join(dossier, f"{datetime.now():%Y%m%d%H%M%S%f}_{SITE}_{destination}_{flux}.json.gz")
+                with gzip.open(f"{nom}.tmp", "wt", encoding="utf-8") as f:
+                    json.dump(paquet, f, ensure_ascii=False, default=str)
+                os.replace(f"{nom}.tmp", nom)
+                noter_envoi(conn, destination, flux, paquet["jusqua"])
+            fichiers.append(nom)
+    return fichiers
+
+
+def importer(fichiers, log=print):
+    """Rejoue des fichiers de paquets, dans l'ordre de leur production (nom horodaté)."""
+    total = 0
+    for nom in sorted(fichiers, key=os.path.basename):
+        with gzip.open(nom, "rt", encoding="utf-8") as f:
+            paquet = json.load(f)
+        with transaction() as conn:
+            n = appliquer(conn, paquet)
+        log(f"  {os.path.basename(nom)} : {n} élément(s) appliqué(s)")
+        total += n
+    return total
+
+
+def synchroniser(central, log=print):
+    """Dépôt ↔ central en direct, paquet par paquet (protocole MySQL compressé).
+
+    Chaque paquet est appliqué chez le récepteur avant que l'émetteur n'avance
+    sa position : une coupure réseau entre les deux ne provoque qu'un renvoi,
+    ignoré à l'arrivée.
+    """
+    if SITE == CENTRAL:
+        raise SyncError("synchroniser se lance depuis un dépôt (SITE_ID), pas depuis le central")
+    host, _, port = central.partition(":")
+    pool = ConnectionPool({**DB_CONFIG, "host": host, "port": int(port or DB_CONFIG["port"]), "compress": True},
+                          size=1)
+    try:
+        for flux in FLUX_MONTANTS:
+            while True:
+                with transaction() as local:
+                    paquet = extraire(local, flux, position_envoyee(local, CENTRAL, flux), CENTRAL)
+                    if paquet is None:
+                        break
+                    with transaction(pool) as conn:
+                        n = appliquer(conn, paquet, CENTRAL)
+                    noter_envoi(local, CENTRAL, flux, paquet["jusqua"])
+                log(f"  → {flux} : {n} élément(s)")
+        for flux in FLUX_DESCENDANTS:
+            while True:
+                with transaction(pool) as conn:
+                    paquet = extraire(conn, flux, position_envoyee(conn, SITE, flux), SITE, origine=CENTRAL)
+                    if paquet is None:
+                        break
+                    with transaction() as local:
+                        n = appliquer(local, paquet)
+                    noter_envoi(conn, SITE, flux, paquet["jusqua"])
+                log(f"  ← {flux} : {n} élément(s)")
+    finally:
+        pool.close_all()
+
+
+def etat(conn):
+    cur = conn.cursor()
+    cur.execute("SELECT 'envoyé à', destination, flux, position, maj FROM sync_envoye "
+                "UNION ALL SELECT 'reçu de', origine, flux, position, maj FROM sync_recu ORDER BY 1, 2, 3")
+    lignes = cur.fetchall()
+    cur.execute("SELECT COUNT(*) FROM sync_conflit")
+    return lignes, cur.fetchone()[0]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=f"Synchronisation multi-sites (ce nœud : {SITE}).")
+    sous = parser.add_subparsers(dest="commande", required=True)
+    p = sous.add_parser("synchroniser", help="échange direct avec le central")
+    p.add_argument("--central", default=os.getenv("SYNC_CENTRAL", ""), help="hôte[:port] de la base centrale")
+    p = sous.add_parser("exporter", help="écrit les paquets en attente (.json.gz)")
+    p.add_argument("dossier")
+    p.add_argument("--vers", default=CENTRAL, help="nœud destinataire (depuis le central : un dépôt)")
+    p.add_argument("--reprendre", action="store_true", help="renvoie tout depuis le début")
+    p = sous.add_parser("importer", help="rejoue des fichiers de paquets")
+    p.add_argument("fichiers", nargs="+")
+    sous.add_parser("etat", help="positions d'échange et conflits")
+    args = parser.parse_args(argv)
+
+    migrations.ensure_schema()
+    try:
+        if args.commande == "synchroniser":
+            if not args.central:
+                parser.error("--central (ou SYNC_CENTRAL) est requis")
+            synchroniser(args.central)
+        elif args.commande == "exporter":
+            if args.vers == SITE:
+                parser.error("--vers : indiquer un autre nœud que celui-ci")
+            if args.reprendre:
+                with transaction() as conn:
+                    conn.cursor().execute("DELETE FROM sync_envoye WHERE destination = %s", (args.vers,))
+            fichiers = exporter(args.dossier, args.vers)
+            print(f"{len(fichiers)} paquet(s) écrit(s) dans {args.dossier}")
+        elif args.commande == "importer":
+            fichiers = [f for motif in args.fichiers for f in glob.glob(motif)]
+            print(f"{importer(fichiers)} élément(s) appliqué(s)")
+        else:
+            with connection() as conn:
+                lignes, conflits = etat(conn)
+            for sens, noeud, flux, position, maj in lignes:
+                print(f"{sens:<9} {noeud:<12} {flux:<16} {position:<36} {maj}")
+            print(f"{conflits} conflit(s) enregistré(s) (table sync_conflit)")
+    except SyncError as e:
+        print(f"Erreur : {e}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,247 @@
+# Rapports lourds en arrière-plan : file de tâches, résultats sur disque, demandes identiques fusionnées
+import hashlib
+import json
+import logging
+import os
+import pickle
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as DelaiDepasse
+from functools import lru_cache
+
+import streamlit as st
+
+import profiling
+from cache import versions
+from database import versions_requises
+
+# -----------------------------------------------------
+# ⚙️ Paramètres
+# -----------------------------------------------------
+WORKERS = int(os.getenv("RAPPORTS_WORKERS", "2"))            # rapports calculés en parallèle
+DOSSIER = os.getenv("RAPPORTS_DIR", "logs/rapports")
+RETENTION = float(os.getenv("RAPPORTS_RETENTION", "86400"))  # s avant suppression d'un résultat
+ATTENTE = float(os.getenv("RAPPORTS_ATTENTE", "1"))          # s d'attente dans le rerun avant de passer au suivi
+SUIVI = 2               # s entre deux relectures de l'état par la page
+ABANDON = 3600          # s : une tâche « en cours » plus ancienne est relancée (processus arrêté)
+_PURGE_INTERVALLE = 600
+
+# threads : les rapports attendent MySQL et l'écriture disque, pas le CPU
+_pool = ThreadPoolExecutor(max_workers=WORKERS, thread_name_prefix="rapport")
+_lock = threading.Lock()
+_taches = {}            # clé -> Future des tâches lancées par ce processus
+_etat = {"purge": 0.0}
+_log = logging.getLogger("cadmeko.taches")
+
+STATUTS = {"en_attente": "en file d'attente", "en_cours": "en cours", "termine": "terminé", "erreur": "en erreur"}
+
+
+# -----------------------------------------------------
+# 🗂️ Fichiers : <clé>.json (état) et <clé>.<ext> (résultat)
+# -----------------------------------------------------
+def _chemin(nom):
+    return os.path.join(DOSSIER, nom)
+
+
+def _ecrire_etat(cle, meta):
+    os.makedirs(DOSSIER, exist_ok=True)
+    tmp = _chemin(f"{cle}.json.{os.getpid()}.{threading.get_ident()}")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False, default=str)
+    os.replace(tmp, _chemin(f"{cle}.json"))
+
+
+def _lire_etat(cle):
+    try:
+        with open(_chemin(f"{cle}.json"), encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def _toucher(cle, meta):
+    """Résultat utilisé : sa purge est repoussée de RETENTION (date de modification)."""
+    for nom in (f"{cle}.json", meta.get("fichier")):
+        if nom:
+            try:
+                os.utime(_chemin(nom))
+            except OSError:
+                pass
+
+
+def _purger():
+    """Supprime les résultats ni produits ni utilisés depuis RETENTION secondes (au plus toutes les 10 min)."""
+    maintenant = time.time()
+    if maintenant - _etat["purge"] < _PURGE_INTERVALLE or not os.path.isdir(DOSSIER):
+        return
+    _etat["purge"] = maintenant
+    with _lock:
+        actives = set(_taches)
+    for entree in os.scandir(DOSSIER):
+        if entree.name.split(".")[0] not in actives and maintenant - entree.stat().st_mtime > RETENTION:
+            try:
+                os.remove(entree.path)
+            except OSError:
+                pass
+
+
+# -----------------------------------------------------
+# 🚚 Soumission et exécution
+# -----------------------------------------------------
+def cle_tache(nom, args, tables, ext):
+    """Paramètres + versions des tables lues : un résultat sur disque reste
+    valable tant que ces tables n'ont pas été modifiées."""
+    brut = json.dumps([nom, ext, list(args), list(zip(tables, versions(tables)))], default=str)
+    return hashlib.sha1(brut.encode()).hexdigest()
+
+
+def _executer(cle, nom, ecrire, args, exigences, ext):
+    profiling.debut_page(f"tâche {nom}")            # requêtes attribuées à la tâche (page ⏱️ Performance)
+    meta = _lire_etat(cle) or {}
+    meta.update(statut="en_cours", debut=time.time())
+    _ecrire_etat(cle, meta)
+    fichier = f"{cle}.{ext}"
+    tmp = _chemin(f"{fichier}.{os.getpid()}.tmp")
+    try:
+        with versions_requises(exigences):         # réplique éventuelle au moins à jour de la clé
+            infos = ecrire(tmp, *args) or {}
+        os.replace(tmp, _chemin(fichier))
+        meta.update(infos, statut="termine", fichier=fichier)
+    except Exception as e:
+        _log.exception("Tâche %s en erreur", nom)
+        meta.update(statut="erreur", erreur=f"{type(e).__name__}: {e}")
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    profiling.fin_page()
+    meta.update(fin=time.time(), duree_s=round(time.time() - meta["debut"], 2))
+    _ecrire_etat(cle, meta)
+    with _lock:
+        _taches.pop(cle, None)
+
+
+def soumettre_fichier(nom, ecrire, args=(), tables=(), ext="bin"):
+    """Met en file `ecrire(chemin, *args)`, qui produit le fichier résultat et
+    peut retourner des informations (dict) conservées avec l'état.
+
+    `nom` et `args` identifient la demande : une demande identique déjà en
+    file ou en cours (dans ce processus ou un autre) est rejointe, un résultat
+    déjà calculé sur les mêmes versions de `tables` est réutilisé tel quel ;
+    une tâche en erreur n'est relancée qu'après relancer(cle).
+    Retourne la clé de la tâche.
+    """
+    _purger()
+    cle = cle_tache(nom, args, tables, ext)
+    with _lock:
+        fut = _taches.get(cle)
+        if fut is not None and not fut.done():
+            return cle
+        meta = _lire_etat(cle)
+        if meta is not None:
+            if meta["statut"] == "termine" and os.path.exists(_chemin(meta["fichier"])):
+                _toucher(cle, meta)
+                return cle
+            if meta["statut"] == "erreur":
+                return cle
+            if meta["statut"] in ("en_attente", "en_cours") and time.time() - meta["soumis"] < ABANDON:
+                return cle
+        _ecrire_etat(cle, {"nom": nom, "statut": "en_attente", "soumis": time.time(), "pid": os.getpid()})
+        exigences = dict(zip(tables, versions(tables)))
+        _taches[cle] = _pool.submit(_executer, cle, nom, ecrire, args, exigences, ext)
+    return cle
+
+
+def _ecrire_objet(fonction):
+    def ecrire(chemin, *args):
+        resultat = fonction(*args)
+        with open(chemin, "wb") as f:
+            pickle.dump(resultat, f, protocol=pickle.HIGHEST_PROTOCOL)
+    return ecrire
+
+
+def soumettre(nom, fonction, args=(), tables=()):
+    """Comme soumettre_fichier, pour une fonction qui retourne un objet
+    (DataFrame, dict de DataFrames…) : il est conservé par pickle."""
+    return soumettre_fichier(nom, _ecrire_objet(fonction), args, tables, ext="pkl")
+
+
+# -----------------------------------------------------
+# 📬 Lecture de l'état et des résultats
+# -----------------------------------------------------
+def etat(cle, delai=0):
+    """État de la tâche ; attend jusqu'à `delai` s si elle tourne dans ce processus."""
+    if delai:
+        with _lock:
+            fut = _taches.get(cle)
+        if fut is not None:
+            try:
+                fut.result(timeout=delai)
+            except DelaiDepasse:
+                pass
+    return _lire_etat(cle) or {"statut": "erreur", "erreur": "tâche inconnue ou purgée"}
+
+
+def fichier(cle):
+    meta = _lire_etat(cle)
+    return _chemin(meta["fichier"]) if meta and meta.get("fichier") else None
+
+
+@lru_cache(maxsize=16)
+def _charger(chemin):
+    with open(chemin, "rb") as f:
+        return pickle.load(f)
+
+
+def resultat(cle):
+    """Objet produit par une tâche `soumettre` terminée (gardé en mémoire : la clé ne change pas de contenu).
+
+    Fichier purgé (par un autre processus) depuis attendre() : la tâche est
+    oubliée et la page relancée, sa soumission la recalcule.
+    """
+    chemin = fichier(cle)
+    try:
+        if chemin is not None:
+            return _charger(chemin)
+    except FileNotFoundError:
+        pass
+    relancer(cle)
+    st.rerun()
+
+
+def relancer(cle):
+    """Oublie une tâche en erreur : la prochaine soumission identique la relance."""
+    try:
+        os.remove(_chemin(f"{cle}.json"))
+    except FileNotFoundError:
+        pass
+
+
+def _afficher_attente(cle, message):
+    meta = etat(cle)
+    if meta["statut"] in ("termine", "erreur"):
+        st.rerun()
+    ecoule = int(time.time() - meta.get("soumis", time.time()))
+    st.info(f"⏳ {message} ({STATUTS[meta['statut']]}, {ecoule} s)")
+
+
+if hasattr(st, "fragment"):
+    # seul ce bloc est réexécuté toutes les SUIVI s, la page entière une fois la tâche finie
+    _afficher_attente = st.fragment(run_every=SUIVI)(_afficher_attente)
+
+
+def attendre(cle, message="Rapport en préparation…"):
+    """Retourne l'état si la tâche est terminée ; sinon affiche son avancement
+    (relu toutes les SUIVI s) ou son erreur, et retourne None."""
+    meta = etat(cle, delai=ATTENTE)
+    if meta["statut"] == "termine":
+        _toucher(cle, meta)
+        return meta
+    if meta["statut"] == "erreur":
+        st.error(f"Échec de la préparation : {meta.get('erreur')}")
+        if st.button("🔁 Réessayer", key=f"relancer_{cle}"):
+            relancer(cle)
+            st.rerun()
+        return None
+    _afficher_attente(cle, message)
+    if not hasattr(st, "fragment"):
+        st.button("🔄 Actualiser", key=f"actualiser_{cle}")
+    return None
@@ -0,0 +1,62 @@
+# Dates des mouvements reçus par l'API : fuseaux horaires ramenés à l'heure locale
+#
+#   CADMEKO_TEST_DB=1 DB_NAME=cadmeko_test python -m pytest tests
+import os
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+pytest.importorskip("mysql.connector")
+pytest.importorskip("pandas")
+pytest.importorskip("streamlit")
+
+import api  # noqa: E402
+
+
+def _locale(instant):
+    return instant.astimezone().replace(tzinfo=None)
+
+
+@pytest.mark.parametrize("valeur, attendue", [
+    ("2025-03-01T10:00:00", datetime(2025, 3, 1, 10)),
+    ("2025-03-01", datetime(2025, 3, 1)),
+    ("2025-03-01T10:00:00Z", _locale(datetime(2025, 3, 1, 10, tzinfo=timezone.utc))),
+    ("2025-03-01T10:00:00+01:00", _locale(datetime(2025, 3, 1, 9, tzinfo=timezone.utc))),
+])
+def test_horodatage_iso(valeur, attendue):
+    lue = api._horodatage(valeur)
+    assert lue.tzinfo is None
+    assert lue.to_pydatetime() == attendue
+
+
+@pytest.mark.parametrize("valeur", ["01/03/2025", "hier", "", 20250301, None])
+def test_horodatage_invalide(valeur):
+    assert api._horodatage(valeur) is None
+
+
+@pytest.mark.skipif(os.getenv("CADMEKO_TEST_DB") != "1", reason="CADMEKO_TEST_DB=1 et une base de test requis")
+def test_mouvement_date_avec_fuseau():
+    import migrations
+    from database import connection, transaction
+
+    migrations.ensure_schema()
+    code = f"T{uuid.uuid4().hex[:12]}"
+    with transaction() as conn:
+        conn.cursor().execute("INSERT INTO produit (code_produit, nom_produit) VALUES (%s, %s)",
+                              (code, f"Test {code}"))
+    instant = datetime.now(timezone.utc).replace(microsecond=0) - timedelta(hours=1)
+
+    resultat = api.post_mouvements({"mouvements": [{
+        "code_produit": code, "type_mvt": "Entrée", "quantite": 4, "description": "test",
+        "date_mvt": instant.isoformat().replace("+00:00", "Z"),
+    }]})
+
+    assert resultat == {"enregistres": 1}
+    with connection() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT m.date_mvt FROM mouvement_stock m JOIN produit p ON p.id_produit = m.id_produit
+            WHERE p.code_produit = %s
+        """, (code,))
+        assert cur.fetchall() == [(_locale(instant),)]
@@ -0,0 +1,60 @@
+# Report des mouvements saisis après coup dans les instantanés (base MySQL jetable requise)
+#
+#   CADMEKO_TEST_DB=1 DB_NAME=cadmeko_test python -m pytest tests
+import os
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+
+pytest.importorskip("mysql.connector")
+pytest.importorskip("pandas")
+pytest.importorskip("streamlit")
+if os.getenv("CADMEKO_TEST_DB") != "1":
+    pytest.skip("CADMEKO_TEST_DB=1 et une base de test requis", allow_module_level=True)
+
+import migrations  # noqa: E402
+import stock_history  # noqa: E402
+from database import connection, transaction  # noqa: E402
+from inventory import appliquer_mouvements  # noqa: E402
+
+
+def _produit():
+    code = f"T{uuid.uuid4().hex[:12]}"
+    with transaction() as conn:
+        cur = conn.cursor()
+        cur.execute("INSERT INTO produit (code_produit, nom_produit) VALUES (%s, %s)", (code, f"Test {code}"))
+        return cur.lastrowid, code
+
+
+def _entrees(pid, *quantites_dates):
+    with transaction() as conn:
+        appliquer_mouvements(conn, [{"ligne": i + 2, "id_produit": pid, "type_mvt": "Entrée", "quantite": q,
+                                     "description": "test", "date_mvt": d}
+                                    for i, (q, d) in enumerate(quantites_dates)])
+
+
+def _snapshot(instant, pid):
+    with connection() as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT quantite FROM stock_snapshot WHERE date_snap = %s AND id_produit = %s", (instant, pid))
+        row = cur.fetchone()
+    return row[0] if row else None
+
+
+def test_mouvements_anterieurs_reportes_dans_les_instantanes():
+    migrations.ensure_schema()
+    pid, code = _produit()
+    maintenant = datetime.now().replace(microsecond=0)
+    _entrees(pid, (10, maintenant - timedelta(hours=2)))
+    premier = stock_history.prendre_snapshot(maintenant - timedelta(seconds=60))
+    second = stock_history.prendre_snapshot(maintenant - timedelta(seconds=30))
+
+    # saisis après les deux instantanés : deux datés entre eux (même date, un seul report), un avant le premier
+    _entrees(pid, (5, premier + timedelta(seconds=10)), (3, premier + timedelta(seconds=10)),
+             (2, premier - timedelta(hours=1)))
+
+    assert _snapshot(premier, pid) == 12
+    assert _snapshot(second, pid) == 20
+    stock = stock_history.stock_a(maintenant + timedelta(seconds=1)).set_index("code_produit")["quantite"]
+    assert stock[code] == 20
@@ -1 +1,14 @@
 # Fonctions diverses (ex: format, export Excel) 
+import pathlib
+
+import streamlit as st
+
+
+@st.cache_resource
+def _styles():
+    return pathlib.Path("assets/styles.css").read_text()
+
+
+def inject_styles():
+    """Feuille de style commune, lue une seule fois par processus."""
+    st.markdown(f"<style>{_styles()}</style>", unsafe_allow_html=True)
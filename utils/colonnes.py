@@ -0,0 +1,84 @@
+# Résultats SQL en colonnes : DataFrames construits par paquets, types compacts, formatage vectorisé
+import pandas as pd
+from mysql.connector import FieldType
+from pandas.api.types import union_categoricals
+
+from database import connection
+
+CHUNK_SIZE = 5_000
+# peu de valeurs distinctes : une catégorie stocke chaque libellé une seule fois
+CATEGORIES = ("forme", "dosage", "statut", "type_mvt", "role")
+_DECIMAUX = {FieldType.DECIMAL, FieldType.NEWDECIMAL}
+_MILLIERS = r"\B(?=(\d{3})+(?!\d))"
+
+
+def _paquet(description, rows, categories, bruts):
+    """Un paquet de lignes (tuples) → DataFrame, colonne par colonne."""
+    donnees = {}
+    for (nom, type_code, *_), col in zip(description, zip(*rows)):
+        if nom in bruts:
+            donnees[nom] = pd.Series(col, dtype=object)
+        elif nom in categories:
+            donnees[nom] = pd.Categorical(col)
+        elif type_code in _DECIMAUX:
+            donnees[nom] = pd.to_numeric(pd.Series(col, dtype=object), errors="coerce").astype("float64")
+        else:
+            donnees[nom] = pd.Series(col)
+    return pd.DataFrame(donnees)
+
+
+def morceaux(cur, chunk_size=CHUNK_SIZE, categories=CATEGORIES, bruts=()):
+    """DataFrames successifs du résultat de la dernière requête de `cur` (curseur tuple, non dictionnaire).
+
+    Les tuples d'un paquet sont libérés dès sa conversion : la mémoire de
+    pointe est celle d'un paquet, plus le résultat en colonnes.
+    `bruts` : colonnes laissées en objets Python (valeurs renvoyées en
+    paramètre SQL, comme les clés de pagination).
+    """
+    while True:
+        rows = cur.fetchmany(chunk_size)
+        if not rows:
+            return
+        yield _paquet(cur.description, rows, categories, bruts)
+
+
+def assembler(parts, description=None):
+    """Concatène des paquets ; les catégories sont fusionnées au lieu de repasser en objets."""
+    if not parts:
+        return pd.DataFrame({d[0]: pd.Series(dtype=object) for d in description or ()})
+    if len(parts) == 1:
+        return parts[0]
+    colonnes = {}
+    for nom in parts[0].columns:
+        series = [p[nom] for p in parts]
+        if isinstance(series[0].dtype, pd.CategoricalDtype):
+            colonnes[nom] = pd.Series(union_categoricals(series, ignore_order=True))
+        else:
+            colonnes[nom] = pd.concat(series, ignore_index=True)
+    return pd.DataFrame(colonnes)
+
+
+def lire(cur, sql, params=(), **options):
+    """Exécute `sql` sur `cur` et retourne le résultat en DataFrame compact (options : voir morceaux)."""
+    cur.execute(sql, params)
+    return assembler(list(morceaux(cur, **options)), cur.description)
+
+
+def requete(sql, params=(), replica=True, **options):
+    """lire() sur une connexion du pool (réplique par défaut)."""
+    with connection(replica=replica) as conn:
+        return lire(conn.cursor(), sql, params, **options)
+
+
+# -----------------------------------------------------
+# 🖋️ Formatage d'affichage, sur la colonne entière
+# -----------------------------------------------------
+def montants(serie, unite="CDF"):
+    """12500 → « 12 500 CDF » ; vide si la valeur manque."""
+    entiers = pd.to_numeric(serie, errors="coerce").round().astype("Int64").astype("string")
+    return (entiers.str.replace(_MILLIERS, " ", regex=True) + f" {unite}").fillna("")
+
+
+def dates(serie, fmt="%d/%m/%Y"):
+    """Dates ou horodatages → texte ; vide si la valeur manque."""
+    return pd.to_datetime(serie).dt.strftime(fmt).fillna("")
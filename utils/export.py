@@ -0,0 +1,205 @@
+# Exports en flux (CSV, XLSX, Parquet) depuis un curseur MySQL non bufferisé
+import csv
+import functools
+import io
+import os
+import tempfile
+
+import pandas as pd
+import streamlit as st
+
+import taches
+from database import connection
+from utils.colonnes import morceaux
+
+CHUNK_SIZE = 5_000
+SPOOL_MAX = 8 * 1024 * 1024         # au-delà, le fichier d'export passe sur disque
+
+FORMATS = {
+    "CSV": ("csv", "text/csv"),
+    "XLSX": ("xlsx", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"),
+    "Parquet": ("parquet", "application/vnd.apache.parquet"),
+}
+
+
+def formats_disponibles():
+    """Formats dont la dépendance optionnelle est installée."""
+    dispo = ["CSV"]
+    try:
+        import openpyxl  # noqa: F401
+        dispo.append("XLSX")
+    except ImportError:
+        pass
+    try:
+        import pyarrow  # noqa: F401
+        dispo.append("Parquet")
+    except ImportError:
+        pass
+    return dispo
+
+
+# -----------------------------------------------------
+# ✍️ Écrivains par format : open / write(chunk) / close
+# -----------------------------------------------------
+class _CsvWriter:
+    def __init__(self, out, columns):
+        self._text = io.TextIOWrapper(out, encoding="utf-8", newline="", write_through=True)
+        self._csv = csv.writer(self._text)
+        self._csv.writerow(columns)
+
+    def write(self, df):
+        self._csv.writerows(df.itertuples(index=False, name=None))
+
+    def close(self):
+        self._text.flush()
+        self._text.detach()
+
+
+class _XlsxWriter:
+    def __init__(self, out, columns):
+        from openpyxl import Workbook
+        self._out = out
+        self._wb = Workbook(write_only=True)     # lignes écrites au fil de l'eau
+        self._ws = self._wb.create_sheet()
+        self._ws.append(list(columns))
+
+    def write(self, df):
+        for row in df.itertuples(index=False, name=None):
+            self._ws.append(list(row))
+
+    def close(self):
+        self._wb.save(self._out)
+
+
+class _ParquetWriter:
+    def __init__(self, out, columns):
+        self._out = out
+        self._writer = None
+
+    def write(self, df):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        if self._writer is None:
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            # catégories : index 32 bits, le nombre de libellés peut croître d'un paquet à l'autre
+            schema = pa.schema([pa.field(f.name, pa.dictionary(pa.int32(), f.type.value_type))
+                                if pa.types.is_dictionary(f.type) else f for f in table.schema],
+                               metadata=table.schema.metadata)
+            table = table.cast(schema)
+            self._writer = pq.ParquetWriter(self._out, schema, compression="zstd")
+        else:
+            table = pa.Table.from_pandas(df, schema=self._writer.schema, preserve_index=False)
+        self._writer.write_table(table)         # un row group par chunk
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+
+
+_WRITERS = {"CSV": _CsvWriter, "XLSX": _XlsxWriter, "Parquet": _ParquetWriter}
+
+
+def export_query(sql, params=(), fmt="CSV", formatter=None, max_rows=None, chunk_size=CHUNK_SIZE, out=None,
+                 complement=None):
+    """Exécute sql et écrit le résultat par paquets dans `out` (par défaut un
+    fichier temporaire).
+
+    Les lignes sont lues par paquets (utils.colonnes) sur un curseur non
+    bufferisé : la mémoire reste bornée à un paquet, quelle que soit la
+    taille du résultat.
+    `sql` ne doit pas contenir de LIMIT si max_rows est fourni.
+    `complement(*params)` : DataFrames (mêmes colonnes que sql) écrits à la
+    suite, par exemple les lignes archivées (archive.py).
+    Retourne (fichier positionné au début, nb de lignes, tronqué ?).
+    """
+    if max_rows is not None:
+        sql = f"{sql}\nLIMIT {int(max_rows) + 1}"
+    if out is None:
+        out = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX)
+    n, truncated, writer = 0, False, None
+
+    def ecrire(chunk):
+        nonlocal n, truncated, writer
+        if max_rows is not None and n + len(chunk) > max_rows:
+            chunk = chunk.iloc[:max_rows - n]
+            truncated = True
+        if chunk.empty:
+            return not truncated
+        if formatter is not None:
+            chunk = formatter(chunk)
+        if writer is None:
+            writer = _WRITERS[fmt](out, list(chunk.columns))
+        writer.write(chunk)
+        n += len(chunk)
+        return not truncated
+
+    with connection(replica=True) as conn:
+        cur = conn.cursor()
+        cur.execute(sql, params)
+        columns = [d[0] for d in cur.description]
+        for chunk in morceaux(cur, chunk_size):
+            if not ecrire(chunk):
+                break
+    if complement is not None and not truncated:
+        for chunk in complement(*params):
+            if not ecrire(chunk[columns]):
+                break
+    if writer is None:                          # résultat vide : en-têtes seuls
+        chunk = pd.DataFrame(columns=columns)
+        if formatter is not None:
+            chunk = formatter(chunk)
+        writer = _WRITERS[fmt](out, list(chunk.columns))
+        if fmt == "Parquet":
+            writer.write(chunk)
+    writer.close()
+    out.seek(0)
+    return out, n, truncated
+
+
+def _ecrire_export(chemin, sql, params, fmt, max_rows, formatter=None, complement=None):
+    with open(chemin, "wb") as out:
+        _, n, truncated = export_query(sql, params, fmt, formatter=formatter, max_rows=max_rows, out=out,
+                                       complement=complement)
+    return {"lignes": n, "tronque": truncated}
+
+
+def _contenu(chemin):
+    with open(chemin, "rb") as f:
+        return f.read()
+
+
+def export_widget(key, sql, params=(), filename="export", formatter=None, max_rows=None, tables=(),
+                  complement=None):
+    """Sélecteur de format + bouton : l'export, produit sur demande, est
+    préparé en arrière-plan (taches.py) puis proposé au téléchargement.
+
+    `tables` : tables lues par `sql` (et `complement`) ; un export identique
+    sur les mêmes données est servi depuis le fichier déjà produit.
+    """
+    col_fmt, col_btn = st.columns([1, 2])
+    fmt = col_fmt.selectbox("Format", formats_disponibles(), key=f"{key}_fmt", label_visibility="collapsed")
+    demande = (sql, params, fmt, max_rows)
+    if col_btn.button("📦 Préparer l'export", key=f"{key}_prep", use_container_width=True):
+        # `key` désigne aussi formatter et complement : ils restent hors de la clé de la tâche
+        ecrire = functools.partial(_ecrire_export, formatter=formatter, complement=complement)
+        cle = taches.soumettre_fichier(f"export:{key}", ecrire, demande, tables, ext=FORMATS[fmt][0])
+        st.session_state[f"{key}_tache"] = (demande, cle)
+    demande_suivie, cle = st.session_state.get(f"{key}_tache", (None, None))
+    if demande_suivie != demande:               # filtres ou format changés depuis
+        return
+    meta = taches.attendre(cle, "Export en cours…")
+    if meta is None:
+        return
+    if meta["tronque"]:
+        st.warning(f"Export limité aux {max_rows:,} premières lignes : réduisez la période.".replace(",", " "))
+    ext = meta["fichier"].rsplit(".", 1)[1]
+    fmt_fichier, mime = next((f, m) for f, (e, m) in FORMATS.items() if e == ext)
+    chemin = taches.fichier(cle)
+    if not os.path.exists(chemin):              # purgé depuis attendre() : à préparer de nouveau
+        taches.relancer(cle)
+        del st.session_state[f"{key}_tache"]
+        st.rerun()
+    # téléchargement différé : le fichier n'est lu qu'au clic, pas à chaque rerun
+    st.download_button(f"📥 Télécharger ({fmt_fichier}, {meta['lignes']} lignes)",
+                       data=functools.partial(_contenu, chemin), file_name=f"{filename}.{ext}", mime=mime,
+                       key=f"{key}_dl", use_container_width=True)